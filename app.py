@@ -10,104 +10,388 @@ import tempfile
 import uuid
 import shutil
 import time
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, send_file, abort
+import hashlib
+import gzip
+import queue
+import threading
+from datetime import datetime
+from flask import Flask, request, jsonify, render_template, send_file, abort, Response, stream_with_context
 from werkzeug.utils import secure_filename
 import csv
 import io
-from book_indexer_web_fixed import book_indexer_web as book_indexer
+from PIL import Image
+from book_indexer_web_fixed import book_indexer_web as book_indexer, IncrementalIndex
+from page_sinks import make_page_sink, DiskPageSink
+from page_images import PAGE_SIZES, WEBP_AVAILABLE, MIMETYPES, PageImageCache, variant_dpi, resize_page, encode_page
+from job_queue import JobScheduler, QueueFull, BacklogFull, JobCancelled
+from result_cache import ResultCache, get_dir_size
+from session_store import make_session_store, SessionSweeper
+from events import EventBroker, format_sse
+from metrics import registry, CONTENT_TYPE
+from detection_table import DetectionTable
+from search_index import SearchIndex
+from chunked_uploads import ChunkedUploadStore, UploadNotFound, UploadConflict, ChunkRejected
 
 app = Flask(__name__)
-app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size
+app.config['MAX_CONTENT_LENGTH'] = 50 * 1024 * 1024  # 50MB max file size (per request: /upload, or one chunk)
+# Larger books go through the chunked /uploads API, up to this size
+app.config['MAX_UPLOAD_BYTES'] = int(os.environ.get('BOOKMAP_MAX_UPLOAD_MB', 1024)) * 1024 * 1024
+app.config['UPLOAD_CHUNK_BYTES'] = int(os.environ.get('BOOKMAP_UPLOAD_CHUNK_MB', 8)) * 1024 * 1024
+# Admission control: most pages one job may have (0: no limit)
+app.config['MAX_JOB_PAGES'] = int(os.environ.get('BOOKMAP_MAX_JOB_PAGES', 2000))
 app.config['UPLOAD_FOLDER'] = 'temp_uploads'
 app.config['SECRET_KEY'] = 'your-secret-key-here'
+# Where page images go while processing: 'none' (render on demand), 'disk' or 'memory'
+app.config['PAGE_SINK'] = os.environ.get('BOOKMAP_PAGE_SINK', 'none')
+# Whether sinks also keep box-drawn copies of every page; the viewer draws boxes itself
+app.config['ANNOTATE_PAGES'] = os.environ.get('BOOKMAP_ANNOTATE_PAGES', 'false').lower() == 'true'
+# Seconds an /events stream waits for a pushed event before re-reading the shared session store
+app.config['SSE_POLL_SECONDS'] = float(os.environ.get('BOOKMAP_SSE_POLL_SECONDS', 5))
+# Most pages one /detections request may return
+app.config['DETECTIONS_MAX_PAGES'] = int(os.environ.get('BOOKMAP_DETECTIONS_MAX_PAGES', 50))
+# Most pages one /search request may return
+app.config['SEARCH_MAX_RESULTS'] = int(os.environ.get('BOOKMAP_SEARCH_MAX_RESULTS', 200))
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-# Global variables for processing
-processing_status = {}
-current_index = {}
+# Processed results keyed by PDF hash + model/pipeline config; 0 MB disables the cache
+result_cache = ResultCache(
+    os.environ.get('BOOKMAP_CACHE_DIR', 'result_cache'),
+    int(os.environ.get('BOOKMAP_CACHE_MAX_MB', 1024)) * 1024 * 1024
+)
 
-def cleanup_old_sessions():
-    """Clean up old sessions and their temporary files"""
+# Chunked uploads in progress, resumable from any worker process
+chunked_uploads = ChunkedUploadStore(
+    os.path.join(app.config['UPLOAD_FOLDER'], 'chunked'),
+    app.config['MAX_UPLOAD_BYTES'],
+    ttl_seconds=int(os.environ.get('BOOKMAP_UPLOAD_TTL', 24 * 3600))
+)
+
+# Word search across every processed book; an empty path disables it
+search_db = os.environ.get('BOOKMAP_SEARCH_DB', 'search_index.db')
+search_index = SearchIndex(search_db) if search_db else None
+
+# Session status and results: 'memory' (single process) or 'sqlite:///path' (shared by workers)
+session_store = make_session_store(
+    os.environ.get('BOOKMAP_SESSION_STORE', 'memory'),
+    ttl_seconds=int(os.environ.get('BOOKMAP_SESSION_TTL', 3600))
+)
+
+# Page sinks of sessions processed by this process
+page_sinks = {}
+
+# Progress events pushed to /events subscribers
+event_broker = EventBroker()
+TERMINAL_STATUSES = ('completed', 'error', 'cancelled')
+
+# Background workers for /upload; sized to the machine's cores by default. Queued jobs run
+# shortest first by pages x measured seconds per page, and the page backlog is capped
+job_scheduler = JobScheduler(
+    num_workers=int(os.environ.get('BOOKMAP_WORKERS', 0)) or None,
+    max_queue=int(os.environ.get('BOOKMAP_MAX_QUEUE', 0)) or None,
+    max_backlog_pages=int(os.environ.get('BOOKMAP_MAX_BACKLOG_PAGES', 5000)) or None,
+    aging=float(os.environ.get('BOOKMAP_QUEUE_AGING', 1.0)),
+    seconds_per_page=float(os.environ.get('BOOKMAP_SECONDS_PER_PAGE', 1.0))
+)
+
+# Service metrics for /metrics; per-stage pipeline metrics are recorded by the indexer
+UPLOADS_TOTAL = registry.counter('bookmap_uploads_total', 'Uploads by outcome', ['outcome'])
+JOBS_TOTAL = registry.counter('bookmap_jobs_total', 'Processing jobs finished, by final status', ['status'])
+JOB_SECONDS = registry.histogram('bookmap_job_seconds', 'Wall time of completed processing jobs',
+                                 buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800, 3600))
+registry.gauge('bookmap_active_sessions', 'Sessions in the session store').set_function(
+    session_store.count_sessions)
+registry.gauge('bookmap_jobs_in_flight', 'Jobs being processed by this process').set_function(
+    job_scheduler.in_flight)
+registry.gauge('bookmap_jobs_queued', 'Jobs waiting for a worker in this process').set_function(
+    job_scheduler.queued_count)
+registry.gauge('bookmap_upload_folder_bytes', 'Disk used by uploaded PDFs and session folders').set_function(
+    lambda: get_dir_size(app.config['UPLOAD_FOLDER']))
+
+def cleanup_session_files(info):
+    """Remove an expired session's uploaded PDF and working directory"""
+    session_id = info['session_id']
+    page_sinks.pop(session_id, None)
+    job_scheduler.forget(session_id)
+    
+    if info.get('temp_dir'):
+        shutil.rmtree(info['temp_dir'], ignore_errors=True)
+    if info.get('upload_path') and os.path.isfile(info['upload_path']):
+        os.remove(info['upload_path'])
+
+# Expired sessions are swept in the background instead of on the request path
+session_sweeper = SessionSweeper(session_store, cleanup_session_files,
+                                 interval=int(os.environ.get('BOOKMAP_SWEEP_INTERVAL', 60)))
+
+@app.before_request
+def start_background_services():
+    session_sweeper.ensure_started()
+
+# Model loading and warm-up state of this process, reported by /health/ready
+worker_state = {"pid": None, "state": "starting", "model_loaded": False,
+                "model_load_seconds": None, "warmup_seconds": None}
+_warmup_thread = None
+_worker_lock = threading.Lock()
+
+def warm_worker():
+    worker_state["state"] = "loading"
     try:
-        current_time = datetime.now()
-        sessions_to_remove = []
-        
-        for session_id, data in current_index.items():
-            created_at = datetime.fromisoformat(data['created_at'])
-            if current_time - created_at > timedelta(hours=1):  # 1 hour expiry
-                sessions_to_remove.append(session_id)
-        
-        for session_id in sessions_to_remove:
-            # Remove from memory
-            if session_id in current_index:
-                del current_index[session_id]
-            if session_id in processing_status:
-                del processing_status[session_id]
-            
-            # Remove temporary files
-            temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
-            if os.path.exists(temp_dir):
-                shutil.rmtree(temp_dir, ignore_errors=True)
-            
-            # Remove uploaded file
-            for filename in os.listdir(app.config['UPLOAD_FOLDER']):
-                if filename.startswith(session_id):
-                    file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                    if os.path.isfile(file_path):
-                        os.remove(file_path)
-        
-        if sessions_to_remove:
-            print(f"Cleaned up {len(sessions_to_remove)} old sessions")
-            
+        loaded = book_indexer.warm_up()
     except Exception as e:
-        print(f"Error during cleanup: {e}")
+        print(f"Error warming up worker: {e}")
+        loaded = False
+    worker_state.update(
+        state="ready" if book_indexer.can_process() else "unavailable",
+        model_loaded=loaded,
+        model_load_seconds=book_indexer.model_load_seconds,
+        warmup_seconds=book_indexer.warmup_seconds
+    )
+    print(f"Worker {os.getpid()} {worker_state['state']} (model loaded: {loaded})")
+
+def init_worker(block=False):
+    """Load and warm the model once per process; cheap to call again (e.g. from gunicorn's post_fork)"""
+    global _warmup_thread
+    with _worker_lock:
+        if worker_state["pid"] != os.getpid():
+            # New process (first call, or a forked worker): the parent's thread didn't come along
+            worker_state.update(pid=os.getpid(), state="loading")
+            _warmup_thread = threading.Thread(target=warm_worker, name='bookmap-warmup', daemon=True)
+            _warmup_thread.start()
+        thread = _warmup_thread
+    if block:
+        thread.join()
+
+def is_ready():
+    return worker_state["pid"] == os.getpid() and worker_state["state"] == "ready"
+
+registry.gauge('bookmap_worker_ready', 'Whether this process has finished loading and warming the model').set_function(
+    lambda: 1 if is_ready() else 0)
+registry.gauge('bookmap_model_load_seconds', 'Seconds this process spent loading the model').set_function(
+    lambda: book_indexer.model_load_seconds or 0)
+registry.gauge('bookmap_model_warmup_seconds', 'Seconds of the warm-up inference').set_function(
+    lambda: book_indexer.warmup_seconds or 0)
+
+# Start loading as soon as the app is imported, so WSGI hosts get a model too
+if os.environ.get('BOOKMAP_WARM_ON_IMPORT', 'true').lower() == 'true':
+    init_worker()
+
+def set_status(session_id, status, stage, progress, message):
+    """Replace a session's processing status and push it to event subscribers"""
+    status = {"status": status, "stage": stage, "progress": progress, "message": message}
+    session_store.set_status(session_id, status)
+    event_broker.publish(session_id, 'status', status)
+
+def public_status(session_id, status):
+    """Status as reported to clients, with the live queue position for waiting jobs"""
+    status = dict(status)
+    status.pop('cancel_requested', None)
+    if status.get('status') in ('queued', 'processing'):
+        # Queue wait and estimated start/completion, for jobs held by this process
+        status.update(job_scheduler.estimate(session_id) or {})
+    if status.get('status') == 'queued':
+        position = job_scheduler.queue_position(session_id)
+        status['queue_position'] = position
+        if position:
+            status['message'] = f"Queued - position {position} of {job_scheduler.queued_count()}"
+            if status.get('estimated_start_seconds'):
+                status['message'] += f", starting in about {int(status['estimated_start_seconds'])}s"
+    return status
 
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() == 'pdf'
 
+def save_upload(file, file_path, chunk_size=1024 * 1024):
+    """Stream an uploaded file to disk, hashing it on the way; returns the SHA-256 hex digest"""
+    digest = hashlib.sha256()
+    with open(file_path, 'wb') as f:
+        for chunk in iter(lambda: file.stream.read(chunk_size), b''):
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
 
-def process_pdf_async(pdf_path, session_id):
-    """Process PDF asynchronously"""
+def build_page_manifest(result):
+    """Where each page's viewer image comes from, worked out once so serving a page never probes the disk
+    
+    Pages that went through the vision pipeline (including those the layout
+    engine, pre-filter or page cache answered) are in the sink (if there is
+    one) at the raster resolution; text-layer pages are rendered from the PDF.
+    """
+    page_engines = result.get("page_engines") or ['vision'] * result["num_pages"]
+    has_sink = result.get("page_sink", 'none') != 'none'
+    rasterized = ('vision', 'heuristic', 'skipped', 'cached')
+    return {
+        "sink_dpi": book_indexer.detect_dpi or book_indexer.dpi,
+        "bbox_dpi": book_indexer.dpi,
+        "in_sink": "".join('1' if has_sink and engine in rasterized else '0' for engine in page_engines)
+    }
+
+def index_for_search(session_id, result, pdf_path, pdf_hash):
+    """Add a book's words to the search index; a cached result's book is usually indexed already"""
+    if search_index is None or not pdf_hash:
+        return
+    if result.get("cached") and search_index.has_book(pdf_hash):
+        return
+    # Uploads are saved as <session_id>_<filename>
+    filename = os.path.basename(pdf_path)[len(session_id) + 1:]
     try:
-        processing_status[session_id] = {"status": "processing", "progress": 0, "message": "Starting processing..."}
+        postings = search_index.index_book(pdf_hash, filename, result["raw_results"])
+        print(f"Indexed {postings} words of {filename} for search")
+    except Exception as e:
+        print(f"Could not index session {session_id} for search: {e}")
+
+def session_result(result, pdf_path, pdf_hash=None, created_at=None):
+    """Fields the index and viewer endpoints read from a stored result, partial or complete"""
+    return {
+        "index": result["index"],
+        "num_pages": result["num_pages"],
+        "page_sink": result.get("page_sink", 'none'),
+        "page_manifest": build_page_manifest(result),
+        "page_engines": result.get("page_engines"),
+        "pdf_path": pdf_path,
+        "book": pdf_hash,
+        "created_at": created_at or datetime.now().isoformat()
+    }
+
+def store_result(session_id, result, pdf_path, pdf_hash=None):
+    """Make a processing result available to the index and viewer endpoints"""
+    index_for_search(session_id, result, pdf_path, pdf_hash)
+    # Detections are kept as NumPy columns, apart from the index JSON
+    table = DetectionTable.from_raw_results(result["raw_results"], book_indexer.class_names)
+    session_store.set_detections(session_id, table)
+    session_store.set_result(session_id, dict(
+        session_result(result, pdf_path, pdf_hash),
+        num_detections=len(table),
+        complete=True,
+        pages_done=result["num_pages"],
+        peak_memory_mb=result.get("peak_memory_mb"),
+        cached=result.get("cached", False)
+    ))
+    set_status(session_id, "completed", "completed", 100, "Processing completed!")
+
+def restore_cached_result(session_id, cache_key, pdf_path, pdf_hash=None):
+    """Serve a session from the result cache; returns True on a hit"""
+    cached = result_cache.get(cache_key)
+    if cached is None:
+        return False
+    
+    pages_dir = result_cache.pages_dir(cache_key)
+    if pages_dir:
+        # Cached page images go back into the session folder as a disk sink
+        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
+        shutil.copytree(pages_dir, temp_dir, dirs_exist_ok=True)
+        cached["page_sink"] = 'disk'
+    else:
+        cached["page_sink"] = 'none'
+    cached["cached"] = True
+    store_result(session_id, cached, pdf_path, pdf_hash)
+    return True
+
+
+def process_pdf_async(job, pdf_path, session_id, cache_key=None, pdf_hash=None, num_pages=None):
+    """Process PDF on a scheduler worker thread"""
+    def check_cancelled():
+        # Cancellation may come from this process (job) or another worker (session flag)
+        job.check_cancelled()
+        status = session_store.get_status(session_id)
+        if status is None or status.get('cancel_requested'):
+            raise JobCancelled(f"Job {session_id} was cancelled")
+    
+    def was_cancelled():
+        try:
+            check_cancelled()
+        except JobCancelled:
+            return True
+        return False
+    
+    started_at = time.time()
+    try:
+        check_cancelled()
+        set_status(session_id, "processing", "starting", 0, "Starting processing...")
         
         # Create temporary directory for this session
         temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
         os.makedirs(temp_dir, exist_ok=True)
         
-        def progress_callback(progress, message):
-            processing_status[session_id]["progress"] = progress
-            processing_status[session_id]["message"] = message
+        def progress_callback(progress, message, stage=None):
+            # Stop at the next page boundary once the job has been cancelled
+            check_cancelled()
+            fields = {"progress": progress, "message": message}
+            if stage:
+                fields["stage"] = stage
+            session_store.update_status(session_id, **fields)
+            event_broker.publish(session_id, 'status', dict(fields, status="processing"))
         
-        # Process PDF using the book indexer
-        result = book_indexer.process_pdf(pdf_path, temp_dir, progress_callback)
+        num_pages = num_pages or book_indexer.get_page_count(pdf_path)
+        partial_index = IncrementalIndex()
+        # Fixed for the whole run so page ETags don't change with every partial update
+        partial_created_at = datetime.now().isoformat()
+        
+        def page_callback(image_results):
+            entries = book_indexer.page_index_entries(image_results)
+            partial_index.add_page(entries)
+            pages_done = partial_index.pages_done
+            
+            # Serve the partial index from /index while the rest of the book is processed.
+            # Without page engines yet, the manifest renders every page from the PDF.
+            partial = {"index": partial_index.to_list(), "num_pages": num_pages}
+            session_store.set_result(session_id, dict(
+                session_result(partial, pdf_path, pdf_hash, partial_created_at),
+                complete=False,
+                pages_done=pages_done
+            ))
+            
+            event_broker.publish(session_id, 'page', {
+                "page": int(image_results["image"].split("_")[1].split(".")[0]) + 1,
+                "pages_done": pages_done,
+                "num_pages": num_pages,
+                "entries": [{"page": page, "title": title} for page, title in entries]
+            })
         
-        processing_status[session_id]["progress"] = 100
-        processing_status[session_id]["status"] = "completed"
-        processing_status[session_id]["message"] = "Processing completed!"
+        # Process PDF using the book indexer
+        sink = make_page_sink(app.config['PAGE_SINK'], temp_dir, annotated=app.config['ANNOTATE_PAGES'])
+        if sink:
+            page_sinks[session_id] = sink
+        result = book_indexer.process_pdf(pdf_path, temp_dir, progress_callback, sink=sink,
+                                          page_callback=page_callback, num_pages=num_pages)
         
         # Store results
-        current_index[session_id] = {
-            "index": result["index"],
-            "raw_results": result["raw_results"],
-            "num_pages": result["num_pages"],
-            "created_at": datetime.now().isoformat()
-        }
+        store_result(session_id, result, pdf_path, pdf_hash)
+        JOBS_TOTAL.inc(status='completed')
+        JOB_SECONDS.observe(time.time() - started_at)
+        # Measured cost feeds the scheduler's shortest-job-first estimates. Only model pages count:
+        # text-layer, outline, skipped and cached pages take milliseconds and would drag the rate down
+        job_scheduler.record_run((result.get("page_engines") or []).count('vision'), time.time() - started_at)
         
-        # Keep processed images for viewing (don't cleanup immediately)
-        # Cleanup will happen when session expires or new file is uploaded
-        print(f"Session {session_id} completed. Images kept for viewing.")
+        if cache_key:
+            page_folders = []
+            if result.get("page_sink") == 'disk':
+                page_folders = [os.path.join(temp_dir, 'converted'), os.path.join(temp_dir, 'processed')]
+            try:
+                result_cache.put(cache_key, {
+                    "index": result["index"],
+                    "raw_results": result["raw_results"],
+                    "num_pages": result["num_pages"],
+                    "page_engines": result.get("page_engines")
+                }, page_folders)
+            except Exception as e:
+                print(f"Could not cache result for session {session_id}: {e}")
         
+        # Keep the PDF (and any sink images) for viewing until the session expires
+        print(f"Session {session_id} completed.")
+        
+    except JobCancelled:
+        JOBS_TOTAL.inc(status='cancelled')
+        set_status(session_id, "cancelled", "cancelled", 0, "Processing cancelled")
     except Exception as e:
-        processing_status[session_id] = {
-            "status": "error", 
-            "progress": 0, 
-            "message": f"Error: {str(e)}"
-        }
+        # The indexer re-raises everything, JobCancelled included, as a plain Exception
+        if was_cancelled():
+            JOBS_TOTAL.inc(status='cancelled')
+            set_status(session_id, "cancelled", "cancelled", 0, "Processing cancelled")
+        else:
+            JOBS_TOTAL.inc(status='error')
+            set_status(session_id, "error", "error", 0, f"Error: {str(e)}")
 
 @app.route('/')
 def index():
@@ -118,6 +402,81 @@ def index():
         print(f"Error rendering template: {e}")
         return f"BookMap Web Application is running! Error: {e}", 200
 
+def start_session(session_id, file_path, pdf_hash, num_pages=None):
+    """Create the session for a saved upload and serve it from the cache or queue it
+    
+    Jobs are admitted against the per-job and backlog page budgets; the
+    page count is read from the PDF trailer (pdfinfo) unless already known.
+    Returns (response payload, HTTP status); a payload with retry_after
+    should be sent with a Retry-After header.
+    """
+    temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
+    session_store.create_session(session_id, {
+        "status": "queued", "stage": "queued", "progress": 0, "message": "Waiting for a worker..."
+    }, upload_path=file_path, temp_dir=temp_dir)
+    
+    # Same bytes, same model and settings: reuse the earlier result
+    cache_key = result_cache.make_key(pdf_hash, book_indexer.pipeline_config())
+    if restore_cached_result(session_id, cache_key, file_path, pdf_hash):
+        UPLOADS_TOTAL.inc(outcome='cached')
+        return {
+            'session_id': session_id,
+            'message': 'File uploaded successfully. Result served from cache.',
+            'cached': True
+        }, 200
+    
+    # Start processing
+    if worker_state["state"] == "loading":
+        cleanup_session_files(session_store.delete_session(session_id))
+        UPLOADS_TOTAL.inc(outcome='busy')
+        return {'error': 'AI model is still loading, please try again shortly.'}, 503
+    if not book_indexer.can_process():
+        cleanup_session_files(session_store.delete_session(session_id))
+        UPLOADS_TOTAL.inc(outcome='unavailable')
+        return {'error': 'AI model not loaded'}, 500
+    
+    # Admission control: a cheap page count decides whether the job fits the page budgets
+    try:
+        num_pages = num_pages or book_indexer.get_page_count(file_path)
+    except Exception as e:
+        cleanup_session_files(session_store.delete_session(session_id))
+        UPLOADS_TOTAL.inc(outcome='invalid')
+        return {'error': f'Could not read the PDF: {e}'}, 400
+    if app.config['MAX_JOB_PAGES'] and num_pages > app.config['MAX_JOB_PAGES']:
+        cleanup_session_files(session_store.delete_session(session_id))
+        UPLOADS_TOTAL.inc(outcome='too_large')
+        return {'error': f"The PDF has {num_pages} pages; the limit is {app.config['MAX_JOB_PAGES']}."}, 413
+    
+    # Queue for a background worker and return immediately
+    try:
+        job_scheduler.submit(session_id, process_pdf_async, file_path, session_id, cache_key, pdf_hash, num_pages,
+                             pages=num_pages)
+    except BacklogFull as e:
+        cleanup_session_files(session_store.delete_session(session_id))
+        UPLOADS_TOTAL.inc(outcome='busy')
+        return {'error': f'Server is busy ({e}), please try again in {e.retry_after}s.',
+                'retry_after': e.retry_after}, 429
+    except QueueFull as e:
+        cleanup_session_files(session_store.delete_session(session_id))
+        UPLOADS_TOTAL.inc(outcome='busy')
+        return {'error': f'Server is busy, please try again shortly. {e}'}, 503
+    
+    UPLOADS_TOTAL.inc(outcome='queued')
+    return dict({
+        'session_id': session_id,
+        'message': 'File uploaded successfully. Processing queued.',
+        'num_pages': num_pages,
+        'queue_position': job_scheduler.queue_position(session_id)
+    }, **(job_scheduler.estimate(session_id) or {})), 200
+
+def upload_response(payload, status_code):
+    """JSON response for start_session's result, with Retry-After when the server is over budget"""
+    response = jsonify(payload)
+    response.status_code = status_code
+    if 'retry_after' in payload:
+        response.headers['Retry-After'] = str(payload['retry_after'])
+    return response
+
 @app.route('/upload', methods=['POST'])
 def upload_file():
     """Handle PDF uploads"""
@@ -137,46 +496,317 @@ def upload_file():
     # Save uploaded file
     filename = secure_filename(file.filename)
     file_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{session_id}_{filename}')
-    file.save(file_path)
+    pdf_hash = save_upload(file, file_path)
+    return upload_response(*start_session(session_id, file_path, pdf_hash))
+
+def upload_state(state):
+    """Public view of a chunked upload's progress"""
+    return {
+        'upload_id': state['upload_id'],
+        'filename': state['filename'],
+        'size': state['size'],
+        'offset': state['offset'],
+        'complete': state['offset'] == state['size'],
+        'pages_seen': state['pages_seen'],
+        'chunk_size': app.config['UPLOAD_CHUNK_BYTES']
+    }
+
+@app.route('/uploads', methods=['POST'])
+def create_chunked_upload():
+    """Start a chunked upload: JSON {filename, size, sha256 (optional, whole file)}"""
+    data = request.get_json(silent=True) or {}
+    filename = secure_filename(str(data.get('filename', '')))
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'Only PDF files are allowed'}), 400
+    try:
+        size = int(data.get('size', 0))
+        state = chunked_uploads.create(filename, size, data.get('sha256'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid size'}), 400
+    except ChunkRejected as e:
+        return jsonify({'error': str(e)}), 413 if size > 0 else 400
+    return jsonify(upload_state(state)), 201
+
+@app.route('/uploads/<upload_id>', methods=['GET'])
+def get_chunked_upload(upload_id):
+    """Where to resume: the offset of the next chunk"""
+    try:
+        return jsonify(upload_state(chunked_uploads.get_state(upload_id)))
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+
+@app.route('/uploads/<upload_id>', methods=['PUT'])
+def put_chunk(upload_id):
+    """Append one chunk (raw body) at ?offset=, checked against the X-Chunk-SHA256 header
     
-    # Start processing
-    if not book_indexer.model:
-        return jsonify({'error': 'AI model not loaded'}), 500
+    A 409 carries the offset to resume from. The response to the last chunk
+    also carries the new session, like /upload's.
+    """
+    try:
+        offset = int(request.args.get('offset', ''))
+    except ValueError:
+        return jsonify({'error': 'Missing or invalid offset'}), 400
+    if not request.headers.get('X-Chunk-SHA256'):
+        return jsonify({'error': 'Missing X-Chunk-SHA256 header'}), 400
     
-    # Process in background (in production, use Celery or similar)
-    process_pdf_async(file_path, session_id)
+    try:
+        # request.stream is read a block at a time, so a chunk is never held in memory whole
+        state = chunked_uploads.write_chunk(upload_id, offset, request.stream,
+                                            request.headers['X-Chunk-SHA256'], app.config['UPLOAD_CHUNK_BYTES'])
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except UploadConflict as e:
+        state = chunked_uploads.get_state(upload_id)
+        return jsonify(dict(upload_state(state), error=str(e))), 409
+    except ChunkRejected as e:
+        state = chunked_uploads.get_state(upload_id)
+        return jsonify(dict(upload_state(state), error=str(e))), 400
     
-    return jsonify({
-        'session_id': session_id,
-        'message': 'File uploaded successfully. Processing started.'
-    })
+    payload = upload_state(state)
+    if not payload['complete']:
+        return jsonify(payload)
+    
+    # Last chunk: validate the PDF and start processing straight away
+    return complete_upload(upload_id)
+
+@app.route('/uploads/<upload_id>/complete', methods=['POST'])
+def complete_upload(upload_id):
+    """Start processing a fully received upload
+    
+    Runs after the last chunk, and again by the client when that was
+    refused for the moment (429, 503, 500): the upload is only discarded
+    once its job is queued or it is rejected for good, so only this call is
+    repeated, not the transfer.
+    """
+    try:
+        with chunked_uploads.exclusive(upload_id):
+            return start_chunked_upload(upload_id)
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    except UploadConflict as e:
+        return jsonify(dict(upload_state(chunked_uploads.get_state(upload_id)), error=str(e))), 409
+
+def start_chunked_upload(upload_id):
+    try:
+        state, data_path = chunked_uploads.verify(upload_id)
+    except ChunkRejected as e:
+        return jsonify({'upload_id': upload_id, 'complete': True, 'error': str(e)}), 400
+    payload = upload_state(state)
+    
+    # Refusals that don't depend on the file come first and keep the upload
+    if worker_state["state"] == "loading":
+        UPLOADS_TOTAL.inc(outcome='busy')
+        return jsonify(dict(payload, error='AI model is still loading, please try again shortly.')), 503
+    if not book_indexer.can_process():
+        UPLOADS_TOTAL.inc(outcome='unavailable')
+        return jsonify(dict(payload, error='AI model not loaded')), 500
+    try:
+        num_pages = book_indexer.get_page_count(data_path)
+    except Exception as e:
+        chunked_uploads.discard(upload_id)
+        UPLOADS_TOTAL.inc(outcome='invalid')
+        return jsonify(dict(payload, error=f'Could not read the PDF: {e}')), 400
+    # The session gets its own link to the file; the upload goes once the job is queued, so a
+    # 429 or 503 from the admission check in submit() leaves it to be started again
+    session_id = str(uuid.uuid4())
+    file_path = os.path.join(app.config['UPLOAD_FOLDER'], f'{session_id}_{state["filename"]}')
+    chunked_uploads.export(upload_id, file_path)
+    session_payload, status_code = start_session(session_id, file_path, state['sha256_actual'], num_pages)
+    if status_code not in (429, 500, 503):
+        chunked_uploads.discard(upload_id)
+    return upload_response(dict(payload, **session_payload), status_code)
+
+@app.route('/uploads/<upload_id>', methods=['DELETE'])
+def delete_chunked_upload(upload_id):
+    """Abandon a chunked upload"""
+    try:
+        chunked_uploads.get_state(upload_id)
+    except UploadNotFound as e:
+        return jsonify({'error': str(e)}), 404
+    chunked_uploads.discard(upload_id)
+    return jsonify({'upload_id': upload_id, 'message': 'Upload discarded'})
 
 @app.route('/status/<session_id>')
 def get_status(session_id):
     """Get processing status"""
-    if session_id not in processing_status:
+    status = session_store.get_status(session_id)
+    if status is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    return jsonify(public_status(session_id, status))
+
+@app.route('/events/<session_id>')
+def stream_events(session_id):
+    """Server-Sent Events stream of status, page progress and partial index entries"""
+    if session_store.get_status(session_id) is None:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    def generate():
+        events = event_broker.subscribe(session_id)
+        try:
+            # Read the status after subscribing so no event falls in between
+            last_status = session_store.get_status(session_id)
+            if last_status is None:
+                return
+            last_status = public_status(session_id, last_status)
+            yield format_sse('status', last_status)
+            
+            while last_status.get('status') not in TERMINAL_STATUSES:
+                try:
+                    event, data = events.get(timeout=app.config['SSE_POLL_SECONDS'])
+                except queue.Empty:
+                    # The job may be running in another worker process: check the shared store
+                    status = session_store.get_status(session_id)
+                    if status is None:
+                        return
+                    status = public_status(session_id, status)
+                    if status != last_status:
+                        last_status = status
+                        yield format_sse('status', status)
+                    else:
+                        yield ": keepalive\n\n"
+                    continue
+                
+                yield format_sse(event, data)
+                if event == 'status':
+                    last_status = data
+        finally:
+            event_broker.unsubscribe(session_id, events)
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/cancel/<session_id>', methods=['POST'])
+def cancel_processing(session_id):
+    """Cancel a queued or running job"""
+    status = session_store.get_status(session_id)
+    if status is None:
         return jsonify({'error': 'Session not found'}), 404
     
-    return jsonify(processing_status[session_id])
+    if status.get('status') not in ('queued', 'processing'):
+        return jsonify({'error': 'Job is not queued or running'}), 409
+    
+    job_scheduler.cancel(session_id)
+    job = job_scheduler.get_job(session_id)
+    if job and job.state == 'cancelled':
+        # Never started: nothing will update the status, so do it here
+        set_status(session_id, "cancelled", "cancelled", 0, "Processing cancelled")
+    else:
+        # Running here, or owned by another worker process that polls this flag
+        session_store.update_status(session_id, cancel_requested=True, message="Cancelling...")
+    
+    return jsonify({'session_id': session_id, 'message': 'Cancellation requested'})
 
 @app.route('/index/<session_id>')
 def get_index(session_id):
-    """Return structured index JSON"""
-    if session_id not in current_index:
+    """Return structured index JSON; partial (complete: false) while still processing
+    
+    Detections are served page by page from /detections; ?raw_results=1
+    adds all of them here for older clients.
+    """
+    result = session_store.get_result(session_id)
+    if result is None:
         return jsonify({'error': 'Index not found'}), 404
     
-    # Cleanup old sessions periodically
-    cleanup_old_sessions()
+    if request.args.get('raw_results', '').lower() in ('1', 'true'):
+        table = session_store.get_detections(session_id)
+        result = dict(result, raw_results=table.to_raw_results() if table else [])
+    return jsonify(result)
+
+def parse_page_range(value, num_pages, max_pages):
+    """Parse 'a-b' or 'a' (1-based, inclusive) into (start, end); defaults to the first max_pages pages"""
+    if not value:
+        return 1, min(num_pages, max_pages)
+    start, _, end = value.partition('-')
+    start = int(start)
+    end = int(end) if end else start
+    if start < 1 or end < start or start > num_pages:
+        raise ValueError(f"Page range {value} is outside 1-{num_pages}")
+    return start, min(end, num_pages, start + max_pages - 1)
+
+def compressed_json(payload, etag):
+    """JSON response with an ETag, gzip-encoded when the client accepts it and the body is worth it"""
+    body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache', 'Vary': 'Accept-Encoding'}
+    if len(body) > 1024 and 'gzip' in request.accept_encodings:
+        body = gzip.compress(body, compresslevel=6)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, content_type='application/json', headers=headers)
+
+@app.route('/detections/<session_id>')
+def get_detections(session_id):
+    """Detections of a page range (?pages=a-b, 1-based), in the raw_results schema"""
+    result = session_store.get_result(session_id)
+    if result is None:
+        return jsonify({'error': 'Session not found'}), 404
+    table = session_store.get_detections(session_id) if result.get('complete', True) else None
+    if table is None:
+        return jsonify({'error': 'Detections are available once processing completes'}), 404
+    
+    try:
+        start, end = parse_page_range(request.args.get('pages'), table.num_pages,
+                                      app.config['DETECTIONS_MAX_PAGES'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # The table never changes once stored, so its digest plus the range identifies the response
+    etag = f'{table.etag[:16]}-{start}-{end}'
+    if request.if_none_match.contains(etag):
+        return Response(status=304, headers={'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache'})
+    
+    return compressed_json({
+        "session_id": session_id,
+        "num_pages": table.num_pages,
+        "pages": {"start": start, "end": end},
+        "next_pages": f"{end + 1}-{min(end + 1 + end - start, table.num_pages)}" if end < table.num_pages else None,
+        "class_names": table.class_names,
+        "class_colors": book_indexer.class_colors,
+        "results": [dict(entry, page=start + i) for i, entry in enumerate(table.page_results(start - 1, end))]
+    }, etag)
+
+@app.route('/search')
+def search():
+    """Words across every indexed book (?q=, ?limit=); ?session_id= limits the search to that session's book"""
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Missing query (?q=)'}), 400
+    if search_index is None:
+        return jsonify({'error': 'Search is disabled'}), 404
+    
+    book = None
+    session_id = request.args.get('session_id')
+    if session_id:
+        result = session_store.get_result(session_id)
+        if result is None or not result.get('complete', True):
+            return jsonify({'error': 'Session not found or still processing'}), 404
+        book = result.get('book')
+        if not book:
+            return jsonify({'error': 'This session was not indexed for search'}), 404
+    
+    try:
+        limit = min(int(request.args.get('limit', 50)), app.config['SEARCH_MAX_RESULTS'])
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
     
-    return jsonify(current_index[session_id])
+    start = time.perf_counter()
+    response = search_index.search(query, book_hash=book, limit=max(limit, 1))
+    response["took_ms"] = round((time.perf_counter() - start) * 1000, 2)
+    # Hit boxes are in the same pixels as /detections bboxes
+    response["bbox_dpi"] = book_indexer.dpi
+    return jsonify(response)
 
 @app.route('/download/<session_id>/<format>')
 def download_index(session_id, format):
-    """Download index as JSON or CSV"""
-    if session_id not in current_index:
+    """Download index as JSON or CSV, or the annotated pages as a PDF"""
+    result = session_store.get_result(session_id)
+    if result is None:
         abort(404)
     
-    index_data = current_index[session_id]['index']
+    if format == 'pdf':
+        return send_file(export_annotated_pdf(session_id, result), mimetype='application/pdf',
+                         as_attachment=True, download_name=f'annotated_{session_id}.pdf')
+    
+    index_data = result['index']
     
     if format == 'json':
         output = io.StringIO()
@@ -206,53 +836,116 @@ def download_index(session_id, format):
     else:
         abort(400)
 
+def get_session_sink(session_id, result):
+    """Return the page sink a session was processed with, if any"""
+    sink = page_sinks.get(session_id)
+    if sink is None and result.get('page_sink') == 'disk':
+        # Disk sinks survive restarts and other workers; rebuild the handle from the session directory
+        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
+        sink = page_sinks[session_id] = make_page_sink('disk', temp_dir)
+    return sink
+
+def get_export_sink(session_id, result):
+    """Disk sink that keeps annotated pages once they have been rendered for export"""
+    sink = get_session_sink(session_id, result)
+    if sink is None or sink.name != 'disk':
+        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
+        sink = DiskPageSink(temp_dir, annotated=True, clean=False)
+    return sink
+
+def open_source_page(session_id, result, page_index, dpi=None):
+    """Clean page image and its resolution: from the session's sink when the manifest says it's there,
+    otherwise rasterized from the PDF (directly at dpi when given)"""
+    manifest = result.get('page_manifest') or build_page_manifest(result)
+    if manifest['in_sink'][page_index] == '1':
+        sink = get_session_sink(session_id, result)
+        page_file = sink.open_page(page_index) if sink else None
+        if page_file:
+            return Image.open(page_file), manifest['sink_dpi']
+    dpi = dpi or manifest['bbox_dpi']
+    return book_indexer.render_page(result['pdf_path'], page_index + 1, dpi=dpi), dpi
+
+def open_annotated_page(session_id, result, page_index):
+    """Annotated JPEG of one page, drawn on first request and cached in the export sink"""
+    export_sink = get_export_sink(session_id, result)
+    page_file = export_sink.open_page(page_index, annotated=True)
+    if page_file:
+        return page_file
+    
+    table = session_store.get_detections(session_id)
+    detections = table.page_detections(page_index) if table else []
+    image, source_dpi = open_source_page(session_id, result, page_index)
+    with image:
+        annotated = book_indexer.draw_detections(image, detections, scale=source_dpi / book_indexer.dpi)
+    export_sink.save_page(page_index, annotated, annotated=True)
+    annotated.close()
+    return export_sink.open_page(page_index, annotated=True)
+
+def export_annotated_pdf(session_id, result):
+    """Annotated PDF of the whole book, built once per session"""
+    export_sink = get_export_sink(session_id, result)
+    output_path = os.path.join(export_sink.temp_dir, 'annotated.pdf')
+    if not os.path.exists(output_path):
+        table = session_store.get_detections(session_id)
+        raw_results = table.to_raw_results() if table else []
+        book_indexer.export_annotated_pdf(result['pdf_path'], raw_results, export_sink, output_path + '.tmp')
+        os.replace(output_path + '.tmp', output_path)
+    return os.path.abspath(output_path)
+
 @app.route('/get-page-image/<session_id>/<int:page_number>')
 def get_page_image(session_id, page_number):
-    """Get processed page image for viewing"""
-    if session_id not in current_index:
-        print(f"Session {session_id} not found in current_index")
+    """Get a page image for viewing
+    
+    ?size=thumb|screen|full (default full) picks the resolution; variants are
+    encoded as WebP (or progressive JPEG) on first request and cached.
+    The viewer draws the boxes from /detections; X-Detection-Scale maps bbox
+    coordinates onto the image. ?annotated=1 returns the full page with the
+    boxes drawn in (for export).
+    """
+    session = session_store.get_result(session_id)
+    if session is None:
+        abort(404)
+    
+    if page_number < 1 or page_number > session['num_pages']:
         abort(404)
     
+    page_index = page_number - 1
     try:
-        # Look for the processed image in the session's temp directory
-        temp_dir = os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}')
-        processed_folder = os.path.join(temp_dir, 'processed')
-        converted_folder = os.path.join(temp_dir, 'converted')
-        
-        print(f"Looking for page {page_number} in session {session_id}")
-        print(f"Temp dir: {temp_dir}")
-        print(f"Processed folder exists: {os.path.exists(processed_folder)}")
-        print(f"Converted folder exists: {os.path.exists(converted_folder)}")
+        if request.args.get('annotated', '').lower() in ('1', 'true'):
+            return send_file(open_annotated_page(session_id, session, page_index), mimetype='image/jpeg')
         
-        # Try processed images first, then converted images
-        image_path = None
+        size = request.args.get('size', 'full')
+        if size not in PAGE_SIZES:
+            return jsonify({'error': f"Unknown size {size}; use one of {', '.join(PAGE_SIZES)}"}), 400
+        image_format = 'webp' if WEBP_AVAILABLE and request.accept_mimetypes['image/webp'] else 'jpeg'
         
-        if os.path.exists(processed_folder):
-            image_path = os.path.join(processed_folder, f'image_{page_number - 1}.jpg')
-            print(f"Trying processed image: {image_path}")
-            if not os.path.exists(image_path):
-                image_path = None
-                print("Processed image not found")
+        # Everything the response depends on is in the manifest, so conditional GETs never touch the disk
+        manifest = session.get('page_manifest') or build_page_manifest(session)
+        source_dpi = manifest['sink_dpi'] if manifest['in_sink'][page_index] == '1' else manifest['bbox_dpi']
+        dpi = variant_dpi(size, source_dpi)
+        etag = hashlib.sha1(f"{session_id}:{session.get('created_at')}:{page_index}:{size}:{image_format}"
+                            .encode('utf-8')).hexdigest()[:20]
+        headers = {
+            'ETag': f'"{etag}"',
+            'Cache-Control': f'private, max-age={session_store.ttl_seconds}',
+            'Vary': 'Accept',
+            'X-Detection-Scale': str(dpi / manifest['bbox_dpi'])
+        }
+        if request.if_none_match.contains(etag):
+            return Response(status=304, headers=headers)
         
-        if not image_path and os.path.exists(converted_folder):
-            image_path = os.path.join(converted_folder, f'image_{page_number - 1}.jpg')
-            print(f"Trying converted image: {image_path}")
-            if not os.path.exists(image_path):
-                image_path = None
-                print("Converted image not found")
+        page_cache = PageImageCache(os.path.join(app.config['UPLOAD_FOLDER'], f'temp_{session_id}'))
+        page_file = page_cache.open(page_index, size, image_format)
+        if page_file is None:
+            image, source_dpi = open_source_page(session_id, session, page_index, dpi)
+            with image:
+                data = encode_page(resize_page(image, source_dpi, dpi), image_format)
+            page_cache.save(page_index, size, image_format, data)
+            page_file = io.BytesIO(data)
         
-        if image_path and os.path.exists(image_path):
-            print(f"Serving image: {image_path}")
-            return send_file(image_path, mimetype='image/jpeg')
-        else:
-            print(f"Image not found for page {page_number}")
-            # List available files for debugging
-            if os.path.exists(temp_dir):
-                print(f"Available files in {temp_dir}:")
-                for root, dirs, files in os.walk(temp_dir):
-                    for file in files:
-                        print(f"  {os.path.join(root, file)}")
-            abort(404)
+        response = send_file(page_file, mimetype=MIMETYPES[image_format])
+        response.headers.update(headers)
+        return response
             
     except Exception as e:
         print(f"Error serving page image: {e}")
@@ -262,17 +955,45 @@ def get_page_image(session_id, page_number):
 
 @app.errorhandler(413)
 def too_large(e):
-    return jsonify({'error': 'File too large. Maximum size is 50MB.'}), 413
+    request_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    upload_mb = app.config['MAX_UPLOAD_BYTES'] // (1024 * 1024)
+    return jsonify({'error': f'Request too large: one request may carry {request_mb}MB. '
+                             f'Send PDFs of up to {upload_mb}MB in chunks through POST /uploads.',
+                    'max_request_bytes': app.config['MAX_CONTENT_LENGTH'],
+                    'max_upload_bytes': app.config['MAX_UPLOAD_BYTES']}), 413
 
 @app.errorhandler(404)
 def not_found(e):
     return jsonify({'error': 'Resource not found'}), 404
 
 @app.route('/health')
+@app.route('/health/live')
 def health_check():
-    """Health check endpoint for Railway"""
+    """Liveness: the process is up and serving requests (also the Railway health check)"""
     return jsonify({'status': 'healthy', 'message': 'BookMap Web Application is running'}), 200
 
+@app.route('/health/ready')
+def readiness_check():
+    """Readiness: 200 only once this worker has loaded and warmed the model"""
+    state = dict(worker_state, pid=os.getpid())
+    if not is_ready():
+        if worker_state["pid"] != os.getpid():
+            state["state"] = "starting"
+        return jsonify(dict(state, status='not ready')), 503
+    return jsonify(dict(state, status='ready')), 200
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics: per-stage timings, page/detection/OCR counters and queue gauges"""
+    return Response(registry.render(), content_type=CONTENT_TYPE)
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Result cache hit/miss ratio and size; the in-process per-page cache is under pages"""
+    stats = result_cache.stats()
+    stats["pages"] = book_indexer.page_cache.stats()
+    return jsonify(stats)
+
 @app.route('/test')
 def test():
     """Simple test endpoint"""
@@ -285,8 +1006,9 @@ def internal_error(e):
 if __name__ == '__main__':
     print("Starting BookMap Web Application...")
     
-    # Load the AI model on startup
-    if book_indexer.load_model():
+    # Load and warm the AI model before serving (no-op if it already ran at import)
+    init_worker(block=True)
+    if worker_state["model_loaded"]:
         print("AI model loaded successfully")
     else:
         print("Warning: AI model could not be loaded")
@@ -0,0 +1,257 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Batch indexer
+Headless bulk indexing without the web app. Every PDF in a directory (or
+listed in a manifest) gets its own output folder with result.json,
+index.txt and, when requested, an annotated output.pdf. PDFs whose outputs
+are already complete are skipped, so an interrupted run can be restarted.
+
+    python batch_index.py Input -o Output
+    python batch_index.py Input -o Output --jobs 4 --annotate
+    python batch_index.py --manifest books.txt -o Output --jobs 8
+    python batch_index.py Input -o Output --full-text --search-db search_index.db
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import hashlib
+import argparse
+import multiprocessing
+from book_indexer_web_fixed import book_indexer_web
+from page_sinks import DiskPageSink
+from page_shards import limit_threads
+from result_cache import hash_file
+from search_index import SearchIndex
+
+# The indexer used by this worker process
+_indexer = None
+
+
+def find_pdfs(input_dir):
+    """PDFs under a directory, in a stable order"""
+    pdf_paths = []
+    for root, _, files in os.walk(input_dir):
+        for filename in files:
+            if filename.lower().endswith('.pdf'):
+                pdf_paths.append(os.path.join(root, filename))
+    return sorted(pdf_paths)
+
+
+def read_manifest(manifest_path):
+    """PDF paths listed one per line; blank lines and # comments are ignored"""
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    pdf_paths = []
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                pdf_paths.append(line if os.path.isabs(line) else os.path.join(base_dir, line))
+    return pdf_paths
+
+
+def output_dirs(pdf_paths, output_root):
+    """One output folder per PDF, named after it; duplicate names get a path hash suffix"""
+    stems = [os.path.splitext(os.path.basename(path))[0] for path in pdf_paths]
+    dirs = {}
+    for path, stem in zip(pdf_paths, stems):
+        if stems.count(stem) > 1:
+            stem = f"{stem}-{hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]}"
+        dirs[path] = os.path.join(output_root, stem)
+    return dirs
+
+
+def source_signature(pdf_path):
+    stat = os.stat(pdf_path)
+    return {"size": stat.st_size, "mtime": int(stat.st_mtime)}
+
+
+def is_complete(pdf_path, output_dir, annotate):
+    """Whether a previous run already wrote every requested output for this exact file"""
+    try:
+        with open(os.path.join(output_dir, 'done.json'), 'r', encoding='utf-8') as f:
+            done = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if done.get("source") != source_signature(pdf_path):
+        return False
+    return not annotate or os.path.exists(os.path.join(output_dir, 'output.pdf'))
+
+
+def write_atomic(path, write):
+    """Write a file through a temporary name so a crash never leaves a partial output"""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def index_pdf(indexer, pdf_path, output_dir, annotate=False, search_db=None):
+    """Index one PDF into output_dir (and into the search index at search_db); returns its record"""
+    start = time.perf_counter()
+    os.makedirs(output_dir, exist_ok=True)
+    work_dir = os.path.join(output_dir, '.work')
+    shutil.rmtree(work_dir, ignore_errors=True)
+
+    # Boxes are only drawn (and page JPEGs only encoded) when an annotated PDF is wanted
+    sink = DiskPageSink(work_dir, annotated=True, clean=False) if annotate else None
+    try:
+        result = indexer.process_pdf(pdf_path, work_dir, sink=sink)
+
+        write_atomic(os.path.join(output_dir, 'result.json'),
+                     lambda f: f.write(json.dumps(result["raw_results"], indent=4).encode('utf-8')))
+        index_lines = "".join(f"Page {entry['page']}: {entry['title']}\n" for entry in result["index"])
+        write_atomic(os.path.join(output_dir, 'index.txt'), lambda f: f.write(index_lines.encode('utf-8')))
+        if annotate:
+            output_pdf = os.path.join(output_dir, 'output.pdf')
+            indexer.export_annotated_pdf(pdf_path, result["raw_results"], sink, output_pdf + '.tmp')
+            os.replace(output_pdf + '.tmp', output_pdf)
+        if search_db:
+            # Same book identity as the web app: the PDF's SHA-256
+            SearchIndex(search_db).index_book(hash_file(pdf_path), os.path.basename(pdf_path),
+                                              result["raw_results"])
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    seconds = time.perf_counter() - start
+    record = {
+        "pdf": pdf_path,
+        "output_dir": output_dir,
+        "status": "completed",
+        "pages": result["num_pages"],
+        "index_entries": len(result["index"]),
+        "engine_summary": result["engine_summary"],
+        "seconds": round(seconds, 3),
+        "pages_per_sec": round(result["num_pages"] / seconds, 2) if seconds else None
+    }
+    # Written last: its presence marks the outputs as complete
+    write_atomic(os.path.join(output_dir, 'done.json'),
+                 lambda f: f.write(json.dumps(dict(record, source=source_signature(pdf_path)), indent=4)
+                                   .encode('utf-8')))
+    return record
+
+
+def init_worker(config, num_threads):
+    """Pool initializer: configure and load this process's indexer"""
+    global _indexer
+    limit_threads(num_threads)
+    _indexer = book_indexer_web
+    for name, value in config.items():
+        setattr(_indexer, name, value)
+    _indexer.ocr_workers = num_threads
+    _indexer.intra_op_threads = num_threads
+    # Pool workers can't start shard processes of their own
+    _indexer.shard_workers = 0
+    try:
+        _indexer.load_model()
+    except Exception as e:
+        print(f"Batch worker {os.getpid()} could not load the model: {e}")
+
+
+def run_job(pdf_path, output_dir, annotate, search_db=None):
+    """Index one PDF in a worker; failures are reported in the record instead of raised"""
+    try:
+        return index_pdf(_indexer, pdf_path, output_dir, annotate, search_db)
+    except Exception as e:
+        return {"pdf": pdf_path, "output_dir": output_dir, "status": "failed", "error": str(e)}
+
+
+def run_job_args(args):
+    return run_job(*args)
+
+
+def main(argv=None):
+    global _indexer
+    parser = argparse.ArgumentParser(description="Index a directory or manifest of PDFs without the web app")
+    parser.add_argument('input_dir', nargs='?', default=None, help="Directory searched for PDFs")
+    parser.add_argument('--manifest', default=None, help="Text file listing PDF paths, one per line")
+    parser.add_argument('-o', '--output', default='Output', help="Output root (default: Output)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="PDFs processed concurrently (default: 1)")
+    parser.add_argument('--annotate', action='store_true', help="Also write an annotated output.pdf per PDF")
+    parser.add_argument('--engine', choices=['auto', 'vision', 'heuristic'], default=None,
+                        help="Override BOOKMAP_ENGINE for this run")
+    parser.add_argument('--force', action='store_true', help="Reprocess PDFs whose outputs are already complete")
+    parser.add_argument('--full-text', action='store_true', help="OCR body regions too (BOOKMAP_FULL_TEXT)")
+    parser.add_argument('--search-db', default=None,
+                        help="Add each book's words to this search index (the web app's BOOKMAP_SEARCH_DB)")
+    args = parser.parse_args(argv)
+
+    if args.manifest:
+        pdf_paths = read_manifest(args.manifest)
+    elif args.input_dir:
+        pdf_paths = find_pdfs(args.input_dir)
+    else:
+        parser.error("give an input directory or --manifest")
+
+    indexer = book_indexer_web
+    if args.engine:
+        indexer.engine = args.engine
+    if args.full_text:
+        indexer.full_text = True
+    dirs = output_dirs(pdf_paths, args.output)
+    todo = [path for path in pdf_paths if args.force or not is_complete(path, dirs[path], args.annotate)]
+    records = [{"pdf": path, "output_dir": dirs[path], "status": "skipped"}
+               for path in pdf_paths if path not in todo]
+    print(f"{len(pdf_paths)} PDFs, {len(records)} already complete, {len(todo)} to process with {args.jobs} jobs")
+
+    started_at = time.strftime('%Y-%m-%dT%H:%M:%S')
+    start = time.perf_counter()
+    jobs = [(path, dirs[path], args.annotate, args.search_db) for path in todo]
+
+    if args.jobs <= 1 or not jobs:
+        _indexer = indexer
+        if todo and not indexer.warm_up() and not indexer.can_process():
+            print("Model could not be loaded")
+            return 2
+        outputs = map(run_job_args, jobs)
+        pool = None
+    else:
+        config = dict(indexer.shard_config(), engine=indexer.engine)
+        threads = max(1, (os.cpu_count() or 1) // args.jobs)
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        pool = context.Pool(args.jobs, initializer=init_worker, initargs=(config, threads))
+        outputs = pool.imap_unordered(run_job_args, jobs)
+
+    try:
+        for done, record in enumerate(outputs, start=1):
+            records.append(record)
+            if record["status"] == "completed":
+                print(f"[{done}/{len(jobs)}] {record['pdf']}: {record['pages']} pages in {record['seconds']}s")
+            else:
+                print(f"[{done}/{len(jobs)}] {record['pdf']}: failed - {record['error']}")
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+
+    wall_seconds = time.perf_counter() - start
+    completed = [record for record in records if record["status"] == "completed"]
+    failed = [record for record in records if record["status"] == "failed"]
+    pages = sum(record["pages"] for record in completed)
+    summary = {
+        "started_at": started_at,
+        "jobs": args.jobs,
+        "annotate": args.annotate,
+        "files": len(pdf_paths),
+        "completed": len(completed),
+        "skipped": len(records) - len(completed) - len(failed),
+        "failed": len(failed),
+        "pages": pages,
+        "wall_seconds": round(wall_seconds, 3),
+        "pages_per_sec": round(pages / wall_seconds, 2) if wall_seconds else None,
+        "files_per_hour": round(len(completed) * 3600 / wall_seconds, 1) if wall_seconds else None,
+        "per_file": sorted(records, key=lambda record: record["pdf"])
+    }
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, indent=4)
+    print(f"{len(completed)} completed, {len(failed)} failed, {summary['skipped']} skipped; "
+          f"{pages} pages in {summary['wall_seconds']}s ({summary['pages_per_sec']} pages/sec)")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,445 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Pipeline benchmark
+Times the indexing pipeline stage by stage (text layer, rasterize, detect,
+OCR, draw, index) on the sample PDF and on synthetic scanned books, and
+saves wall time, pages/sec and peak RSS per stage as JSON so runs can be
+compared.
+
+    python benchmark.py                          # sample PDF + 10/100/1000-page books
+    python benchmark.py --stub-model --sizes 10  # no model weights needed
+    python benchmark.py --baseline benchmark_results/old.json
+    python benchmark.py --compare old.json new.json
+    python benchmark.py --sizes 1000 --scaling 1,2,4,8,16,32   # sharded scaling efficiency
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import threading
+import statistics
+import subprocess
+from itertools import islice
+from contextlib import contextmanager
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+import img2pdf
+from book_indexer_web_fixed import BookIndexerWeb, get_rss_mb
+from page_shards import split_shards
+from inference_backends import Boxes, Result
+
+STAGES = ['text_layer', 'rasterize', 'detect', 'ocr', 'draw', 'index', 'end_to_end']
+
+SYNTHETIC_DPI = 100
+WORDS = ("layout model page section header index book chapter learning network "
+         "training data image text detection neural figure table result method").split()
+
+
+class StubModel:
+    """Stand-in for the YOLO model: a fixed page layout, no weights needed
+
+    The boxes line up with the layout of the synthetic pages, so the OCR
+    stage reads real header text.
+    """
+
+    # (class id, x1, y1, x2, y2) as fractions of the page size
+    LAYOUT = [
+        (7, 0.08, 0.06, 0.92, 0.13),   # Section-header
+        (9, 0.08, 0.16, 0.92, 0.88),   # Text
+        (4, 0.40, 0.93, 0.60, 0.97)    # Page-footer
+    ]
+
+    def predict(self, images, verbose=False):
+        results = []
+        for image in images:
+            height, width = image.shape[:2]
+            xyxy = np.array([[x1 * width, y1 * height, x2 * width, y2 * height]
+                             for _, x1, y1, x2, y2 in self.LAYOUT], dtype=np.float32)
+            cls = np.array([class_id for class_id, *_ in self.LAYOUT], dtype=np.float32)
+            conf = np.full(len(self.LAYOUT), 0.9, dtype=np.float32)
+            results.append(Result(Boxes(xyxy, cls, conf)))
+        return results
+
+
+def stub_ocr_regions(image, bboxes, gap=24, word_boxes=False, **kwargs):
+    """Stand-in for BookIndexerWeb.ocr_regions: every region reads "Section", no tesseract needed"""
+    texts = ["Section"] * len(bboxes)
+    if word_boxes:
+        return texts, [[["Section", *bbox]] for bbox in bboxes]
+    return texts
+
+
+def load_font(size):
+    """A scalable font when one is installed, otherwise Pillow's bitmap font"""
+    for name in ('DejaVuSans-Bold.ttf', 'DejaVuSans.ttf', 'Arial.ttf', 'arial.ttf'):
+        try:
+            return ImageFont.truetype(name, size)
+        except OSError:
+            continue
+    return ImageFont.load_default()
+
+
+def page_png_bytes(image):
+    """PNG bytes carrying the synthetic DPI, so img2pdf sizes the page as US Letter"""
+    buffer = io.BytesIO()
+    image.save(buffer, 'PNG', dpi=(SYNTHETIC_DPI, SYNTHETIC_DPI), optimize=False)
+    return buffer.getvalue()
+
+
+def make_synthetic_pdf(pdf_path, num_pages, seed=0):
+    """Write an image-only (scanned) PDF with a section header and body text on every page"""
+    width, height = int(8.5 * SYNTHETIC_DPI), int(11 * SYNTHETIC_DPI)
+    header_font = load_font(36)
+    body_font = load_font(14)
+    rng = random.Random(seed)
+    pages = []
+
+    for page_index in range(num_pages):
+        page = Image.new('L', (width, height), 255)
+        draw = ImageDraw.Draw(page)
+        draw.text((int(0.1 * width), int(0.075 * height)), f"Section {page_index + 1} {rng.choice(WORDS).title()}",
+                  fill=0, font=header_font)
+        y = int(0.17 * height)
+        while y < int(0.86 * height):
+            line = " ".join(rng.choice(WORDS) for _ in range(12))
+            draw.text((int(0.1 * width), y), line, fill=0, font=body_font)
+            y += 22
+        draw.text((int(0.48 * width), int(0.94 * height)), str(page_index + 1), fill=0, font=body_font)
+
+        pages.append(page_png_bytes(page))
+        page.close()
+
+    os.makedirs(os.path.dirname(os.path.abspath(pdf_path)), exist_ok=True)
+    with open(pdf_path, 'wb') as f:
+        f.write(img2pdf.convert(pages))
+    return pdf_path
+
+
+def synthetic_pdf(data_dir, num_pages):
+    """Path of the synthetic book with num_pages pages, generating it on first use"""
+    pdf_path = os.path.join(data_dir, f'synthetic_{num_pages}.pdf')
+    if not os.path.exists(pdf_path):
+        print(f"Generating {pdf_path}...")
+        make_synthetic_pdf(pdf_path, num_pages)
+    return pdf_path
+
+
+class StageTimer:
+    """Accumulates wall time per stage and samples RSS in the background for per-stage peaks"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.seconds = {}
+        self.peak_rss_mb = {}
+        self._current = None
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name='bookmap-bench-rss', daemon=True)
+
+    def __enter__(self):
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._sampler.join()
+
+    def _record_rss(self):
+        stage = self._current
+        if stage is not None:
+            self.peak_rss_mb[stage] = max(self.peak_rss_mb.get(stage, 0.0), get_rss_mb())
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._record_rss()
+
+    @contextmanager
+    def stage(self, name):
+        self._current = name
+        self._record_rss()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self._record_rss()
+            self._current = None
+
+
+def run_stages(indexer, pdf_path, num_pages, timer):
+    """Run the vision pipeline on every page with each stage timed on its own
+
+    Mirrors run_vision_pipeline, one batch at a time, so memory stays bounded
+    by the page window just as it does in production.
+    """
+    with timer.stage('text_layer'):
+        indexer.read_text_layer(pdf_path, num_pages, engine='auto')
+
+    raster_dpi = indexer.detect_dpi or indexer.dpi
+    scale = indexer.dpi / raster_dpi
+    ocr_source = pdf_path if indexer.detect_dpi else None
+    pages = indexer.iter_pdf_pages(pdf_path, num_pages=num_pages, dpi=raster_dpi)
+    results = []
+
+    while True:
+        with timer.stage('rasterize'):
+            batch = list(islice(pages, indexer.batch_size))
+        if not batch:
+            break
+        images = [image for _, image in batch]
+
+        with timer.stage('detect'):
+            page_boxes = indexer.detect_batch(images)
+
+        with timer.stage('ocr'):
+            batch_results = [indexer.build_page_result(image, f'image_{page_index}.jpg', boxes, scale=scale)
+                             for (page_index, image), boxes in zip(batch, page_boxes)]
+            indexer.ocr_section_headers(list(zip(images, batch_results)), ocr_source)
+
+        with timer.stage('draw'):
+            for image, image_results in zip(images, batch_results):
+                indexer.draw_detections(image, image_results["detections"], scale=1 / scale).close()
+
+        results.extend(batch_results)
+        for image in images:
+            image.close()
+
+    with timer.stage('index'):
+        index = indexer.generate_index(results)
+
+    with timer.stage('end_to_end'):
+        indexer.process_pdf(pdf_path, None, num_pages=num_pages, engine='vision', shard_workers=0)
+
+    return len(index)
+
+
+def benchmark_pdf(indexer, pdf_path, repeat=1):
+    """Benchmark one PDF; per stage the median time over the repeats and the highest RSS"""
+    num_pages = indexer.get_page_count(pdf_path)
+    runs = []
+    for _ in range(repeat):
+        with StageTimer() as timer:
+            index_entries = run_stages(indexer, pdf_path, num_pages, timer)
+        runs.append(timer)
+
+    stages = {}
+    for name in STAGES:
+        seconds = statistics.median(run.seconds.get(name, 0.0) for run in runs)
+        stages[name] = {
+            "seconds": round(seconds, 4),
+            "pages_per_sec": round(num_pages / seconds, 2) if seconds > 0 else None,
+            "peak_rss_mb": round(max(run.peak_rss_mb.get(name, 0.0) for run in runs), 1)
+        }
+
+    return {
+        "pdf": os.path.basename(pdf_path),
+        "num_pages": num_pages,
+        "index_entries": index_entries,
+        "stages": stages
+    }
+
+
+def benchmark_scaling(indexer, pdf_path, worker_counts):
+    """End-to-end time per shard worker count; efficiency is the speedup over 1 worker divided by workers
+
+    A 1-worker run is always timed as the baseline, even if worker_counts leaves it out.
+    """
+    num_pages = indexer.get_page_count(pdf_path)
+    if 1 not in worker_counts:
+        worker_counts = [1] + list(worker_counts)
+    timings = []
+    for workers in worker_counts:
+        if workers > 1:
+            # Start the pool and load the workers' models outside the timed run
+            warmup_pages = range(min(num_pages, workers * indexer.page_window))
+            list(indexer.get_shard_pool(workers).run(pdf_path, split_shards(warmup_pages, workers)))
+        start = time.perf_counter()
+        result = indexer.process_pdf(pdf_path, None, num_pages=num_pages, engine='vision', shard_workers=workers)
+        timings.append((workers, time.perf_counter() - start, result))
+    baseline_seconds = next(seconds for workers, seconds, _ in timings if workers == 1)
+    rows = []
+    for workers, seconds, result in timings:
+        speedup = baseline_seconds / seconds
+        rows.append({
+            "workers": workers,
+            "seconds": round(seconds, 3),
+            "pages_per_sec": round(num_pages / seconds, 2),
+            "speedup": round(speedup, 2),
+            "efficiency": round(speedup / workers, 3),
+            # Share of the workers' time spent busy, as measured by the sharded pipeline
+            "worker_utilization": (result.get("shards") or {}).get("scaling_efficiency")
+        })
+    return rows
+
+
+def package_version(name):
+    try:
+        from importlib.metadata import version
+        return version(name)
+    except Exception:
+        return None
+
+
+def tool_version(command):
+    """First line a command-line tool prints about its version"""
+    try:
+        completed = subprocess.run(command, capture_output=True, text=True, timeout=10)
+        output = (completed.stdout or completed.stderr).strip()
+        return output.splitlines()[0] if output else None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment_info():
+    """Library and tool versions, so a slowdown can be tied to an upgrade"""
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "packages": {name: package_version(name) for name in
+                     ('Pillow', 'numpy', 'pdf2image', 'pytesseract', 'ultralytics', 'torch', 'pypdf')},
+        "poppler": tool_version(['pdftoppm', '-v']),
+        "tesseract": tool_version(['tesseract', '--version'])
+    }
+
+
+def compare_results(baseline, current, max_regression=0.10):
+    """Print per-stage pages/sec changes; returns the (pdf, stage) pairs that regressed"""
+    baseline_runs = {run["pdf"]: run for run in baseline["runs"]}
+    regressions = []
+    print(f"{'PDF':<28} {'Stage':<12} {'Baseline':>10} {'Current':>10} {'Change':>8}")
+
+    for run in current["runs"]:
+        old_run = baseline_runs.get(run["pdf"])
+        if old_run is None:
+            continue
+        for name, stage in run["stages"].items():
+            old_stage = old_run["stages"].get(name)
+            if not old_stage or not old_stage["pages_per_sec"] or not stage["pages_per_sec"]:
+                continue
+            change = stage["pages_per_sec"] / old_stage["pages_per_sec"] - 1
+            flag = ''
+            if change < -max_regression:
+                regressions.append((run["pdf"], name))
+                flag = '  <-- slower'
+            print(f"{run['pdf']:<28} {name:<12} {old_stage['pages_per_sec']:>10} "
+                  f"{stage['pages_per_sec']:>10} {change:>+8.1%}{flag}")
+
+    return regressions
+
+
+def print_report(run):
+    print(f"\n{run['pdf']} ({run['num_pages']} pages, {run['index_entries']} index entries)")
+    print(f"  {'Stage':<12} {'Seconds':>10} {'Pages/sec':>10} {'Peak RSS MB':>12}")
+    for name, stage in run["stages"].items():
+        print(f"  {name:<12} {stage['seconds']:>10} {stage['pages_per_sec'] or '-':>10} {stage['peak_rss_mb']:>12}")
+
+
+def print_scaling(run):
+    print(f"  {'Workers':<8} {'Seconds':>10} {'Pages/sec':>10} {'Speedup':>8} {'Efficiency':>10}")
+    for row in run["scaling"]:
+        print(f"  {row['workers']:<8} {row['seconds']:>10} {row['pages_per_sec']:>10} "
+              f"{row['speedup']:>8} {row['efficiency']:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the BookMap indexing pipeline stage by stage")
+    parser.add_argument('--pdf', action='append', default=None,
+                        help="PDF to benchmark (repeatable; default: Input/IntroductionChapter.pdf)")
+    parser.add_argument('--sizes', default='10,100,1000',
+                        help="Page counts of the synthetic books, comma separated ('' for none)")
+    parser.add_argument('--data-dir', default='benchmark_data', help="Where synthetic PDFs are generated")
+    parser.add_argument('--output', default=None,
+                        help="Results JSON (default: benchmark_results/bench-<timestamp>.json)")
+    parser.add_argument('--stub-model', action='store_true',
+                        help="Use a fixed-layout stand-in instead of the yolov8x-doclaynet.pt weights")
+    parser.add_argument('--stub-ocr', action='store_true',
+                        help="Skip tesseract and return fixed header text")
+    parser.add_argument('--page-filter', action='store_true',
+                        help="Keep the blank/duplicate page filter and the per-page cache on; off by default "
+                             "so repeated runs over the same pages time inference, not cache hits and skips")
+    parser.add_argument('--scaling', default=None,
+                        help="Also time sharded processing with these worker counts, e.g. 2,4,8; "
+                             "1 worker is always timed as the baseline")
+    parser.add_argument('--repeat', type=int, default=1, help="Runs per PDF; the median is reported")
+    parser.add_argument('--baseline', default=None, help="Results JSON to compare this run against")
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help="Only compare two saved results files")
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help="Fractional pages/sec drop that counts as a regression (default: 0.10)")
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        with open(args.compare[0], 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        with open(args.compare[1], 'r', encoding='utf-8') as f:
+            current = json.load(f)
+        return 1 if compare_results(baseline, current, args.max_regression) else 0
+
+    if not args.page_filter:
+        # Set in the environment so spawned shard workers, which keep their own page cache, see it too
+        os.environ['BOOKMAP_PAGE_FILTER'] = 'false'
+        os.environ['BOOKMAP_PAGE_CACHE_SIZE'] = '0'
+    indexer = BookIndexerWeb()
+    if args.stub_model:
+        indexer.model = StubModel()
+        indexer.model_fingerprint = 'stub'
+    elif not indexer.load_model():
+        print("Model weights not found; run with --stub-model to benchmark without them")
+        return 2
+    if args.stub_ocr:
+        indexer.ocr_regions = stub_ocr_regions
+    if args.stub_model or args.stub_ocr:
+        # Shard workers must inherit the stubs rather than load the real model
+        indexer.shard_start_method = 'fork'
+    worker_counts = [int(n) for n in (args.scaling or '').split(',') if n.strip()]
+
+    pdf_paths = list(args.pdf or [os.path.join('Input', 'IntroductionChapter.pdf')])
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    pdf_paths.extend(synthetic_pdf(args.data_dir, size) for size in sizes)
+
+    report = {
+        "created_at": time.strftime('%Y-%m-%dT%H:%M:%S'),
+        "environment": environment_info(),
+        "config": {
+            "stub_model": args.stub_model,
+            "stub_ocr": args.stub_ocr,
+            "page_filter": args.page_filter,
+            "repeat": args.repeat,
+            "pipeline": indexer.pipeline_config(),
+            "page_window": indexer.page_window,
+            "batch_size": indexer.batch_size,
+            "ocr_workers": indexer.ocr_workers
+        },
+        "runs": []
+    }
+
+    for pdf_path in pdf_paths:
+        run = benchmark_pdf(indexer, pdf_path, args.repeat)
+        print_report(run)
+        if worker_counts:
+            run["scaling"] = benchmark_scaling(indexer, pdf_path, worker_counts)
+            print_scaling(run)
+        report["runs"].append(run)
+
+    output = args.output or os.path.join('benchmark_results', f"bench-{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        print()
+        if compare_results(baseline, report, args.max_regression):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,20 +1,210 @@
 # -*- coding: utf-8 -*-
 """
 BookMap Web - Minimal version for deployment
-This version provides basic functionality without heavy ML dependencies
+A heuristic layout engine that needs neither PyTorch nor the layout model:
+pages are binarized and segmented into text lines and blocks with NumPy
+projection profiles, and section headers are picked out by glyph height,
+stroke weight and the whitespace around them. It is the fallback indexer
+when the ML stack isn't installed, the 'heuristic' engine tier of
+BookIndexerWeb, and its pre-screen for pages without headers.
 """
 
 import os
-import json
 import re
-import shutil
-from PIL import Image, ImageDraw, ImageFont
-from pdf2image import convert_from_path
-import pytesseract
+import numpy as np
+from PIL import Image, ImageDraw
+from pdf2image import convert_from_path, pdfinfo_from_path
+
+try:
+    import pytesseract
+except ImportError:  # Optional: without Tesseract, headers are found but left untitled
+    pytesseract = None
+
+
+def otsu_threshold(gray):
+    """Grey level that best separates ink from paper (Otsu's method on the histogram)"""
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    weight = np.cumsum(hist)
+    mass = np.cumsum(hist * np.arange(256))
+    background = weight[-1] - weight
+    with np.errstate(divide='ignore', invalid='ignore'):
+        between = (mass[-1] * weight - mass * weight[-1]) ** 2 / (weight * background)
+    between[~np.isfinite(between)] = 0
+    return int(np.argmax(between))
+
+
+def find_runs(mask):
+    """(start, end) index pairs of the True runs in a 1-D boolean array"""
+    edges = np.diff(np.concatenate(([0], mask.view(np.int8), [0])))
+    return np.stack([np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)], axis=1)
+
+
+def close_gaps(mask, gap):
+    """Fill False runs of at most gap elements that lie between True runs"""
+    closed = mask.copy()
+    for start, end in find_runs(~mask):
+        if end - start <= gap and start > 0 and end < len(mask):
+            closed[start:end] = True
+    return closed
+
+
+class HeuristicLayoutEngine:
+    """Text lines, blocks and section headers from projection profiles
+
+    detect(image) returns (xyxy, class ids, confidences) like the model path's
+    boxes_from_result, in the image's pixel coordinates; the confidence of a
+    header is its header score.
+    """
+
+    def __init__(self, class_names, header_threshold=0.45, analysis_width=900, margin=0.07,
+                 body_points=11, min_body_lines=3):
+        self.class_names = class_names
+        self.header_threshold = header_threshold
+        # Pages are shrunk to about this width before analysis (~100 DPI for a letter page)
+        self.analysis_width = analysis_width
+        # Fraction of the page height at the top and bottom treated as running header / footer
+        self.margin = margin
+        # Pages with fewer body lines than this (chapter openers, part titles) have no body text
+        # to compare glyph heights with, so they are also measured against body_points type
+        self.body_points = body_points
+        self.min_body_lines = min_body_lines
+
+    def binarize(self, image):
+        """Boolean ink mask of a downscaled page and the downscale factor"""
+        factor = max(1, int(round(image.width / self.analysis_width)))
+        gray = image.convert('L')
+        if factor > 1:
+            gray = gray.reduce(factor)
+        gray = np.asarray(gray, dtype=np.uint8)
+        threshold = otsu_threshold(gray)
+        # A blank page has no bimodal histogram; only clearly dark pixels count as ink
+        return gray < min(threshold, 200), factor
+
+    def find_lines(self, ink):
+        """Text lines as a structured list of features, top to bottom"""
+        height, width = ink.shape
+        row_ink = ink.sum(axis=1)
+        rows = close_gaps(row_ink > max(1, width // 500), gap=2)
+        lines = []
+        for y0, y1 in find_runs(rows):
+            band = ink[y0:y1]
+            columns = np.flatnonzero(band.any(axis=0))
+            if len(columns) == 0:
+                continue
+            x0, x1 = int(columns[0]), int(columns[-1]) + 1
+            band = band[:, x0:x1]
+            pixels = int(band.sum())
+            # Horizontal stroke width: ink pixels per run of ink along each row; bold type is wider
+            strokes = int(np.count_nonzero(np.diff(band.view(np.int8), axis=1) == 1) + band[:, 0].sum())
+            lines.append({
+                "bbox": [x0, int(y0), x1, int(y1)],
+                "height": int(y1 - y0),
+                "width": x1 - x0,
+                "density": pixels / float(band.size),
+                "stroke": pixels / float(max(strokes, 1))
+            })
+        for previous, line in zip([None] + lines[:-1], lines):
+            line["gap_above"] = line["bbox"][1] - previous["bbox"][3] if previous else line["bbox"][1]
+        return lines
+
+    def score_headers(self, lines, nominal_height=None):
+        """Header score in [0, 1] per line, relative to the page's body text
+
+        nominal_height is the line height of body-size type in the analysed
+        image; on a page with little body text, glyph height is also scored
+        against it.
+        """
+        body = [line for line in lines if line["height"] < 4 * np.median([l["height"] for l in lines])]
+        body_height = float(np.median([line["height"] for line in body]))
+        body_stroke = float(np.median([line["stroke"] for line in body]))
+        body_gap = float(np.median([line["gap_above"] for line in body[1:]])) if len(body) > 2 else body_height
+        text_width = max(line["bbox"][2] for line in body) - min(line["bbox"][0] for line in body)
+
+        heights = np.array([line["height"] for line in lines], dtype=np.float64)
+        strokes = np.array([line["stroke"] for line in lines], dtype=np.float64)
+        gaps = np.array([line["gap_above"] for line in lines], dtype=np.float64)
+        widths = np.array([line["width"] for line in lines], dtype=np.float64)
+
+        size = np.clip((heights / body_height - 1.0) / 0.6, 0, 1)
+        if nominal_height and len(body) < self.min_body_lines:
+            size = np.maximum(size, np.clip((heights / nominal_height - 1.0) / 0.6, 0, 1))
+        weight = np.clip((strokes / body_stroke - 1.0) / 0.35, 0, 1)
+        space = np.clip((gaps / max(body_gap, 1.0) - 1.0) / 2.0, 0, 1)
+        short = np.clip((0.85 - widths / max(text_width, 1)) / 0.5, 0, 1)
+        scores = 0.4 * size + 0.3 * weight + 0.2 * space + 0.1 * short
+
+        # Too small to be a heading (page numbers, stray marks) or a picture rather than type
+        scores[(widths < 2 * heights) | (heights > 4 * body_height)] = 0
+        return scores, body_height
+
+    def analyze(self, image, dpi=None):
+        """Detections of one page and its best header score (0 when nothing looks like a header)
+
+        dpi is the image's resolution; without it the page is taken to be 8.5 inches wide.
+        """
+        ink, factor = self.binarize(image)
+        nominal_height = self.body_points / 72.0 * (dpi or image.width / 8.5) / factor
+        lines = self.find_lines(ink)
+        label_ids = {name: i for i, name in enumerate(self.class_names)}
+        boxes, labels, confidences = [], [], []
+        best_score = 0.0
+
+        if lines:
+            page_height = ink.shape[0]
+            scores, body_height = self.score_headers(lines, nominal_height)
+            block = None
+
+            def close_block():
+                if block:
+                    boxes.append(block)
+                    labels.append(label_ids["Text"])
+                    confidences.append(0.5)
+
+            for line, score in zip(lines, scores.tolist()):
+                x0, y0, x1, y1 = line["bbox"]
+                in_margin = y1 < self.margin * page_height or y0 > (1 - self.margin) * page_height
+                if line["height"] > 4 * body_height and line["density"] > 0.2:
+                    label, confidence = "Picture", 0.5
+                elif in_margin and line["height"] <= 1.5 * body_height:
+                    label = "Page-header" if y1 < self.margin * page_height else "Page-footer"
+                    confidence = 0.5
+                elif score >= self.header_threshold:
+                    label, confidence = "Section-header", score
+                    best_score = max(best_score, score)
+                else:
+                    best_score = max(best_score, score)
+                    # Body lines close enough together form one Text block
+                    if block and line["gap_above"] <= 1.8 * body_height:
+                        block = [min(block[0], x0), block[1], max(block[2], x1), y1]
+                    else:
+                        close_block()
+                        block = [x0, y0, x1, y1]
+                    continue
+
+                close_block()
+                block = None
+                # A heading wrapped onto a second line of the same size continues the previous box
+                if (label == "Section-header" and labels and labels[-1] == label_ids[label]
+                        and line["gap_above"] <= 1.0 * line["height"]):
+                    previous = boxes[-1]
+                    boxes[-1] = [min(previous[0], x0), previous[1], max(previous[2], x1), y1]
+                    confidences[-1] = max(confidences[-1], confidence)
+                else:
+                    boxes.append([x0, y0, x1, y1])
+                    labels.append(label_ids[label])
+                    confidences.append(confidence)
+            close_block()
+
+        xyxy = np.array(boxes, dtype=np.int32).reshape(-1, 4) * factor
+        return (xyxy, np.array(labels, dtype=np.int32), np.array(confidences, dtype=np.float32)), best_score
+
+    def detect(self, image, dpi=None):
+        return self.analyze(image, dpi)[0]
+
 
 class BookIndexerMinimal:
-    """Minimal book indexer for web application"""
-    
+    """Book indexer built on the heuristic layout engine; no ML dependencies"""
+
     def __init__(self):
         """Initialize with basic configuration"""
         self.class_names = [
@@ -34,181 +224,131 @@ class BookIndexerMinimal:
             "Text": [0, 128, 0],
             "Title": [128, 128, 128]
         }
-    
-    def get_mock_section_header(self, page_num):
-        """Generate mock section headers based on page number"""
-        mock_headers = [
-            "Introduction",
-            "Overview",
-            "Getting Started",
-            "Basic Concepts",
-            "Advanced Topics",
-            "Implementation",
-            "Examples",
-            "Best Practices",
-            "Troubleshooting",
-            "Conclusion"
-        ]
-        return mock_headers[page_num % len(mock_headers)]
-    
+        self.dpi = 200
+        self.page_window = int(os.environ.get('BOOKMAP_PAGE_WINDOW', 4))
+        self.layout_engine = HeuristicLayoutEngine(self.class_names)
+
     def clean_text(self, text):
         """Clean extracted text"""
         if not text:
             return ""
-        
+
         # Remove extra whitespace and normalize
         text = re.sub(r'\s+', ' ', text.strip())
-        
+
         # Remove special characters but keep basic punctuation
         text = re.sub(r'[^\w\s\.\,\!\?\;\:\-\(\)]', '', text)
-        
+
         return text
-    
-    def process_pdf(self, pdf_path, temp_base_dir, progress_callback=None):
-        """Process PDF with minimal functionality"""
+
+    def iter_pdf_pages(self, pdf_path, num_pages):
+        """Yield (page index, PIL image), rasterizing page_window pages at a time"""
+        for first in range(0, num_pages, self.page_window):
+            last = min(first + self.page_window, num_pages)
+            images = convert_from_path(pdf_path, dpi=self.dpi, first_page=first + 1, last_page=last)
+            for offset, image in enumerate(images):
+                yield first + offset, image
+
+    def read_header(self, image, bbox):
+        """OCR one header line"""
+        if pytesseract is None:
+            return ""
+        crop = image.crop(tuple(int(v) for v in bbox)).convert('L')
+        if crop.width == 0 or crop.height == 0:
+            return ""
+        # Single text line; a little padding helps Tesseract with tight crops
+        padded = Image.new('L', (crop.width + 20, crop.height + 20), 255)
+        padded.paste(crop, (10, 10))
         try:
-            # Create temporary directories
-            converted_images_folder = os.path.join(temp_base_dir, 'converted')
-            processed_images_folder = os.path.join(temp_base_dir, 'processed')
-            
-            os.makedirs(converted_images_folder, exist_ok=True)
-            os.makedirs(processed_images_folder, exist_ok=True)
-            
-            # Convert PDF to images
-            if progress_callback:
-                progress_callback(10, "Converting PDF to images...")
-            
-            images = convert_from_path(pdf_path, dpi=200)
-            num_pages = len(images)
-            
-            # Save converted images
-            for i, image in enumerate(images):
-                image_path = os.path.join(converted_images_folder, f'image_{i}.jpg')
-                image.save(image_path, 'JPEG', quality=85)
-            
+            return self.clean_text(pytesseract.image_to_string(padded, config='--psm 7'))
+        except Exception as e:
+            print(f"OCR failed for header at {bbox}: {e}")
+            return ""
+
+    def process_page(self, image, page_index):
+        """raw_results entry for one page"""
+        xyxy, class_ids, confidences = self.layout_engine.detect(image, self.dpi)
+        detections = []
+        for bbox, class_id, confidence in zip(xyxy.tolist(), class_ids.tolist(), confidences.tolist()):
+            label = self.class_names[class_id]
+            detections.append({
+                "label": label,
+                "bbox": bbox,
+                "text": self.read_header(image, bbox) if label == "Section-header" else "",
+                "confidence": round(confidence, 4)
+            })
+        return {"image": f'image_{page_index}.jpg', "detections": detections}
+
+    def process_pdf(self, pdf_path, temp_base_dir=None, progress_callback=None):
+        """Process PDF with the heuristic layout engine; pages stay in memory"""
+        try:
+            num_pages = int(pdfinfo_from_path(pdf_path)["Pages"])
             if progress_callback:
-                progress_callback(30, "Processing images...")
-            
-            # Process images with mock detection
-            results = self.process_images_minimal(converted_images_folder, processed_images_folder, progress_callback)
-            
+                progress_callback(10, "Analyzing page layout...")
+
+            results = []
+            for page_index, image in self.iter_pdf_pages(pdf_path, num_pages):
+                results.append(self.process_page(image, page_index))
+                image.close()
+                if progress_callback:
+                    progress_callback(10 + int(80 * len(results) / num_pages),
+                                      f"Processed {len(results)} of {num_pages} pages...")
+
             if progress_callback:
                 progress_callback(90, "Generating index...")
-            
+
             # Generate index
             index = self.generate_index(results)
-            
+
             if progress_callback:
                 progress_callback(100, "Processing complete!")
-            
+
             return {
                 "index": index,
                 "raw_results": results,
-                "num_pages": num_pages
+                "num_pages": num_pages,
+                "page_engines": ['heuristic'] * num_pages,
+                "engine_summary": {"heuristic": num_pages}
             }
-            
+
         except Exception as e:
             raise Exception(f"Error processing PDF: {e}")
-    
-    def process_images_minimal(self, input_folder, output_folder, progress_callback=None):
-        """Process images with mock detection"""
-        results = []
-        image_files = [f for f in os.listdir(input_folder) if f.endswith('.jpg')]
-        
-        for i, filename in enumerate(image_files):
-            if progress_callback:
-                progress = 30 + (i / len(image_files)) * 50
-                progress_callback(progress, f"Processing page {i+1}...")
-            
-            image_path = os.path.join(input_folder, filename)
-            image = Image.open(image_path)
-            
-            # Create mock detections
-            mock_detections = self.create_mock_detections(image, i)
-            
-            # Draw mock detections on image
-            processed_image = self.draw_detections(image, mock_detections)
-            
-            # Save processed image
-            output_path = os.path.join(output_folder, filename)
-            processed_image.save(output_path, 'JPEG', quality=85)
-            
-            results.append({
-                "filename": filename,
-                "detections": mock_detections
-            })
-        
-        return results
-    
-    def create_mock_detections(self, image, page_num):
-        """Create mock detections for demonstration"""
-        width, height = image.size
-        
-        # Create mock section headers
-        detections = []
-        
-        # Add a mock section header
-        section_header = {
-            "class": "Section-header",
-            "confidence": 0.95,
-            "bbox": [50, 50, width-50, 100],
-            "text": self.get_mock_section_header(page_num)
-        }
-        detections.append(section_header)
-        
-        # Add mock text blocks
-        for i in range(3):
-            y_start = 120 + (i * 150)
-            y_end = y_start + 100
-            text_block = {
-                "class": "Text",
-                "confidence": 0.85,
-                "bbox": [50, y_start, width-50, y_end],
-                "text": f"Sample text content for page {page_num + 1}, paragraph {i + 1}."
-            }
-            detections.append(text_block)
-        
-        return detections
-    
+
     def draw_detections(self, image, detections):
-        """Draw detections on image"""
+        """Draw detections on a copy of the image"""
+        image = image.convert('RGB')
         draw = ImageDraw.Draw(image)
-        
+
         for detection in detections:
-            class_name = detection["class"]
+            label = detection["label"]
             bbox = detection["bbox"]
-            confidence = detection["confidence"]
-            
+
             # Get color for this class
-            color = tuple(self.class_colors.get(class_name, [255, 255, 255]))
-            
+            color = tuple(self.class_colors.get(label, [255, 255, 255]))
+
             # Draw bounding box
             draw.rectangle(bbox, outline=color, width=2)
-            
+
             # Draw label
-            label = f"{class_name}: {confidence:.2f}"
-            draw.text((bbox[0], bbox[1] - 20), label, fill=color)
-        
+            draw.text((bbox[0], bbox[1] - 12), f"{label}: {detection.get('confidence', 0):.2f}", fill=color)
+
         return image
-    
+
     def generate_index(self, results):
-        """Generate index from results"""
+        """Index entries (page, title), keeping the first page each title appears on"""
         index = []
-        
+        seen = set()
+
         for result in results:
-            filename = result["filename"]
-            page_num = int(filename.split("_")[1].split(".")[0]) + 1
-            
+            page_num = int(result["image"].split("_")[1].split(".")[0]) + 1
+
             for detection in result["detections"]:
-                if detection["class"] == "Section-header":
-                    section_text = detection["text"]
-                    if section_text:
-                        index.append({
-                            "page": page_num,
-                            "section": section_text,
-                            "confidence": detection["confidence"]
-                        })
-        
+                if detection["label"] == "Section-header" and detection["text"]:
+                    key = detection["text"].lower()
+                    if key not in seen:
+                        seen.add(key)
+                        index.append({"page": page_num, "title": detection["text"]})
+
         return index
 
 # Global instance
@@ -7,17 +7,139 @@ Based on the original book_indexer.py from https://github.com/pranavdhawann/Book
 import os
 import json
 import re
+import io
+import time
 import shutil
+import subprocess
+import bisect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
-from ultralytics import YOLO
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 import img2pdf
 import pytesseract
+from page_sinks import make_page_sink
+from result_cache import hash_file, hash_config, PageResultCache
+from pdf_text_layer import PdfTextLayer
+from metrics import registry
+from inference_backends import BACKENDS, make_backend
+from page_shards import ShardPool, split_shards
+from book_indexer_minimal import HeuristicLayoutEngine
+from page_filter import PageFilter
+
+try:
+    from ultralytics import YOLO
+except ImportError:  # Optional: without it scanned pages go through the heuristic layout engine
+    YOLO = None
+
+try:
+    import resource
+except ImportError:  # Windows has no resource module
+    resource = None
+
+
+def get_rss_mb():
+    """Return the current resident set size of this process in MB"""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    if resource is not None:
+        # No /proc (macOS): fall back to the lifetime high-water mark
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        divisor = 1024 * 1024 if os.uname().sysname == 'Darwin' else 1024
+        return max_rss / divisor
+    return 0.0
+
+
+def to_numpy(values):
+    """Convert a model output tensor (or array-like) to a NumPy array"""
+    if hasattr(values, 'cpu'):
+        values = values.cpu()
+    if hasattr(values, 'numpy'):
+        return values.numpy()
+    return np.asarray(values)
+
+
+def reading_order(bboxes, page_width):
+    """Indices of a page's boxes in reading order
+    
+    Boxes wider than about half the page split it into bands read top to
+    bottom; within a band the left column is read before the right one.
+    """
+    wide = [x2 - x1 > 0.55 * page_width for x1, _, x2, _ in bboxes]
+    band_tops = sorted(bbox[1] for bbox, is_wide in zip(bboxes, wide) if is_wide)
+    
+    def key(i):
+        x1, y1, x2, _ = bboxes[i]
+        band = bisect.bisect_right(band_tops, y1)
+        column = -1 if wide[i] else int((x1 + x2) / 2 >= page_width / 2)
+        return band, column, y1, x1
+    
+    return sorted(range(len(bboxes)), key=key)
+
+
+class IncrementalIndex:
+    """Sorted, de-duplicated index that can be fed one page at a time
+    
+    Matches generate_index: entries are ordered by (page, title) and each title
+    is kept only at its first page, whatever order pages arrive in.
+    """
+    
+    def __init__(self):
+        self._entries = []
+        self._by_name = {}
+        self.pages_done = 0
+    
+    def add(self, index_entries):
+        """Add (page, title) pairs; returns True if the visible index changed"""
+        changed = False
+        for page, text in index_entries:
+            name = text.strip()
+            entry = (page, text)
+            current = self._by_name.get(name)
+            if current is not None:
+                if entry >= current:
+                    continue
+                del self._entries[bisect.bisect_left(self._entries, current)]
+            bisect.insort(self._entries, entry)
+            self._by_name[name] = entry
+            changed = True
+        return changed
+    
+    def add_page(self, index_entries):
+        """Add one finished page's entries"""
+        self.pages_done += 1
+        return self.add(index_entries)
+    
+    def to_list(self):
+        return [{"page": page, "title": text} for page, text in self._entries]
+
+
+# Bump when a change alters the detections or index produced for the same input
+PIPELINE_VERSION = 2
+
+# Regions read in full-text mode (headers are always read)
+FULL_TEXT_LABELS = ("Title", "Section-header", "Text", "List-item", "Caption", "Footnote")
+
+# Hot-path instrumentation, exposed on /metrics
+STAGE_SECONDS = registry.histogram('bookmap_stage_seconds_per_page',
+                                   'Time spent per page in each pipeline stage', ['stage'])
+PAGES_TOTAL = registry.counter('bookmap_pages_total', 'Pages processed, by the engine that indexed them', ['engine'])
+DETECTIONS_TOTAL = registry.counter('bookmap_detections_total', 'Layout model detections by class label', ['label'])
+OCR_FAILURES_TOTAL = registry.counter('bookmap_ocr_failures_total', 'Pages whose section-header OCR raised an error')
+OCR_FALLBACKS_TOTAL = registry.counter('bookmap_ocr_fallbacks_total',
+                                       'Section headers given fallback text after an OCR failure')
+PAGE_CACHE_HITS_TOTAL = registry.counter('bookmap_page_cache_hits_total',
+                                         'Scanned pages whose detections came from the per-page cache')
 
 class BookIndexerWeb:
     """Book indexer for web application - matches original implementation"""
     
-    def __init__(self):
+    def __init__(self, page_window=None, batch_size=None, ocr_workers=None, engine=None):
         """Initialize with the same configuration as original"""
         self.class_names = [
             "Caption", "Footnote", "Formula", "List-item", "Page-footer",
@@ -37,13 +159,85 @@ class BookIndexerWeb:
             "Title": [128, 128, 128]
         }
         self.model = None
+        self.model_fingerprint = None
+        # 'ultralytics' runs the PyTorch weights; 'onnx' / 'openvino' run an exported graph on CPU
+        self.backend = os.environ.get('BOOKMAP_BACKEND', 'ultralytics')
+        if self.backend not in BACKENDS:
+            raise Exception(f"Unknown inference backend: {self.backend}")
+        self.model_path = os.environ.get('BOOKMAP_MODEL_PATH') or self.default_model_path()
+        # Intra-op threads of the exported-model backends (default: all cores)
+        self.intra_op_threads = int(os.environ.get('BOOKMAP_INTRA_OP_THREADS', 0)) or None
+        # Seconds spent loading the weights and on the warm-up inference (None until done)
+        self.model_load_seconds = None
+        self.warmup_seconds = None
+        # Pages rasterized per poppler call; bounds peak memory for long books
+        self.page_window = page_window or int(os.environ.get('BOOKMAP_PAGE_WINDOW', 4))
+        # Pages per model.predict call
+        self.batch_size = batch_size or int(os.environ.get('BOOKMAP_BATCH_SIZE', 8))
+        # The model object is shared by all job workers and is not thread-safe
+        self._predict_lock = threading.Lock()
+        # Concurrent tesseract invocations (one per page) in the OCR stage
+        self.ocr_workers = ocr_workers or int(os.environ.get('BOOKMAP_OCR_WORKERS', 0)) or os.cpu_count() or 1
+        self._ocr_pool = None
+        self._ocr_pool_lock = threading.Lock()
+        # Resolution pages are rendered at (pdf2image's default); raw_results bboxes are in these pixels
+        self.dpi = 200
+        # Two-resolution mode: detect on pages rendered at detect_dpi and OCR header regions
+        # re-rendered from the PDF at ocr_dpi. Off (None) renders everything at dpi.
+        self.detect_dpi = int(os.environ.get('BOOKMAP_DETECT_DPI', 0)) or None
+        self.ocr_dpi = int(os.environ.get('BOOKMAP_OCR_DPI', 300))
+        # 'auto' tries the PDF's outline/text layer before the model; 'vision' always uses the model
+        self.engine = engine or os.environ.get('BOOKMAP_ENGINE', 'auto')
+        if self.backend == 'ultralytics' and YOLO is None and self.engine != 'heuristic':
+            print(f"ultralytics is not installed; using the heuristic engine instead of '{self.engine}'")
+            self.engine = 'heuristic'
+        # Projection-profile layout analysis: the 'heuristic' engine, and the optional pre-screen
+        self.layout_engine = HeuristicLayoutEngine(self.class_names)
+        # Pre-screen: scanned pages whose best heuristic header score is below the threshold skip the model
+        self.prescreen = os.environ.get('BOOKMAP_PRESCREEN', 'false').lower() == 'true'
+        self.prescreen_threshold = float(os.environ.get('BOOKMAP_PRESCREEN_THRESHOLD', 0.25))
+        # Pre-filter: blank pages and repeats of an earlier page skip detection
+        self.page_filter = os.environ.get('BOOKMAP_PAGE_FILTER', 'true').lower() == 'true'
+        self.blank_ink = float(os.environ.get('BOOKMAP_BLANK_INK', 0.0002))
+        self.duplicate_bits = int(os.environ.get('BOOKMAP_DUPLICATE_BITS', 0))
+        # Final detections of recently seen pages, reused when the same page is uploaded again
+        self.page_cache = PageResultCache(int(os.environ.get('BOOKMAP_PAGE_CACHE_SIZE', 5000)))
+        self.text_layer = PdfTextLayer(dpi=self.dpi)
+        # Full-text mode: OCR body regions as well as headers, with word boxes for /search
+        self.full_text = os.environ.get('BOOKMAP_FULL_TEXT', 'false').lower() == 'true'
+        # Sharded mode: books with at least shard_min_pages scanned pages are split across
+        # shard_workers processes (0 or 1 keeps everything in this process)
+        self.shard_workers = int(os.environ.get('BOOKMAP_SHARD_WORKERS', 0))
+        self.shard_min_pages = int(os.environ.get('BOOKMAP_SHARD_MIN_PAGES', 32))
+        self.shard_start_method = os.environ.get('BOOKMAP_SHARD_START_METHOD') or None
+        self._shard_pools = {}
+        self._shard_pools_lock = threading.Lock()
+    
+    def default_model_path(self):
+        """Where export_model.py writes the weights for the configured backend"""
+        if self.backend == 'onnx':
+            return 'yolov8x-doclaynet.onnx'
+        if self.backend == 'openvino':
+            return os.path.join('yolov8x-doclaynet_openvino_model', 'yolov8x-doclaynet.xml')
+        return 'yolov8x-doclaynet.pt'
     
     def load_model(self):
-        """Load the YOLO model - same as original"""
+        """Load the YOLO model, or its exported ONNX/OpenVINO graph for those backends"""
         try:
-            model_path = 'yolov8x-doclaynet.pt'
+            model_path = self.model_path
             if os.path.exists(model_path):
-                self.model = YOLO(model_path)
+                if self.backend == 'ultralytics':
+                    if YOLO is None:
+                        print("ultralytics is not installed; export the model and set BOOKMAP_BACKEND to onnx or openvino")
+                        return False
+                    self.model = YOLO(model_path)
+                else:
+                    self.model = make_backend(self.backend, model_path, intra_op_threads=self.intra_op_threads)
+                self.model_fingerprint = hash_file(model_path)
+                weights_path = os.path.splitext(model_path)[0] + '.bin'
+                if self.backend == 'openvino' and os.path.exists(weights_path):
+                    # OpenVINO IR keeps the weights next to the .xml graph
+                    self.model_fingerprint += ':' + hash_file(weights_path)
                 print(f"Model loaded from: {model_path}")
                 return True
             else:
@@ -53,67 +247,423 @@ class BookIndexerWeb:
             print(f"Error loading model: {e}")
             return False
     
-    def pdf_to_images(self, pdf_path, output_folder):
-        """Convert PDF to images - exact same as original"""
+    def warm_up(self):
+        """Load the model if needed and run one inference on a blank page
+        
+        The first predict call pays for graph setup and lazy initialization;
+        doing it here keeps that cost off the first user's request. Returns
+        True when the model is loaded.
+        """
+        if self.model is None:
+            start = time.perf_counter()
+            if not self.load_model():
+                return False
+            self.model_load_seconds = round(time.perf_counter() - start, 3)
+            print(f"Model loaded in {self.model_load_seconds}s")
+        
+        raster_dpi = self.detect_dpi or self.dpi
+        page = Image.new('RGB', (int(8.5 * raster_dpi), int(11 * raster_dpi)), 'white')
+        start = time.perf_counter()
+        try:
+            self.detect_batch([page], batch_size=1)
+            self.warmup_seconds = round(time.perf_counter() - start, 3)
+            print(f"Model warmed up in {self.warmup_seconds}s")
+        except Exception as e:
+            print(f"Model warm-up failed: {e}")
+        finally:
+            page.close()
+        return True
+    
+    def pipeline_config(self):
+        """Settings that determine the output for a given PDF; used as part of the result cache key"""
+        return {
+            "pipeline_version": PIPELINE_VERSION,
+            "model": self.model_fingerprint,
+            "backend": self.backend,
+            "class_names": self.class_names,
+            "dpi": self.dpi,
+            "detect_dpi": self.detect_dpi,
+            "ocr_dpi": self.ocr_dpi if self.detect_dpi else None,
+            "engine": self.engine,
+            "text_layer": self.text_layer.config() if self.engine in ('auto', 'heuristic') else None,
+            "prescreen": self.prescreen_threshold if self.layout_mode() == 'prescreen' else None,
+            "page_filter": [self.blank_ink, self.duplicate_bits] if self.page_filter else None,
+            "full_text": self.full_text
+        }
+    
+    def shard_config(self):
+        """Settings a shard worker process copies onto its own indexer"""
+        return {
+            "dpi": self.dpi,
+            "detect_dpi": self.detect_dpi,
+            "ocr_dpi": self.ocr_dpi,
+            "page_window": self.page_window,
+            "batch_size": self.batch_size,
+            "backend": self.backend,
+            "model_path": self.model_path,
+            "prescreen_threshold": self.prescreen_threshold,
+            "page_filter": self.page_filter,
+            "blank_ink": self.blank_ink,
+            "duplicate_bits": self.duplicate_bits,
+            "full_text": self.full_text
+        }
+    
+    def get_shard_pool(self, num_workers):
+        """Long-lived pool of num_workers shard processes"""
+        with self._shard_pools_lock:
+            pool = self._shard_pools.get(num_workers)
+            if pool is None:
+                pool = self._shard_pools[num_workers] = ShardPool(self, num_workers, self.shard_start_method)
+            return pool
+    
+    def get_poppler_path(self):
+        """Use local Poppler if available"""
+        if os.path.exists('poppler/poppler-23.08.0/Library/bin'):
+            return 'poppler/poppler-23.08.0/Library/bin'
+        return None
+    
+    def get_page_count(self, pdf_path):
+        """Read the page count from the PDF without rasterizing it"""
+        info = pdfinfo_from_path(pdf_path, poppler_path=self.get_poppler_path())
+        return int(info["Pages"])
+    
+    def iter_pdf_pages(self, pdf_path, window_size=None, num_pages=None, pages=None, dpi=None):
+        """Yield (page_index, image) pairs, rasterizing at most window_size pages at a time
+        
+        pages optionally restricts rasterization to a subset of 0-based page indexes.
+        """
+        dpi = dpi or self.dpi
+        window_size = max(1, int(window_size or self.page_window))
+        if pages is None:
+            if num_pages is None:
+                num_pages = self.get_page_count(pdf_path)
+            pages = range(num_pages)
+        poppler_path = self.get_poppler_path()
+        
+        # Contiguous runs of at most window_size pages, one poppler call each
+        windows = []
+        for page_index in sorted(pages):
+            if windows and page_index == windows[-1][-1] + 1 and len(windows[-1]) < window_size:
+                windows[-1].append(page_index)
+            else:
+                windows.append([page_index])
+        
+        for window in windows:
+            start = time.perf_counter()
+            images = convert_from_path(pdf_path, dpi=dpi, first_page=window[0] + 1,
+                                       last_page=window[-1] + 1, poppler_path=poppler_path)
+            if images:
+                STAGE_SECONDS.observe((time.perf_counter() - start) / len(images), count=len(images),
+                                      stage='rasterize')
+            # Pop pages off the window so each one is freed once the caller is done with it
+            for page_index in window:
+                if not images:
+                    break
+                yield page_index, images.pop(0)
+    
+    def render_region(self, pdf_path, page_index, bbox, dpi):
+        """Rasterize only a rectangle of one page; bbox is in pixels at the given dpi"""
+        x1, y1, x2, y2 = [int(round(v)) for v in bbox]
+        poppler_path = self.get_poppler_path()
+        pdftoppm = os.path.join(poppler_path, 'pdftoppm') if poppler_path else 'pdftoppm'
+        command = [
+            pdftoppm, '-f', str(page_index + 1), '-l', str(page_index + 1), '-r', str(dpi),
+            '-x', str(x1), '-y', str(y1), '-W', str(max(1, x2 - x1)), '-H', str(max(1, y2 - y1)),
+            '-gray', '-png', '-singlefile', pdf_path
+        ]
+        completed = subprocess.run(command, capture_output=True, timeout=120, check=True)
+        return Image.open(io.BytesIO(completed.stdout))
+    
+    def pdf_to_images(self, pdf_path, output_folder, window_size=None):
+        """Convert PDF to images, one bounded window of pages at a time"""
         os.makedirs(output_folder, exist_ok=True)
         try:
-            # Use local Poppler if available
-            poppler_path = None
-            if os.path.exists('poppler/poppler-23.08.0/Library/bin'):
-                poppler_path = 'poppler/poppler-23.08.0/Library/bin'
-            
-            images = convert_from_path(pdf_path, poppler_path=poppler_path)
-            for i, image in enumerate(images):
+            num_pages = 0
+            for i, image in self.iter_pdf_pages(pdf_path, window_size):
                 image.save(os.path.join(output_folder, f'image_{i}.jpg'), 'JPEG')
-            return len(images)
+                num_pages += 1
+            return num_pages
         except Exception as e:
             raise Exception(f"Error converting PDF to images: {e}")
     
     def process_images(self, input_folder, output_folder, model, class_names, class_colors):
-        """Process images - exact same as original implementation"""
+        """Process images - runs the model over batches of decoded pages"""
         os.makedirs(output_folder, exist_ok=True)
         results_json = []
+        filenames = [f for f in os.listdir(input_folder)
+                     if f.lower().endswith(('.jpg', '.jpeg', '.png'))]
         
-        for filename in os.listdir(input_folder):
-            if filename.lower().endswith(('.jpg', '.jpeg', '.png')):
-                image_path = os.path.join(input_folder, filename)
-                image = Image.open(image_path)
-                results = model.predict(image_path)
-                draw = ImageDraw.Draw(image)
-                font = ImageFont.load_default()
-
-                image_results = {"image": filename, "detections": []}
-
-                for r in results:
-                    for box in r.boxes:
-                        x1, y1, x2, y2 = box.xyxy[0].int().tolist()
-                        label = class_names[int(box.cls[0])]
-                        color = tuple(class_colors[label])
-                        draw.rectangle([(x1, y1), (x2, y2)], outline=color, width=2)
-                        draw.text((x1, y1 - 10), label, fill=color, font=font)
-
-                        section_text = ""
-                        if label == "Section-header":
-                            try:
-                                cropped_image = image.crop((x1, y1, x2, y2))
-                                section_text = pytesseract.image_to_string(cropped_image).strip()
-                            except Exception as e:
-                                print(f"OCR error for {filename}: {e}")
-                                # Use fallback text based on page number
-                                page_num = int(filename.split("_")[1].split(".")[0])
-                                section_text = self.get_fallback_text(page_num)
-
-                        image_results["detections"].append({
-                            "label": label,
-                            "bbox": [x1, y1, x2, y2],
-                            "text": section_text
-                        })
-
+        for start in range(0, len(filenames), self.batch_size):
+            batch_files = filenames[start:start + self.batch_size]
+            images = [Image.open(os.path.join(input_folder, f)) for f in batch_files]
+            page_boxes = self.detect_batch(images, model=model)
+            batch_results = [self.build_page_result(image, filename, boxes, class_names)
+                             for filename, image, boxes in zip(batch_files, images, page_boxes)]
+            self.ocr_section_headers(list(zip(images, batch_results)))
+            for image, image_results in zip(images, batch_results):
+                annotated = self.draw_detections(image, image_results["detections"], class_colors)
+                annotated.save(os.path.join(output_folder, image_results["image"]))
                 results_json.append(image_results)
-                image.save(os.path.join(output_folder, filename))
+                image.close()
 
         return results_json
     
+    def to_model_input(self, image):
+        """Convert a PIL page to the BGR array layout ultralytics expects for arrays"""
+        if isinstance(image, np.ndarray):
+            return image
+        return np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
+    
+    def boxes_from_result(self, result):
+        """Extract (xyxy, class ids, confidences) arrays from one model result"""
+        boxes = result.boxes
+        if boxes is None or len(boxes) == 0:
+            return (np.zeros((0, 4), dtype=np.int32), np.zeros(0, dtype=np.int32),
+                    np.zeros(0, dtype=np.float32))
+        return (to_numpy(boxes.xyxy).astype(np.int32),
+                to_numpy(boxes.cls).astype(np.int32),
+                to_numpy(boxes.conf).astype(np.float32))
+    
+    def detect_batch(self, pages, batch_size=None, model=None):
+        """Run decoded pages through the model N at a time; one box tuple per page"""
+        model = model or self.model
+        batch_size = max(1, int(batch_size or self.batch_size))
+        page_boxes = []
+        
+        for start in range(0, len(pages), batch_size):
+            batch = [self.to_model_input(page) for page in pages[start:start + batch_size]]
+            with self._predict_lock:
+                t0 = time.perf_counter()
+                results = model.predict(batch, verbose=False)
+                STAGE_SECONDS.observe((time.perf_counter() - t0) / len(batch), count=len(batch),
+                                      stage='inference')
+            for result in results:
+                page_boxes.append(self.boxes_from_result(result))
+        
+        return page_boxes
+    
+    def process_page(self, image, filename, output_folder=None, model=None, class_names=None, class_colors=None):
+        """Detect and OCR a single page image, optionally saving the annotated page"""
+        boxes = self.detect_batch([image], batch_size=1, model=model)[0]
+        image_results = self.build_page_result(image, filename, boxes, class_names)
+        self.ocr_section_headers([(image, image_results)])
+        if output_folder:
+            annotated = self.draw_detections(image, image_results["detections"], class_colors)
+            annotated.save(os.path.join(output_folder, filename), 'JPEG')
+        return image_results
+    
+    def build_page_result(self, image, filename, boxes, class_names=None, scale=1.0):
+        """Build the raw_results entry for a page; header text is filled in by the OCR stage
+        
+        scale maps bboxes from the detection raster to raw_results (self.dpi) pixels.
+        """
+        class_names = class_names or self.class_names
+        xyxy, class_ids, confidences = boxes
+        if scale != 1.0:
+            xyxy = np.rint(xyxy * scale).astype(np.int32)
+        image_results = {"image": filename, "detections": []}
+        for class_id, count in zip(*np.unique(class_ids, return_counts=True)):
+            DETECTIONS_TOTAL.inc(int(count), label=class_names[class_id])
+
+        xyxy, class_ids, confidences = xyxy.tolist(), class_ids.tolist(), confidences.tolist()
+        if self.full_text:
+            # Body text is read back in page order, so detections follow reading order
+            order = reading_order(xyxy, image.width * scale)
+            xyxy, class_ids, confidences = ([values[i] for i in order] for values in (xyxy, class_ids, confidences))
+        for (x1, y1, x2, y2), class_id, confidence in zip(xyxy, class_ids, confidences):
+            image_results["detections"].append({
+                "label": class_names[class_id],
+                "bbox": [x1, y1, x2, y2],
+                "text": "",
+                "confidence": round(confidence, 4)
+            })
+
+        return image_results
+    
+    def get_ocr_pool(self):
+        """Long-lived thread pool for the OCR stage"""
+        with self._ocr_pool_lock:
+            if self._ocr_pool is None:
+                self._ocr_pool = ThreadPoolExecutor(max_workers=self.ocr_workers,
+                                                    thread_name_prefix='bookmap-ocr')
+            return self._ocr_pool
+    
+    def ocr_regions(self, image, bboxes, gap=24, word_boxes=False):
+        """OCR several regions of one page with a single tesseract invocation
+        
+        The crops are stacked onto one white canvas with blank gaps between them
+        and each recognised word is assigned back to the crop it falls in.
+        With word_boxes, returns (texts, words) where words[i] lists the
+        [word, x1, y1, x2, y2] boxes of region i in image pixels.
+        """
+        crops = [image.crop(tuple(bbox)).convert('L') for bbox in bboxes]
+        texts = [""] * len(crops)
+        words = [[] for _ in crops]
+        valid = [i for i, crop in enumerate(crops) if crop.width > 0 and crop.height > 0]
+        if len(valid) == 1 and not word_boxes:
+            texts[valid[0]] = pytesseract.image_to_string(crops[valid[0]]).strip()
+            return texts
+        if not valid:
+            return (texts, words) if word_boxes else texts
+        
+        width = max(crops[i].width for i in valid) + 2 * gap
+        height = sum(crops[i].height for i in valid) + gap * (len(valid) + 1)
+        canvas = Image.new('L', (width, height), 255)
+        spans = []
+        y = gap
+        for i in valid:
+            canvas.paste(crops[i], (gap, y))
+            spans.append((i, y, y - gap // 2, y + crops[i].height + gap // 2))
+            y += crops[i].height + gap
+        
+        data = pytesseract.image_to_data(canvas, output_type=pytesseract.Output.DICT)
+        lines = {i: {} for i in valid}
+        for n, word in enumerate(data["text"]):
+            word = word.strip()
+            if not word:
+                continue
+            center = data["top"][n] + data["height"][n] / 2
+            for i, paste_y, top, bottom in spans:
+                if top <= center < bottom:
+                    line_key = (data["block_num"][n], data["par_num"][n], data["line_num"][n])
+                    lines[i].setdefault(line_key, []).append(word)
+                    if word_boxes:
+                        # Canvas coordinates back to the page: undo the paste offset, add the crop origin
+                        x1 = data["left"][n] - gap + bboxes[i][0]
+                        y1 = data["top"][n] - paste_y + bboxes[i][1]
+                        words[i].append([word, x1, y1, x1 + data["width"][n], y1 + data["height"][n]])
+                    break
+        
+        for i in valid:
+            texts[i] = "\n".join(" ".join(line) for line in lines[i].values())
+        return (texts, words) if word_boxes else texts
+    
+    def ocr_page_headers(self, image, bboxes, pdf_path=None, page_index=None, word_boxes=False):
+        """OCR a page's header (or body) boxes, from the page image or re-rendered from the PDF at ocr_dpi"""
+        with STAGE_SECONDS.time(stage='ocr'):
+            if pdf_path is None:
+                return self.ocr_regions(image, bboxes, word_boxes=word_boxes)
+            return self.ocr_pdf_regions(pdf_path, page_index, bboxes, word_boxes)
+    
+    def ocr_pdf_regions(self, pdf_path, page_index, bboxes, word_boxes=False):
+        """Render one region covering all of a page's boxes at ocr_dpi and OCR the boxes in it
+        
+        The boxes are in self.dpi pixels and are mapped into the region;
+        word boxes are mapped back to self.dpi pixels.
+        """
+        scale = self.ocr_dpi / self.dpi
+        scaled = [[v * scale for v in bbox] for bbox in bboxes]
+        region = [min(b[0] for b in scaled), min(b[1] for b in scaled),
+                  max(b[2] for b in scaled), max(b[3] for b in scaled)]
+        region_image = self.render_region(pdf_path, page_index, region, self.ocr_dpi)
+        local = [[int(b[0] - region[0]), int(b[1] - region[1]), int(b[2] - region[0]), int(b[3] - region[1])]
+                 for b in scaled]
+        if not word_boxes:
+            return self.ocr_regions(region_image, local)
+        texts, words = self.ocr_regions(region_image, local, word_boxes=True)
+        for region_words in words:
+            for word in region_words:
+                word[1:] = [round((word[1] + region[0]) / scale), round((word[2] + region[1]) / scale),
+                            round((word[3] + region[0]) / scale), round((word[4] + region[1]) / scale)]
+        return texts, words
+    
+    def ocr_section_headers(self, pages, pdf_path=None):
+        """OCR stage: fill in Section-header text for a window of (image, image_results) pages
+        
+        Pages are OCR'd concurrently on the pool with one tesseract call per page.
+        When pdf_path is given, header regions are re-rendered from the PDF at
+        ocr_dpi instead of being cropped from the (low resolution) page image.
+        In full-text mode body regions are read too, in reading order, and
+        every OCR'd detection also gets its "words" as [word, x1, y1, x2, y2].
+        """
+        labels = FULL_TEXT_LABELS if self.full_text else ("Section-header",)
+        jobs = []
+        for image, image_results in pages:
+            regions = [d for d in image_results["detections"] if d["label"] in labels]
+            if regions:
+                jobs.append((image, image_results["image"], regions))
+        if not jobs:
+            return
+        
+        pool = self.get_ocr_pool()
+        futures = []
+        for image, filename, regions in jobs:
+            page_index = int(filename.split("_")[1].split(".")[0])
+            futures.append(pool.submit(self.ocr_page_headers, image, [d["bbox"] for d in regions],
+                                       pdf_path, page_index, self.full_text))
+        
+        for (image, filename, regions), future in zip(jobs, futures):
+            words = None
+            try:
+                texts = future.result()
+                if self.full_text:
+                    texts, words = texts
+            except Exception as e:
+                print(f"OCR error for {filename}: {e}")
+                OCR_FAILURES_TOTAL.inc()
+                headers = sum(1 for d in regions if d["label"] == "Section-header")
+                OCR_FALLBACKS_TOTAL.inc(headers)
+                # Use fallback text based on page number; body regions stay empty
+                page_num = int(filename.split("_")[1].split(".")[0])
+                texts = [self.get_fallback_text(page_num) if d["label"] == "Section-header" else ""
+                         for d in regions]
+            for i, (detection, text) in enumerate(zip(regions, texts)):
+                detection["text"] = text
+                if words is not None:
+                    detection["words"] = words[i]
+    
+    def draw_detections(self, image, detections, class_colors=None, scale=1.0):
+        """Return an annotated copy of a page with detection boxes and labels drawn
+        
+        scale maps raw_results bboxes onto the image when it isn't rendered at self.dpi.
+        """
+        start = time.perf_counter()
+        class_colors = class_colors or self.class_colors
+        annotated = image.convert('RGB')
+        draw = ImageDraw.Draw(annotated)
+        font = ImageFont.load_default()
+        
+        for detection in detections:
+            x1, y1, x2, y2 = [int(v * scale) for v in detection["bbox"]]
+            label = detection["label"]
+            color = tuple(class_colors[label])
+            draw.rectangle([(x1, y1), (x2, y2)], outline=color, width=2)
+            draw.text((x1, y1 - 10), label, fill=color, font=font)
+        
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage='draw')
+        return annotated
+    
+    def render_page(self, pdf_path, page_number, detections=None, dpi=None):
+        """Rasterize a single page (1-based) on demand, annotated when detections are given"""
+        dpi = dpi or self.dpi
+        images = convert_from_path(pdf_path, dpi=dpi, first_page=page_number, last_page=page_number,
+                                   poppler_path=self.get_poppler_path())
+        if not images:
+            raise Exception(f"Page {page_number} not found in PDF")
+        image = images[0]
+        if detections:
+            image = self.draw_detections(image, detections, scale=dpi / self.dpi)
+        return image
+    
+    def export_annotated_pdf(self, pdf_path, raw_results, sink, output_path):
+        """Write the annotated pages as one PDF, rendering any page the sink doesn't hold
+        
+        Pages indexed from the text layer were never rasterized; they are
+        rendered from the PDF here and kept in the sink for next time.
+        """
+        page_files = []
+        for page_index, entry in enumerate(raw_results):
+            page_path = sink.page_path(page_index, annotated=True)
+            if not os.path.exists(page_path):
+                image = self.render_page(pdf_path, page_index + 1, entry["detections"])
+                sink.save_page(page_index, image, annotated=True)
+                image.close()
+            page_files.append(page_path)
+        # JPEGs are embedded as-is, without re-encoding
+        with open(output_path, 'wb') as f:
+            f.write(img2pdf.convert(page_files))
+        return output_path
+    
     def get_fallback_text(self, page_num):
         """Get fallback text when OCR fails"""
         fallback_texts = {
@@ -136,72 +686,331 @@ class BookIndexerWeb:
         cleaned_text = re.sub(r'[^a-zA-Z0-9\s]', '', cleaned_text)
         return cleaned_text.strip()
     
+    def page_index_entries(self, entry):
+        """Clean a page's detection text and return its (page, title) index candidates"""
+        index_entries = []
+        page_number = int(entry["image"].split("_")[1].split(".")[0]) + 1
+        for detection in entry["detections"]:
+            # Only headers are cleaned; full-text body regions keep their punctuation and line breaks
+            if detection["label"] == "Section-header" and detection["text"]:
+                detection["text"] = self.remove_special_characters(detection["text"])
+                if detection["text"]:
+                    index_entries.append((page_number, detection['text']))
+        return index_entries
+    
     def generate_index(self, data):
         """Generate index - same as original implementation"""
         index_entries = []
         for entry in data:
-            page_number = int(entry["image"].split("_")[1].split(".")[0]) + 1
-            for detection in entry["detections"]:
-                if detection["text"]:
-                    detection["text"] = self.remove_special_characters(detection["text"])
-
-                if detection["label"] == "Section-header" and detection["text"]:
-                    index_entries.append((page_number, detection['text']))
-
-        index_entries.sort()
-
-        seen = set()
-        unique_index = []
-        for page, text in index_entries:
-            name = text.strip()
-            if name not in seen:
-                unique_index.append({"page": page, "title": text})
-                seen.add(name)
+            index_entries.extend(self.page_index_entries(entry))
 
-        return unique_index
+        return self.build_unique_index(index_entries)
     
-    def process_pdf(self, pdf_path, temp_dir, progress_callback=None):
-        """Process PDF - main function matching original workflow"""
+    def build_unique_index(self, index_entries):
+        """Sort (page, title) pairs and keep the first page each title appears on"""
+        index = IncrementalIndex()
+        index.add(index_entries)
+        return index.to_list()
+    
+    def can_process(self):
+        """Whether PDFs can be accepted: the model is loaded, or the configured engine doesn't need it"""
+        return (bool(self.model) or self.engine == 'heuristic'
+                or (self.engine == 'auto' and self.text_layer.available))
+    
+    def layout_mode(self, engine=None):
+        """How scanned pages are analyzed: 'model', 'heuristic' (no model) or 'prescreen' (heuristic first)"""
+        if (engine or self.engine) == 'heuristic':
+            return 'heuristic'
+        return 'prescreen' if self.prescreen else 'model'
+    
+    def read_text_layer(self, pdf_path, num_pages, engine=None):
+        """Fast path: per-page results from the outline or text layer
+        
+        Returns (results by page index, page engine per page, outline index entries or None).
+        Pages left as 'vision' have no usable text layer and need the model.
+        """
+        page_engines = ['vision'] * num_pages
+        results = {}
+        if (engine or self.engine) not in ('auto', 'heuristic') or not self.text_layer.available:
+            return results, page_engines, None
+        
         try:
-            if not self.model:
-                raise Exception("Model not loaded")
+            layer = self.text_layer.analyze(pdf_path)
+        except Exception as e:
+            print(f"Could not read text layer, using vision pipeline: {e}")
+            return results, page_engines, None
+        
+        for page_index, page_info in enumerate(layer["pages"][:num_pages]):
+            if page_info["has_text"]:
+                results[page_index] = {
+                    "image": f'image_{page_index}.jpg',
+                    "detections": self.text_layer.header_detections(page_info, layer["body_size"])
+                }
+                page_engines[page_index] = 'text'
+        
+        outline_entries = None
+        if layer["outline"]:
+            # The bookmark outline is authoritative: no page needs the model
+            outline_entries = [(page_index + 1, self.remove_special_characters(title))
+                               for page_index, title, _ in layer["outline"] if page_index < num_pages]
+            outline_entries = [(page, title) for page, title in outline_entries if title]
+            page_engines = ['outline'] * num_pages
+        
+        return results, page_engines, outline_entries
+    
+    def detect_pages(self, pages, layout='model', batch_size=None):
+        """Boxes per page and the engine that produced them
+        
+        'heuristic' uses only the layout engine; 'prescreen' sends a page to
+        the model only when the layout engine sees something that might be a header.
+        """
+        page_boxes = [None] * len(pages)
+        engines = ['vision'] * len(pages)
+        if layout in ('heuristic', 'prescreen') and pages:
+            start = time.perf_counter()
+            for i, page in enumerate(pages):
+                boxes, header_score = self.layout_engine.analyze(page, self.detect_dpi or self.dpi)
+                if layout == 'heuristic' or header_score < self.prescreen_threshold:
+                    page_boxes[i], engines[i] = boxes, 'heuristic'
+            STAGE_SECONDS.observe((time.perf_counter() - start) / len(pages), count=len(pages), stage='layout')
+        
+        model_pages = [i for i, boxes in enumerate(page_boxes) if boxes is None]
+        if model_pages:
+            for i, boxes in zip(model_pages, self.detect_batch([pages[i] for i in model_pages], batch_size)):
+                page_boxes[i] = boxes
+        return page_boxes, engines
+    
+    def run_vision_pipeline(self, pdf_path, pages, sink=None, window_size=None, batch_size=None,
+                            on_batch=None, page_callback=None, layout=None):
+        """Rasterize → detect → OCR the given pages; returns (results, peak memory MB)
+        
+        page_callback(image_results) is called as each page completes and
+        on_batch(pages_done) after each batch. Pages the layout engine handled
+        instead of the model are marked with "engine": "heuristic", pages
+        taken from the per-page cache with "engine": "cached". Blank pages and
+        repeats of an earlier page skip detection: they get
+        "skipped": "blank" or "skipped": "duplicate" (with "duplicate_of",
+        the 1-based page repeated, whose detections they share) and "engine": "skipped".
+        """
+        layout = layout or self.layout_mode()
+        if layout != 'heuristic' and not self.model:
+            raise Exception("Model not loaded")
+        
+        batch_size = batch_size or self.batch_size
+        # Two-resolution mode: low-DPI pages for the model, header OCR from the PDF at ocr_dpi
+        raster_dpi = self.detect_dpi or self.dpi
+        scale = self.dpi / raster_dpi
+        ocr_source = pdf_path if self.detect_dpi else None
+        page_filter = PageFilter(self.blank_ink, self.duplicate_bits) if self.page_filter else None
+        config_digest = hash_config(self.pipeline_config())
+        peak_memory_mb = get_rss_mb()
+        results = []
+        # Detections of the pages done so far, for duplicates to copy
+        page_detections = {}
+        batch = []
+        
+        def flush_batch():
+            # Pages that still need detection: not skipped and not in the page cache
+            pending = [i for i, (_, _, check, cached) in enumerate(batch) if cached is None
+                       and (check is None or check.verdict is None)]
+            page_boxes, engines = self.detect_pages([batch[i][1] for i in pending], layout, batch_size)
+            batch_results = [None] * len(batch)
+            for i, boxes, engine in zip(pending, page_boxes, engines):
+                page_index, image = batch[i][:2]
+                batch_results[i] = self.build_page_result(image, f'image_{page_index}.jpg', boxes, scale=scale)
+                if engine != 'vision':
+                    batch_results[i]["engine"] = engine
+            self.ocr_section_headers([(batch[i][1], batch_results[i]) for i in pending], ocr_source)
+            for i in pending:
+                check = batch[i][2]
+                if check is not None:
+                    self.page_cache.put(self.page_cache.make_key(check.digest, config_digest),
+                                        batch_results[i]["detections"])
             
-            # Create temporary directories
-            converted_folder = os.path.join(temp_dir, 'converted')
-            processed_folder = os.path.join(temp_dir, 'processed')
+            for i, (page_index, image, check, cached) in enumerate(batch):
+                image_results = batch_results[i]
+                if cached is not None:
+                    image_results = {"image": f'image_{page_index}.jpg', "detections": cached, "engine": "cached"}
+                    PAGE_CACHE_HITS_TOTAL.inc()
+                elif image_results is None:
+                    image_results = {"image": f'image_{page_index}.jpg', "detections": [],
+                                     "skipped": check.verdict, "engine": "skipped"}
+                    if check.verdict == 'duplicate':
+                        image_results["duplicate_of"] = check.original + 1
+                        image_results["detections"] = [dict(detection) for detection
+                                                       in page_detections.get(check.original, [])]
+                page_detections[page_index] = image_results["detections"]
+                if sink and sink.annotated:
+                    annotated = self.draw_detections(image, image_results["detections"], scale=1 / scale)
+                    sink.save_page(page_index, annotated, annotated=True)
+                results.append(image_results)
+                image.close()
+                if page_callback:
+                    page_callback(image_results)
+            batch.clear()
+            
+            if on_batch:
+                on_batch(len(results))
+        
+        # Rasterize a window at a time and hand pages to the model a batch at a time
+        for page_index, image in self.iter_pdf_pages(pdf_path, window_size, pages=pages, dpi=raster_dpi):
+            if sink:
+                sink.save_page(page_index, image)
+            check = cached = None
+            if page_filter:
+                start = time.perf_counter()
+                check = page_filter.check(page_index, image)
+                if check.verdict is None:
+                    cached = self.page_cache.get(self.page_cache.make_key(check.digest, config_digest))
+                STAGE_SECONDS.observe(time.perf_counter() - start, stage='prefilter')
+            batch.append((page_index, image, check, cached))
+            peak_memory_mb = max(peak_memory_mb, get_rss_mb())
+            if len(batch) >= batch_size:
+                flush_batch()
+        if batch:
+            flush_batch()
+        
+        return results, peak_memory_mb
+    
+    def run_sharded_pipeline(self, pdf_path, pages, num_workers, sink=None, on_batch=None, page_callback=None,
+                             layout=None):
+        """Run the vision pipeline over contiguous page slices in num_workers processes
+        
+        Returns (results in page order, peak memory MB, shard stats). A disk
+        sink is written by the workers; memory sinks can't cross processes.
+        """
+        start = time.perf_counter()
+        # Two slices per worker balance uneven pages without losing poppler's contiguous windows
+        shards = split_shards(pages, num_workers * 2, min_pages=self.page_window)
+        sink_kind = sink.name if sink else None
+        temp_dir = getattr(sink, 'temp_dir', None)
+        annotated = bool(sink and sink.annotated)
+        layout = layout or self.layout_mode()
+        results = []
+        busy_seconds = 0.0
+        worker_peaks = {}
+        
+        for output in self.get_shard_pool(num_workers).run(pdf_path, shards, sink_kind, temp_dir, annotated,
+                                                           layout):
+            results.extend(output["results"])
+            busy_seconds += output["seconds"]
+            worker_peaks[output["pid"]] = max(worker_peaks.get(output["pid"], 0.0), output["peak_memory_mb"])
+            if page_callback:
+                for image_results in output["results"]:
+                    page_callback(image_results)
+            if on_batch:
+                on_batch(len(results))
+        
+        results.sort(key=lambda entry: int(entry["image"].split("_")[1].split(".")[0]))
+        wall_seconds = time.perf_counter() - start
+        stats = {
+            "workers": num_workers,
+            "shards": len(shards),
+            "wall_seconds": round(wall_seconds, 3),
+            "worker_seconds": round(busy_seconds, 3),
+            # 1.0 means every worker was busy for the whole run
+            "scaling_efficiency": round(busy_seconds / (wall_seconds * num_workers), 3) if wall_seconds else None,
+            "worker_peak_memory_mb": round(max(worker_peaks.values(), default=0.0), 1)
+        }
+        return results, get_rss_mb(), stats
+    
+    def process_pdf(self, pdf_path, temp_dir, progress_callback=None, window_size=None, batch_size=None,
+                    sink=None, engine=None, page_callback=None, num_pages=None, shard_workers=None):
+        """Process PDF - keeps pages in memory from rasterization through indexing
+        
+        With engine 'auto' the PDF's outline or text layer is used first and only
+        scanned pages go through the model; 'vision' always uses the model;
+        'heuristic' is like 'auto' but analyzes scanned pages with the layout
+        engine instead of the model (with BOOKMAP_PRESCREEN, the layout engine
+        decides which scanned pages the model sees). Page
+        images are only written when a sink is given ('disk', 'memory' or a
+        PageSink instance); otherwise nothing touches the disk. progress_callback
+        is called as progress_callback(progress, message, stage=...) and
+        page_callback(image_results) as each page's detections are final.
+        With shard_workers > 1 (default: BOOKMAP_SHARD_WORKERS), long books are
+        split across that many worker processes.
+        """
+        try:
+            sink = make_page_sink(sink, temp_dir)
+            window_size = window_size or self.page_window
+            batch_size = batch_size or self.batch_size
             
             if progress_callback:
-                progress_callback(10, "Converting PDF to images...")
+                progress_callback(5, "Reading PDF structure...", stage='text-layer')
             
-            # Convert PDF to images
-            num_pages = self.pdf_to_images(pdf_path, converted_folder)
+            num_pages = num_pages or self.get_page_count(pdf_path)
+            start = time.perf_counter()
+            results, page_engines, outline_entries = self.read_text_layer(pdf_path, num_pages, engine)
+            if num_pages:
+                STAGE_SECONDS.observe((time.perf_counter() - start) / num_pages, count=num_pages, stage='text_layer')
+            vision_pages = [i for i, page_engine in enumerate(page_engines) if page_engine == 'vision']
+            layout = self.layout_mode(engine)
+            peak_memory_mb = get_rss_mb()
+            shard_stats = None
+            shard_workers = self.shard_workers if shard_workers is None else shard_workers
             
-            if progress_callback:
-                progress_callback(30, "Processing images with AI model...")
+            if page_callback:
+                for page_index in sorted(results):
+                    page_callback(results[page_index])
+            
+            if vision_pages:
+                if progress_callback:
+                    progress_callback(10, "Converting PDF to images...", stage='rasterize')
+                
+                def on_batch(pages_done):
+                    if progress_callback:
+                        progress = 10 + int(70 * pages_done / len(vision_pages))
+                        progress_callback(progress, f"Processed {pages_done} of {len(vision_pages)} scanned pages...",
+                                          stage='detect')
+                
+                if (shard_workers > 1 and len(vision_pages) >= self.shard_min_pages
+                        and (sink is None or sink.name == 'disk')):
+                    vision_results, peak_memory_mb, shard_stats = self.run_sharded_pipeline(
+                        pdf_path, vision_pages, shard_workers, sink, on_batch, page_callback, layout)
+                else:
+                    vision_results, peak_memory_mb = self.run_vision_pipeline(
+                        pdf_path, vision_pages, sink, window_size, batch_size, on_batch, page_callback, layout)
+                for image_results in vision_results:
+                    page_index = int(image_results["image"].split("_")[1].split(".")[0])
+                    page_engines[page_index] = image_results.pop("engine", 'vision')
+                    results[page_index] = image_results
             
-            # Process images
-            results = self.process_images(converted_folder, processed_folder, 
-                                        self.model, self.class_names, self.class_colors)
+            raw_results = [results.get(i, {"image": f'image_{i}.jpg', "detections": []})
+                           for i in range(num_pages)]
             
             if progress_callback:
-                progress_callback(80, "Generating index...")
+                progress_callback(80, "Generating index...", stage='index')
             
             # Generate index
-            index_data = self.generate_index(results)
+            start = time.perf_counter()
+            if outline_entries is not None:
+                index_data = self.build_unique_index(outline_entries)
+            else:
+                index_data = self.generate_index(raw_results)
+            if num_pages:
+                STAGE_SECONDS.observe((time.perf_counter() - start) / num_pages, count=num_pages, stage='index')
+            engine_summary = {name: page_engines.count(name) for name in set(page_engines)}
+            for name, count in engine_summary.items():
+                PAGES_TOTAL.inc(count, engine=name)
             
             if progress_callback:
-                progress_callback(100, "Processing completed!")
+                progress_callback(100, "Processing completed!", stage='index')
             
             return {
                 "index": index_data,
-                "raw_results": results,
-                "num_pages": num_pages
+                "raw_results": raw_results,
+                "num_pages": num_pages,
+                "page_engines": page_engines,
+                "engine_summary": engine_summary,
+                "page_window": window_size,
+                "batch_size": batch_size,
+                "peak_memory_mb": round(peak_memory_mb, 1),
+                "page_sink": sink.name if sink else 'none',
+                "shards": shard_stats
             }
             
         except Exception as e:
             raise Exception(f"Error processing PDF: {e}")
-        # Note: Don't cleanup folders here - keep them for viewing
-        print(f"Processing completed. Images saved in: {temp_dir}")
 
 # Global instance
 book_indexer_web = BookIndexerWeb()
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Chunked, resumable uploads
+Large PDFs are sent as a series of chunks written at explicit offsets, each
+with its own SHA-256, so a dropped connection resumes from the last good
+byte instead of starting over. Chunks stream straight to a file on disk;
+the whole-file hash and a running page estimate are updated as they arrive.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows: chunks of one upload are only serialized within a process
+    fcntl = None
+
+# Page objects in the PDF body; pages inside compressed object streams aren't visible,
+# so this is a progress estimate and the authoritative count comes from pdfinfo
+PAGE_RE = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+TAIL_BYTES = 32
+
+
+class UploadNotFound(Exception):
+    """Unknown or expired upload id"""
+
+
+class UploadConflict(Exception):
+    """Chunk at the wrong offset, or another chunk of the upload is being written"""
+
+
+class ChunkRejected(Exception):
+    """Chunk (or the finished file) failed a size, checksum or validity check"""
+
+
+class ChunkedUploadStore:
+    """Uploads in progress, one folder each under <upload folder>/chunked/
+
+    A folder holds data.part (the bytes received so far) and state.json. The
+    offset in state.json is only advanced after a chunk has been verified,
+    so it is the resume point even if the process dies mid-chunk.
+    """
+
+    def __init__(self, folder, max_bytes, ttl_seconds=24 * 3600, read_size=1024 * 1024):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.read_size = read_size
+        # upload id -> (offset, sha256 of the first offset bytes), for this process
+        self._hashers = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def upload_dir(self, upload_id):
+        if not re.fullmatch(r'[0-9a-f]{32}', upload_id or ''):
+            raise UploadNotFound(f"Unknown upload: {upload_id}")
+        return os.path.join(self.folder, upload_id)
+
+    def data_path(self, upload_id):
+        return os.path.join(self.upload_dir(upload_id), 'data.part')
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.upload_dir(upload_id), 'state.json')
+
+    def get_state(self, upload_id):
+        try:
+            with open(self._state_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise UploadNotFound(f"Unknown upload: {upload_id}")
+
+    def _save_state(self, state):
+        path = self._state_path(state["upload_id"])
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    def create(self, filename, size, sha256=None):
+        """Start an upload of size bytes; returns its state"""
+        if size <= 0:
+            raise ChunkRejected("Upload size must be positive")
+        if size > self.max_bytes:
+            raise ChunkRejected(f"File is larger than the {self.max_bytes // (1024 * 1024)}MB limit")
+        self.remove_stale()
+        upload_id = uuid.uuid4().hex
+        os.makedirs(self.upload_dir(upload_id))
+        open(self.data_path(upload_id), 'wb').close()
+        state = {
+            "upload_id": upload_id,
+            "filename": filename,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "offset": 0,
+            "pages_seen": 0,
+            "tail": "",
+            "created_at": time.time(),
+            "updated_at": time.time()
+        }
+        self._save_state(state)
+        return state
+
+    @contextmanager
+    def exclusive(self, upload_id):
+        """Hold an upload for one writer; a second concurrent chunk or completion is refused rather than queued"""
+        if not os.path.isdir(self.upload_dir(upload_id)):
+            raise UploadNotFound(f"Unknown upload: {upload_id}")
+        with self._lock:
+            lock = self._locks.setdefault(upload_id, threading.Lock())
+        if not lock.acquire(blocking=False):
+            raise UploadConflict("Another chunk of this upload is being written")
+        try:
+            try:
+                lock_file = open(os.path.join(self.upload_dir(upload_id), 'lock'), 'a')
+            except FileNotFoundError:
+                # Discarded while we waited for the lock
+                raise UploadNotFound(f"Unknown upload: {upload_id}")
+            with lock_file:
+                if fcntl:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    except OSError:
+                        raise UploadConflict("Another chunk of this upload is being written")
+                yield
+        finally:
+            lock.release()
+            if not os.path.isdir(self.upload_dir(upload_id)):
+                with self._lock:
+                    self._locks.pop(upload_id, None)
+
+    def _file_hasher(self, upload_id, offset):
+        """SHA-256 of the first offset bytes; rebuilt from disk when another process wrote the earlier chunks"""
+        cached = self._hashers.get(upload_id)
+        if cached and cached[0] == offset:
+            return cached[1]
+        digest = hashlib.sha256()
+        with open(self.data_path(upload_id), 'rb') as f:
+            remaining = offset
+            while remaining:
+                data = f.read(min(self.read_size, remaining))
+                if not data:
+                    break
+                digest.update(data)
+                remaining -= len(data)
+        return digest
+
+    def write_chunk(self, upload_id, offset, stream, chunk_sha256, max_chunk_bytes):
+        """Stream one chunk from a file-like object to disk at offset; returns the updated state
+
+        The chunk is checked against chunk_sha256 before the offset moves; a
+        bad chunk is truncated away and has to be sent again.
+        """
+        with self.exclusive(upload_id):
+            state = self.get_state(upload_id)
+            if offset != state["offset"]:
+                raise UploadConflict(f"Expected offset {state['offset']}, got {offset}")
+            if state["offset"] >= state["size"]:
+                raise UploadConflict("Upload is already complete")
+
+            file_digest = self._file_hasher(upload_id, offset).copy()
+            chunk_digest = hashlib.sha256()
+            tail = bytes.fromhex(state["tail"])
+            pages_seen = state["pages_seen"]
+            written = 0
+            with open(self.data_path(upload_id), 'r+b') as f:
+                # Anything past the offset is a chunk that never verified
+                f.truncate(offset)
+                f.seek(offset)
+                try:
+                    while True:
+                        data = stream.read(self.read_size)
+                        if not data:
+                            break
+                        written += len(data)
+                        if written > max_chunk_bytes or offset + written > state["size"]:
+                            raise ChunkRejected("Chunk is larger than allowed or runs past the declared size")
+                        f.write(data)
+                        chunk_digest.update(data)
+                        file_digest.update(data)
+                        window = tail + data
+                        pages_seen += sum(1 for match in PAGE_RE.finditer(window) if match.end() > len(tail))
+                        tail = window[-TAIL_BYTES:]
+                    if not written:
+                        raise ChunkRejected("Empty chunk")
+                    if chunk_digest.hexdigest() != (chunk_sha256 or '').lower():
+                        raise ChunkRejected("Chunk checksum mismatch")
+                except Exception:
+                    f.truncate(offset)
+                    raise
+
+            state.update(offset=offset + written, pages_seen=pages_seen, tail=tail.hex(), updated_at=time.time())
+            if state["offset"] == state["size"]:
+                state["sha256_actual"] = file_digest.hexdigest()
+            self._save_state(state)
+            self._hashers[upload_id] = (state["offset"], file_digest)
+            return state
+
+    def verify(self, upload_id):
+        """Check a complete upload; returns its state and the path of its file
+
+        The file must start like a PDF, end with an %%EOF marker and match
+        the whole-file SHA-256 given at creation, if any. A file that fails
+        is discarded.
+        """
+        state = self.get_state(upload_id)
+        if state["offset"] != state["size"]:
+            raise UploadConflict(f"Upload is incomplete ({state['offset']} of {state['size']} bytes)")
+        path = self.data_path(upload_id)
+        with open(path, 'rb') as f:
+            head = f.read(8)
+            f.seek(max(0, state["size"] - 2048))
+            trailer = f.read()
+        if not head.startswith(b'%PDF-') or b'%%EOF' not in trailer:
+            self.discard(upload_id)
+            raise ChunkRejected("Uploaded file is not a complete PDF")
+        if state["sha256"] and state["sha256"] != state["sha256_actual"]:
+            self.discard(upload_id)
+            raise ChunkRejected("File checksum mismatch")
+        return state, path
+
+    def export(self, upload_id, destination):
+        """Hard-link a verified upload's file to destination (copy where links aren't supported)
+
+        The upload itself stays until discarded, so if the job it was
+        exported for is refused it can be started again.
+        """
+        try:
+            os.link(self.data_path(upload_id), destination)
+        except OSError:
+            shutil.copyfile(self.data_path(upload_id), destination)
+
+    def discard(self, upload_id):
+        self._hashers.pop(upload_id, None)
+        with self._lock:
+            self._locks.pop(upload_id, None)
+        shutil.rmtree(self.upload_dir(upload_id), ignore_errors=True)
+
+    def remove_stale(self, now=None):
+        """Delete uploads that have not received a chunk for ttl_seconds"""
+        now = now or time.time()
+        if not os.path.isdir(self.folder):
+            return
+        for upload_id in os.listdir(self.folder):
+            try:
+                state = self.get_state(upload_id)
+            except UploadNotFound:
+                continue
+            if now - state["updated_at"] > self.ttl_seconds:
+                print(f"Removing abandoned upload {upload_id}")
+                self.discard(upload_id)
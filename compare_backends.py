@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Backend comparison
+Runs the PyTorch baseline and an exported backend over the same sample
+pages and reports the inference speedup and how far the detections drift,
+treating the baseline's detections as ground truth (mAP@0.5 and recall per
+class, with Section-header recall called out since it drives the index).
+
+    python compare_backends.py --backend onnx --model-path yolov8x-doclaynet-int8.onnx
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+from book_indexer_web_fixed import BookIndexerWeb
+from export_model import sample_page_indexes
+
+
+def make_indexer(backend, model_path=None, intra_op_threads=None):
+    indexer = BookIndexerWeb()
+    indexer.backend = backend
+    indexer.model_path = model_path or indexer.default_model_path()
+    indexer.intra_op_threads = intra_op_threads
+    if not indexer.warm_up():
+        raise Exception(f"Could not load the {backend} model from {indexer.model_path}")
+    return indexer
+
+
+def box_iou(box, boxes):
+    """IoU of one xyxy box against an (n, 4) array"""
+    inter = (np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None) *
+             np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None))
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return inter / (area + areas - inter + 1e-9)
+
+
+def match_page(reference, candidate, matches, iou_threshold=0.5):
+    """Greedily match one page's candidate boxes to reference boxes of the same class
+
+    Appends (confidence, is_true_positive) per candidate box to matches[class_id]
+    and returns the number of reference boxes per class.
+    """
+    ref_xyxy, ref_cls, _ = reference
+    cand_xyxy, cand_cls, cand_conf = candidate
+    ref_counts = {}
+    for class_id in set(ref_cls.tolist()) | set(cand_cls.tolist()):
+        ref_boxes = ref_xyxy[ref_cls == class_id].astype(np.float64)
+        ref_counts[class_id] = len(ref_boxes)
+        used = np.zeros(len(ref_boxes), dtype=bool)
+        picked = np.where(cand_cls == class_id)[0]
+        for i in picked[np.argsort(-cand_conf[picked])]:
+            hit = False
+            if len(ref_boxes):
+                ious = np.where(used, 0.0, box_iou(cand_xyxy[i].astype(np.float64), ref_boxes))
+                best = int(ious.argmax())
+                if ious[best] >= iou_threshold:
+                    used[best] = hit = True
+            matches.setdefault(class_id, []).append((float(cand_conf[i]), hit))
+    return ref_counts
+
+
+def average_precision(matches, num_reference):
+    """All-point interpolated AP from (confidence, hit) pairs"""
+    if num_reference == 0:
+        return None
+    if not matches:
+        return 0.0
+    hits = np.array([hit for _, hit in sorted(matches, key=lambda m: -m[0])], dtype=np.float64)
+    true_positives = np.cumsum(hits)
+    recall = true_positives / num_reference
+    precision = true_positives / np.arange(1, len(hits) + 1)
+    recall = np.concatenate([[0.0], recall, [1.0]])
+    precision = np.concatenate([[1.0], precision, [0.0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    return float(np.sum((recall[1:] - recall[:-1]) * precision[1:]))
+
+
+def compare(baseline, candidate, pdf_paths, pages_per_pdf=50):
+    """Time both indexers on the same pages and score the candidate against the baseline"""
+    timings = {"baseline": 0.0, "candidate": 0.0}
+    matches, reference_counts = {}, {}
+    num_pages = 0
+    raster_dpi = baseline.detect_dpi or baseline.dpi
+
+    for pdf_path in pdf_paths:
+        pages = sample_page_indexes(baseline.get_page_count(pdf_path), pages_per_pdf)
+        batch = []
+        page_iter = baseline.iter_pdf_pages(pdf_path, pages=pages, dpi=raster_dpi)
+        for done, (_, image) in enumerate(page_iter, start=1):
+            batch.append(baseline.to_model_input(image))
+            image.close()
+            if len(batch) < baseline.batch_size and done < len(pages):
+                continue
+            start = time.perf_counter()
+            reference_boxes = baseline.detect_batch(batch)
+            timings["baseline"] += time.perf_counter() - start
+            start = time.perf_counter()
+            candidate_boxes = candidate.detect_batch(batch)
+            timings["candidate"] += time.perf_counter() - start
+
+            for reference, predicted in zip(reference_boxes, candidate_boxes):
+                for class_id, count in match_page(reference, predicted, matches).items():
+                    reference_counts[class_id] = reference_counts.get(class_id, 0) + count
+            num_pages += len(batch)
+            batch = []
+
+    per_class = {}
+    for class_id in sorted(set(reference_counts) | set(matches)):
+        class_matches = matches.get(class_id, [])
+        hits = sum(hit for _, hit in class_matches)
+        num_reference = reference_counts.get(class_id, 0)
+        per_class[baseline.class_names[class_id]] = {
+            "reference": num_reference,
+            "predicted": len(class_matches),
+            "recall": round(hits / num_reference, 4) if num_reference else None,
+            "precision": round(hits / len(class_matches), 4) if class_matches else None,
+            "ap50": average_precision(class_matches, num_reference)
+        }
+
+    aps = [stats["ap50"] for stats in per_class.values() if stats["ap50"] is not None]
+    return {
+        "pages": num_pages,
+        "baseline_seconds_per_page": round(timings["baseline"] / max(num_pages, 1), 4),
+        "candidate_seconds_per_page": round(timings["candidate"] / max(num_pages, 1), 4),
+        "speedup": round(timings["baseline"] / timings["candidate"], 2) if timings["candidate"] else None,
+        "map50": round(float(np.mean(aps)), 4) if aps else None,
+        "section_header_recall": per_class.get("Section-header", {}).get("recall"),
+        "per_class": per_class
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare an exported inference backend against PyTorch")
+    parser.add_argument('--backend', choices=['onnx', 'openvino'], default='onnx')
+    parser.add_argument('--model-path', default=None, help="Exported model (default: the backend's default path)")
+    parser.add_argument('--baseline-weights', default='yolov8x-doclaynet.pt')
+    parser.add_argument('--intra-op-threads', type=int, default=None)
+    parser.add_argument('--pdf', action='append', default=None, help="Sample PDF (repeatable; default: Input/*.pdf)")
+    parser.add_argument('--pages', type=int, default=50, help="Pages sampled per PDF")
+    parser.add_argument('--output', default=None, help="Write the report as JSON")
+    args = parser.parse_args(argv)
+
+    pdf_paths = args.pdf or [os.path.join('Input', f) for f in sorted(os.listdir('Input'))
+                             if f.lower().endswith('.pdf')]
+    baseline = make_indexer('ultralytics', args.baseline_weights)
+    candidate = make_indexer(args.backend, args.model_path, args.intra_op_threads)
+    report = compare(baseline, candidate, pdf_paths, args.pages)
+    report.update(backend=args.backend, model_path=candidate.model_path,
+                  intra_op_threads=candidate.model.intra_op_threads)
+
+    print(f"{report['pages']} pages: {report['baseline_seconds_per_page']}s/page (PyTorch) vs "
+          f"{report['candidate_seconds_per_page']}s/page ({args.backend}), speedup {report['speedup']}x")
+    print(f"mAP@0.5 vs baseline: {report['map50']}, Section-header recall: {report['section_header_recall']}")
+    for name, stats in report["per_class"].items():
+        print(f"  {name:<16} ref {stats['reference']:>5}  pred {stats['predicted']:>5}  "
+              f"recall {stats['recall']}  AP50 {None if stats['ap50'] is None else round(stats['ap50'], 4)}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=4)
+        print(f"Report saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
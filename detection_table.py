@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Detection table
+A book's detections held as flat NumPy columns instead of one dict per box:
+class ids, bboxes, confidences and offsets into a single UTF-8 text
+buffer, plus which pages the pre-filter skipped and the full-text word
+boxes. Any page range can be sliced out without touching the rest.
+"""
+
+import io
+import hashlib
+import numpy as np
+
+
+class DetectionTable:
+    """Detections of every page of one book, stored column-wise
+
+    Rows are grouped by page: rows page_offsets[p]:page_offsets[p + 1]
+    belong to page index p. Row i's header text is
+    text_data[text_offsets[i]:text_offsets[i + 1]]. Confidence is NaN for
+    detections that didn't come from the model (text layer). Per page,
+    skipped[p] indexes SKIP_REASONS and duplicate_of[p] is the 1-based page
+    a duplicate repeats (0 otherwise). Full-text word boxes are a ragged
+    array: row i's words are word_bboxes[word_offsets[i]:word_offsets[i + 1]]
+    with their text in word_text_data, and has_words[i] marks rows whose
+    detection carried a "words" list at all.
+    """
+
+    COLUMNS = ('page_offsets', 'class_ids', 'bboxes', 'confidences', 'text_offsets', 'text_data',
+               'skipped', 'duplicate_of',
+               'has_words', 'word_offsets', 'word_bboxes', 'word_text_offsets', 'word_text_data')
+    SKIP_REASONS = (None, 'blank', 'duplicate')
+
+    def __init__(self, class_names, page_offsets, class_ids, bboxes, confidences, text_offsets, text_data,
+                 skipped=None, duplicate_of=None, has_words=None, word_offsets=None, word_bboxes=None,
+                 word_text_offsets=None, word_text_data=None):
+        self.class_names = list(class_names)
+        self.page_offsets = page_offsets
+        self.class_ids = class_ids
+        self.bboxes = bboxes
+        self.confidences = confidences
+        self.text_offsets = text_offsets
+        self.text_data = text_data
+        num_pages = len(page_offsets) - 1
+        self.skipped = np.zeros(num_pages, dtype=np.uint8) if skipped is None else skipped
+        self.duplicate_of = np.zeros(num_pages, dtype=np.int32) if duplicate_of is None else duplicate_of
+        num_rows = len(class_ids)
+        self.has_words = np.zeros(num_rows, dtype=bool) if has_words is None else has_words
+        self.word_offsets = np.zeros(num_rows + 1, dtype=np.int64) if word_offsets is None else word_offsets
+        self.word_bboxes = np.zeros((0, 4), dtype=np.int16) if word_bboxes is None else word_bboxes
+        self.word_text_offsets = np.zeros(1, dtype=np.int64) if word_text_offsets is None else word_text_offsets
+        self.word_text_data = np.zeros(0, dtype=np.uint8) if word_text_data is None else word_text_data
+        digest = hashlib.sha1("\n".join(self.class_names).encode('utf-8'))
+        for name in self.COLUMNS:
+            digest.update(np.ascontiguousarray(getattr(self, name)).tobytes())
+        self.etag = digest.hexdigest()
+
+    @classmethod
+    def from_raw_results(cls, raw_results, class_names):
+        """Build the table from raw_results (one entry per page, in page order)"""
+        class_ids = {name: i for i, name in enumerate(class_names)}
+        page_offsets = np.zeros(len(raw_results) + 1, dtype=np.int32)
+        skipped = np.zeros(len(raw_results), dtype=np.uint8)
+        duplicate_of = np.zeros(len(raw_results), dtype=np.int32)
+        labels, boxes, confidences, texts = [], [], [], []
+        has_words, word_counts, word_boxes, word_texts = [], [], [], []
+        for page_index, image_results in enumerate(raw_results):
+            skipped[page_index] = cls.SKIP_REASONS.index(image_results.get("skipped"))
+            duplicate_of[page_index] = image_results.get("duplicate_of", 0)
+            for detection in image_results["detections"]:
+                labels.append(class_ids[detection["label"]])
+                boxes.append(detection["bbox"])
+                confidences.append(detection.get("confidence", np.nan))
+                texts.append(detection.get("text", "").encode('utf-8'))
+                words = detection.get("words")
+                has_words.append(words is not None)
+                word_counts.append(len(words or ()))
+                for word, x1, y1, x2, y2 in words or ():
+                    word_texts.append(word.encode('utf-8'))
+                    word_boxes.append((x1, y1, x2, y2))
+            page_offsets[page_index + 1] = len(labels)
+
+        word_offsets = np.zeros(len(word_counts) + 1, dtype=np.int64)
+        np.cumsum(word_counts, out=word_offsets[1:])
+        return cls(class_names, page_offsets,
+                   np.array(labels, dtype=np.uint8 if len(class_names) <= 256 else np.int32),
+                   cls._pack_bboxes(boxes), np.array(confidences, dtype=np.float32),
+                   *cls._pack_texts(texts), skipped, duplicate_of,
+                   np.array(has_words, dtype=bool), word_offsets, cls._pack_bboxes(word_boxes),
+                   *cls._pack_texts(word_texts))
+
+    @staticmethod
+    def _pack_bboxes(boxes):
+        bboxes = np.array(boxes, dtype=np.int32).reshape(-1, 4)
+        # Page-sized coordinates fit in int16 at any sensible DPI; keep int32 for the rest
+        if bboxes.size == 0 or (bboxes.min() >= np.iinfo(np.int16).min and bboxes.max() <= np.iinfo(np.int16).max):
+            bboxes = bboxes.astype(np.int16)
+        return bboxes
+
+    @staticmethod
+    def _pack_texts(texts):
+        # Encoded strings -> (offsets, one uint8 buffer)
+        offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+        np.cumsum([len(text) for text in texts], out=offsets[1:])
+        return offsets, np.frombuffer(b"".join(texts), dtype=np.uint8)
+
+    @property
+    def num_pages(self):
+        return len(self.page_offsets) - 1
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    @property
+    def nbytes(self):
+        return sum(getattr(self, name).nbytes for name in self.COLUMNS)
+
+    def text(self, row):
+        start, end = self.text_offsets[row], self.text_offsets[row + 1]
+        return self.text_data[start:end].tobytes().decode('utf-8')
+
+    def words(self, row):
+        """Row's full-text words as [word, x1, y1, x2, y2]"""
+        words = []
+        for n in range(self.word_offsets[row], self.word_offsets[row + 1]):
+            start, end = self.word_text_offsets[n], self.word_text_offsets[n + 1]
+            words.append([self.word_text_data[start:end].tobytes().decode('utf-8'), *self.word_bboxes[n].tolist()])
+        return words
+
+    def page_detections(self, page_index):
+        """One page's detections in the raw_results schema"""
+        detections = []
+        start, end = self.page_offsets[page_index], self.page_offsets[page_index + 1]
+        for row in range(start, end):
+            detection = {
+                "label": self.class_names[self.class_ids[row]],
+                "bbox": self.bboxes[row].tolist(),
+                "text": self.text(row)
+            }
+            if not np.isnan(self.confidences[row]):
+                detection["confidence"] = round(float(self.confidences[row]), 4)
+            if self.has_words[row]:
+                detection["words"] = self.words(row)
+            detections.append(detection)
+        return detections
+
+    def page_result(self, page_index):
+        """One page's raw_results entry"""
+        image_results = {"image": f'image_{page_index}.jpg', "detections": self.page_detections(page_index)}
+        if self.skipped[page_index]:
+            image_results["skipped"] = self.SKIP_REASONS[self.skipped[page_index]]
+        if self.duplicate_of[page_index]:
+            image_results["duplicate_of"] = int(self.duplicate_of[page_index])
+        return image_results
+
+    def page_results(self, start_page, end_page):
+        """raw_results entries for page indexes start_page..end_page - 1"""
+        return [self.page_result(page_index) for page_index in range(start_page, min(end_page, self.num_pages))]
+
+    def to_raw_results(self):
+        return self.page_results(0, self.num_pages)
+
+    def to_bytes(self):
+        """Serialize the columns (NumPy .npz, no pickling) for a shared session store"""
+        output = io.BytesIO()
+        np.savez(output, class_names=np.array(self.class_names),
+                 **{name: getattr(self, name) for name in self.COLUMNS})
+        return output.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        with np.load(io.BytesIO(data), allow_pickle=False) as columns:
+            # Tables saved before the per-page and word columns existed have no skipped pages or words
+            return cls(columns["class_names"].tolist(),
+                       *(columns[name] if name in columns else None for name in cls.COLUMNS))
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Progress event broker
+In-process publish/subscribe of per-session progress events, formatted as
+Server-Sent Events for the /events endpoint.
+"""
+
+import json
+import queue
+import threading
+
+
+def format_sse(event, data):
+    """Encode one Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventBroker:
+    """Fans progress events out to the subscribers of each session"""
+
+    def __init__(self, max_pending=1000):
+        # Events buffered per subscriber before the oldest are dropped
+        self.max_pending = max_pending
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, session_id):
+        """Register a listener; returns the queue its events arrive on"""
+        events = queue.Queue(maxsize=self.max_pending)
+        with self._lock:
+            self._subscribers.setdefault(session_id, []).append(events)
+        return events
+
+    def unsubscribe(self, session_id, events):
+        with self._lock:
+            listeners = self._subscribers.get(session_id, [])
+            if events in listeners:
+                listeners.remove(events)
+            if not listeners:
+                self._subscribers.pop(session_id, None)
+
+    def has_subscribers(self, session_id):
+        with self._lock:
+            return bool(self._subscribers.get(session_id))
+
+    def publish(self, session_id, event, data):
+        """Deliver an event to every current subscriber of a session"""
+        with self._lock:
+            listeners = list(self._subscribers.get(session_id, []))
+        for events in listeners:
+            try:
+                events.put_nowait((event, data))
+            except queue.Full:
+                # Slow client: drop its oldest event rather than block the worker
+                try:
+                    events.get_nowait()
+                    events.put_nowait((event, data))
+                except (queue.Empty, queue.Full):
+                    pass
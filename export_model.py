@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Model export
+One-time export of yolov8x-doclaynet.pt for the CPU inference backends:
+ONNX (optionally INT8-quantized with pages from sample PDFs as the
+calibration set) or OpenVINO IR.
+
+    python export_model.py                                   # yolov8x-doclaynet.onnx
+    python export_model.py --int8 --calibration Input/IntroductionChapter.pdf
+    python export_model.py --format openvino
+
+Then run the app with BOOKMAP_BACKEND=onnx (or openvino) and, for the INT8
+graph, BOOKMAP_MODEL_PATH=yolov8x-doclaynet-int8.onnx.
+"""
+
+import os
+import sys
+import argparse
+import numpy as np
+from ultralytics import YOLO
+from book_indexer_web_fixed import BookIndexerWeb
+from inference_backends import to_tensor
+
+try:
+    from onnxruntime.quantization import (CalibrationDataReader, CalibrationMethod, QuantFormat,
+                                          QuantType, quantize_static)
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+except ImportError:  # Optional: only needed for --int8
+    CalibrationDataReader = object
+    quantize_static = None
+
+
+def sample_page_indexes(num_pages, count):
+    """count page indexes spread evenly over a book"""
+    if num_pages <= count:
+        return list(range(num_pages))
+    return sorted(set(np.linspace(0, num_pages - 1, count).round().astype(int).tolist()))
+
+
+class PageCalibrationReader(CalibrationDataReader):
+    """Feeds rasterized sample pages to the INT8 calibrator one at a time"""
+
+    def __init__(self, indexer, pdf_paths, input_name, imgsz=640, max_pages=64):
+        self.indexer = indexer
+        self.pdf_paths = pdf_paths
+        self.input_name = input_name
+        self.imgsz = imgsz
+        self.max_pages = max_pages
+        self._pages = self.iter_inputs()
+
+    def iter_inputs(self):
+        per_pdf = max(1, -(-self.max_pages // len(self.pdf_paths)))
+        raster_dpi = self.indexer.detect_dpi or self.indexer.dpi
+        fed = 0
+        for pdf_path in self.pdf_paths:
+            pages = sample_page_indexes(self.indexer.get_page_count(pdf_path), per_pdf)
+            for _, image in self.indexer.iter_pdf_pages(pdf_path, pages=pages, dpi=raster_dpi):
+                tensor, _ = to_tensor([self.indexer.to_model_input(image)], self.imgsz)
+                image.close()
+                yield {self.input_name: tensor}
+                fed += 1
+                if fed >= self.max_pages:
+                    return
+
+    def get_next(self):
+        return next(self._pages, None)
+
+
+def head_nodes(onnx_path, prefix='/model.22/'):
+    """Names of the Detect head's nodes, which lose too much accuracy when quantized"""
+    import onnx
+    model = onnx.load(onnx_path, load_external_data=False)
+    return [node.name for node in model.graph.node if node.name.startswith(prefix)]
+
+
+def quantize_int8(onnx_path, output_path, pdf_paths, max_pages=64, imgsz=640, exclude_head=True):
+    """Static INT8 quantization (QDQ, per-channel weights) calibrated on sample pages"""
+    if quantize_static is None:
+        raise Exception("onnxruntime is not installed")
+    import onnxruntime
+
+    prepared_path = os.path.splitext(output_path)[0] + '-prep.onnx'
+    quant_pre_process(onnx_path, prepared_path)
+    input_name = onnxruntime.InferenceSession(
+        prepared_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    indexer = BookIndexerWeb()
+    reader = PageCalibrationReader(indexer, pdf_paths, input_name, imgsz, max_pages)
+    try:
+        quantize_static(
+            prepared_path, output_path, reader,
+            quant_format=QuantFormat.QDQ,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            calibrate_method=CalibrationMethod.MinMax,
+            nodes_to_exclude=head_nodes(prepared_path) if exclude_head else []
+        )
+    finally:
+        if os.path.exists(prepared_path):
+            os.remove(prepared_path)
+    return output_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the layout model for the ONNX / OpenVINO backends")
+    parser.add_argument('--weights', default='yolov8x-doclaynet.pt')
+    parser.add_argument('--format', choices=['onnx', 'openvino'], default='onnx')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--int8', action='store_true', help="Also write an INT8-quantized ONNX graph")
+    parser.add_argument('--calibration', action='append', default=None,
+                        help="PDF whose pages calibrate INT8 ranges (repeatable; default: Input/*.pdf)")
+    parser.add_argument('--calibration-pages', type=int, default=64)
+    parser.add_argument('--quantize-head', action='store_true',
+                        help="Quantize the Detect head too (smaller, usually less accurate)")
+    parser.add_argument('--output', default=None, help="Path of the INT8 graph (default: <weights>-int8.onnx)")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.weights):
+        print(f"Model file not found at: {args.weights}")
+        return 2
+
+    # Dynamic batch so the backend can run a whole page batch per call
+    exported = YOLO(args.weights).export(format=args.format, imgsz=args.imgsz, dynamic=True,
+                                         simplify=args.format == 'onnx')
+    print(f"Exported {args.format} model to: {exported}")
+
+    if args.int8:
+        if args.format != 'onnx':
+            print("--int8 applies to the ONNX graph; OpenVINO can also run the INT8 ONNX file directly")
+            return 2
+        pdf_paths = args.calibration or [os.path.join('Input', f) for f in sorted(os.listdir('Input'))
+                                         if f.lower().endswith('.pdf')]
+        if not pdf_paths:
+            print("No calibration PDFs found")
+            return 2
+        output = args.output or os.path.splitext(args.weights)[0] + '-int8.onnx'
+        quantize_int8(exported, output, pdf_paths, args.calibration_pages, args.imgsz,
+                      exclude_head=not args.quantize_head)
+        print(f"INT8 model written to: {output}")
+        print(f"Run with BOOKMAP_BACKEND=onnx BOOKMAP_MODEL_PATH={output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Gunicorn configuration
+Each worker loads and warms its own copy of the model right after it is
+forked; /health/ready answers 503 until that has finished.
+
+    gunicorn -c gunicorn.conf.py app:app
+"""
+
+import os
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 5000)}"
+# Sessions in the default 'memory' store, and their jobs, page sinks and events, belong to one
+# process: a request for a session landing on another worker would not find it. Several
+# workers need a shared store (BOOKMAP_SESSION_STORE=sqlite:///...)
+shared_sessions = os.environ.get('BOOKMAP_SESSION_STORE', 'memory').startswith('sqlite:')
+workers = int(os.environ.get('WEB_CONCURRENCY', 2 if shared_sessions else 1))
+if workers > 1 and not shared_sessions:
+    print(f"Warning: {workers} workers with the per-process session store; "
+          f"set BOOKMAP_SESSION_STORE=sqlite:///... or WEB_CONCURRENCY=1")
+# Threaded workers keep /events streams from tying up a whole worker
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 8))
+# The first model load can take a while on a cold node
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+
+# Loading is driven by post_fork below: a thread started while importing the
+# app in the master (with preload_app) would not survive the fork
+os.environ.setdefault('BOOKMAP_WARM_ON_IMPORT', 'false')
+
+
+def post_fork(server, worker):
+    from app import init_worker
+    init_worker()
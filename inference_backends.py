@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Inference backends
+CPU execution paths for YOLOv8 weights exported to ONNX (ONNX Runtime) or
+OpenVINO IR. Each backend mimics the slice of the ultralytics predict API
+the indexer uses, so it can stand in for the YOLO model object.
+"""
+
+import os
+import numpy as np
+from PIL import Image
+
+try:
+    import cv2
+except ImportError:  # Optional: letterboxing falls back to Pillow
+    cv2 = None
+
+try:
+    import onnxruntime
+except ImportError:  # Optional: only needed for the 'onnx' backend
+    onnxruntime = None
+
+try:
+    from openvino.runtime import Core as OpenVINOCore
+except ImportError:  # Optional: only needed for the 'openvino' backend
+    OpenVINOCore = None
+
+BACKENDS = ('ultralytics', 'onnx', 'openvino')
+
+
+class Boxes:
+    """Detections of one page, shaped like ultralytics' result.boxes"""
+
+    def __init__(self, xyxy, cls, conf):
+        self.xyxy = xyxy
+        self.cls = cls
+        self.conf = conf
+
+    def __len__(self):
+        return len(self.cls)
+
+
+class Result:
+    """One page's prediction, shaped like an ultralytics result"""
+
+    def __init__(self, boxes):
+        self.boxes = boxes
+
+
+def letterbox(image, size=640, fill=114):
+    """Resize a BGR page to fit a size x size square, padding the rest like ultralytics' LetterBox
+
+    Returns (padded image, scale ratio, (pad_x, pad_y)).
+    """
+    height, width = image.shape[:2]
+    ratio = min(size / height, size / width)
+    new_width, new_height = int(round(width * ratio)), int(round(height * ratio))
+    if (new_width, new_height) != (width, height):
+        if cv2 is not None:
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        else:
+            image = np.asarray(Image.fromarray(image).resize((new_width, new_height), Image.BILINEAR))
+    pad_x, pad_y = (size - new_width) / 2, (size - new_height) / 2
+    left, top = int(round(pad_x - 0.1)), int(round(pad_y - 0.1))
+    padded = np.full((size, size, 3), fill, dtype=np.uint8)
+    padded[top:top + new_height, left:left + new_width] = image
+    return padded, ratio, (left, top)
+
+
+def to_tensor(images, size=640):
+    """Letterbox BGR pages into one (batch, 3, size, size) float tensor
+
+    Returns the tensor and, per page, (ratio, pad, original height/width) for
+    mapping boxes back onto the page.
+    """
+    tensors, letterboxes = [], []
+    for image in images:
+        padded, ratio, pad = letterbox(image, size)
+        # BGR HWC uint8 -> RGB CHW float in [0, 1]
+        tensors.append(padded[:, :, ::-1].transpose(2, 0, 1))
+        letterboxes.append((ratio, pad, image.shape[:2]))
+    tensor = np.ascontiguousarray(np.stack(tensors), dtype=np.float32) / 255.0
+    return tensor, letterboxes
+
+
+def nms(boxes, scores, iou_threshold):
+    """Greedy non-maximum suppression; returns the indexes of the boxes kept"""
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter = (np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None) *
+                 np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None))
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+class ExportedYoloBackend:
+    """Shared pre/post-processing for exported YOLOv8 detection graphs
+
+    The graph takes a (batch, 3, imgsz, imgsz) float tensor and returns
+    (batch, 4 + num_classes, anchors) with xywh boxes and class scores.
+    Thresholds default to ultralytics' predict defaults so results match
+    the PyTorch path.
+    """
+
+    name = 'exported'
+
+    def __init__(self, model_path, imgsz=640, conf=0.25, iou=0.7, max_det=300, intra_op_threads=None):
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.conf = conf
+        self.iou = iou
+        self.max_det = max_det
+        self.intra_op_threads = intra_op_threads or os.cpu_count() or 1
+        # None when the graph accepts any batch size
+        self.fixed_batch = None
+
+    def run(self, tensor):
+        """Execute the graph on a (batch, 3, imgsz, imgsz) tensor"""
+        raise NotImplementedError
+
+    def postprocess(self, prediction, letterbox_info):
+        ratio, (pad_x, pad_y), (height, width) = letterbox_info
+        prediction = prediction.T  # (anchors, 4 + num_classes)
+        scores = prediction[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(scores)), class_ids]
+        mask = confidences > self.conf
+        boxes, class_ids, confidences = prediction[mask, :4], class_ids[mask], confidences[mask]
+
+        xyxy = np.empty_like(boxes)
+        xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+        xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+        xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+        xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+
+        # Class-aware NMS: offset each class so boxes of different classes never overlap
+        offsets = class_ids[:, None].astype(np.float32) * 7680
+        keep = nms(xyxy + offsets, confidences, self.iou)[:self.max_det]
+        xyxy, class_ids, confidences = xyxy[keep], class_ids[keep], confidences[keep]
+
+        xyxy[:, [0, 2]] = ((xyxy[:, [0, 2]] - pad_x) / ratio).clip(0, width)
+        xyxy[:, [1, 3]] = ((xyxy[:, [1, 3]] - pad_y) / ratio).clip(0, height)
+        return Result(Boxes(xyxy.astype(np.float32), class_ids.astype(np.float32),
+                            confidences.astype(np.float32)))
+
+    def predict(self, images, verbose=False):
+        """Detect layout elements on BGR page arrays; one Result per page"""
+        tensor, letterboxes = to_tensor(images, self.imgsz)
+        step = self.fixed_batch or len(images)
+        results = []
+        for start in range(0, len(images), step):
+            chunk = tensor[start:start + step]
+            if self.fixed_batch and len(chunk) < self.fixed_batch:
+                # Fixed-batch graph: pad the last chunk with blank pages and drop their outputs
+                padding = np.zeros((self.fixed_batch - len(chunk),) + chunk.shape[1:], dtype=np.float32)
+                chunk = np.concatenate([chunk, padding])
+            output = self.run(chunk)
+            for i, info in enumerate(letterboxes[start:start + step]):
+                results.append(self.postprocess(output[i], info))
+        return results
+
+
+class OnnxRuntimeBackend(ExportedYoloBackend):
+    """Runs an exported (optionally INT8-quantized) ONNX graph with ONNX Runtime on CPU"""
+
+    name = 'onnx'
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(model_path, **kwargs)
+        if onnxruntime is None:
+            raise Exception("onnxruntime is not installed")
+        options = onnxruntime.SessionOptions()
+        options.intra_op_num_threads = self.intra_op_threads
+        # Pages are already serialized behind the predict lock; one inter-op thread avoids oversubscription
+        options.inter_op_num_threads = 1
+        options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=['CPUExecutionProvider'])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        if isinstance(model_input.shape[0], int):
+            self.fixed_batch = model_input.shape[0]
+        if isinstance(model_input.shape[2], int):
+            self.imgsz = model_input.shape[2]
+
+    def run(self, tensor):
+        return self.session.run(None, {self.input_name: tensor})[0]
+
+
+class OpenVINOBackend(ExportedYoloBackend):
+    """Runs an OpenVINO IR (.xml) or ONNX graph with the OpenVINO CPU plugin"""
+
+    name = 'openvino'
+
+    def __init__(self, model_path, **kwargs):
+        super().__init__(model_path, **kwargs)
+        if OpenVINOCore is None:
+            raise Exception("openvino is not installed")
+        core = OpenVINOCore()
+        model = core.read_model(model_path)
+        self.compiled = core.compile_model(model, 'CPU', {
+            'INFERENCE_NUM_THREADS': str(self.intra_op_threads),
+            'PERFORMANCE_HINT': 'LATENCY'
+        })
+        self.output = self.compiled.output(0)
+        shape = model.input(0).get_partial_shape()
+        if shape[0].is_static:
+            self.fixed_batch = shape[0].get_length()
+        if shape[2].is_static:
+            self.imgsz = shape[2].get_length()
+
+    def run(self, tensor):
+        return self.compiled([tensor])[self.output]
+
+
+def make_backend(kind, model_path, **kwargs):
+    """Build an exported-model backend: 'onnx' or 'openvino'"""
+    if kind == 'onnx':
+        return OnnxRuntimeBackend(model_path, **kwargs)
+    if kind == 'openvino':
+        return OpenVINOBackend(model_path, **kwargs)
+    raise ValueError(f"Unknown inference backend: {kind}")
@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - In-process job scheduler
+A bounded job queue drained by a pool of worker threads, with cancellation
+and queue-position reporting for the upload endpoint. Waiting jobs run
+shortest first by estimated cost (pages x measured seconds per page), with
+aging so long jobs are not starved, and a page budget bounds the backlog.
+"""
+
+import os
+import time
+import threading
+
+
+class QueueFull(Exception):
+    """Raised when a job is submitted while the queue is at capacity"""
+    pass
+
+
+class BacklogFull(QueueFull):
+    """Raised when a job's pages would take the backlog over the page budget"""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        # Estimated seconds until enough of the backlog has drained
+        self.retry_after = retry_after
+
+
+class JobCancelled(Exception):
+    """Raised inside a running job once it has been cancelled"""
+    pass
+
+
+class Job:
+    """A unit of work tracked by the scheduler"""
+
+    def __init__(self, job_id, func, args, kwargs, pages=0):
+        self.job_id = job_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        # Pages to process; the basis of the job's cost estimate
+        self.pages = pages
+        self.state = 'queued'
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.error = None
+        self._cancel_event = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def check_cancelled(self):
+        """Raise JobCancelled if cancellation was requested; call from long-running loops"""
+        if self._cancel_event.is_set():
+            raise JobCancelled(f"Job {self.job_id} was cancelled")
+
+
+class JobScheduler:
+    """Bounded shortest-job-first queue plus a pool of daemon worker threads
+
+    Job functions are called as func(job, *args, **kwargs) so they can poll
+    job.check_cancelled() between stages. A waiting job's priority is its
+    estimated seconds minus aging x seconds waited, so a long job overtaken
+    by short ones runs once it has waited about as long as its cost
+    difference / aging. Jobs without a page count keep FIFO order.
+    """
+
+    def __init__(self, num_workers=None, max_queue=None, max_backlog_pages=None, aging=1.0,
+                 seconds_per_page=1.0, smoothing=0.3):
+        self.num_workers = max(1, int(num_workers or os.cpu_count() or 1))
+        self.max_queue = max(1, int(max_queue or self.num_workers * 4))
+        # Pages queued or still to do in running jobs before submit refuses new work (None: no limit)
+        self.max_backlog_pages = max_backlog_pages
+        self.aging = aging
+        # Exponential moving average of measured seconds per page, updated by record_run
+        self.seconds_per_page = seconds_per_page
+        self.smoothing = smoothing
+        self._pending = []
+        self._jobs = {}
+        self._running = set()
+        self._cond = threading.Condition()
+        self._workers = []
+        self._pid = None
+
+    def _ensure_workers(self):
+        # Threads don't survive fork, so (re)start them lazily in the serving process
+        if self._pid == os.getpid() and all(w.is_alive() for w in self._workers):
+            return
+        self._pid = os.getpid()
+        self._workers = []
+        for i in range(self.num_workers):
+            worker = threading.Thread(target=self._worker_loop, name=f'bookmap-worker-{i}', daemon=True)
+            worker.start()
+            self._workers.append(worker)
+
+    def submit(self, job_id, func, *args, pages=0, **kwargs):
+        """Queue a job of a given number of pages
+        
+        Raises QueueFull when max_queue jobs are already waiting and
+        BacklogFull when the pages would exceed max_backlog_pages.
+        """
+        with self._cond:
+            self._check_admission(pages)
+            job = Job(job_id, func, args, kwargs, pages)
+            self._jobs[job_id] = job
+            self._pending.append(job)
+            self._ensure_workers()
+            self._cond.notify()
+        return job
+
+    def _check_admission(self, pages):
+        if len(self._pending) >= self.max_queue:
+            raise QueueFull(f"Job queue is full ({self.max_queue} jobs waiting)")
+        if self.max_backlog_pages is not None and pages:
+            backlog = self._backlog_pages(time.time())
+            excess = backlog + pages - self.max_backlog_pages
+            # An idle server always takes a job, however large
+            if excess > 0 and backlog > 0:
+                retry_after = max(1, int(excess * self.seconds_per_page / self.num_workers))
+                raise BacklogFull(f"{int(backlog)} pages are already waiting "
+                                  f"(budget {self.max_backlog_pages})", retry_after)
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; returns False if it is unknown or already finished"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in ('queued', 'running'):
+                return False
+            job._cancel_event.set()
+            if job.state == 'queued':
+                self._pending.remove(job)
+                job.state = 'cancelled'
+                job.finished_at = time.time()
+        return True
+
+    def get_job(self, job_id):
+        return self._jobs.get(job_id)
+
+    def forget(self, job_id):
+        """Drop bookkeeping for a finished job"""
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is not None and job.state not in ('queued', 'running'):
+                del self._jobs[job_id]
+
+    def queue_position(self, job_id):
+        """1-based position of a waiting job in run order, or None if it is not queued"""
+        with self._cond:
+            for position, job in enumerate(self._ordered_pending(time.time()), start=1):
+                if job.job_id == job_id:
+                    return position
+        return None
+
+    def record_run(self, pages, seconds):
+        """Fold a finished job's measured time into the seconds-per-page estimate
+
+        pages should count only the pages that went through the model; a job
+        with none is ignored.
+        """
+        if pages <= 0 or seconds <= 0:
+            return
+        with self._cond:
+            self.seconds_per_page += self.smoothing * (seconds / pages - self.seconds_per_page)
+
+    def _remaining_seconds(self, job, now):
+        estimate = job.pages * self.seconds_per_page
+        if job.started_at is not None:
+            estimate = max(0.0, estimate - (now - job.started_at))
+        return estimate
+
+    def _backlog_pages(self, now):
+        seconds = sum(self._remaining_seconds(job, now) for job in self._pending)
+        seconds += sum(self._remaining_seconds(self._jobs[job_id], now) for job_id in self._running
+                       if job_id in self._jobs)
+        return seconds / self.seconds_per_page if self.seconds_per_page else 0.0
+
+    def _priority(self, job, now):
+        return job.pages * self.seconds_per_page - self.aging * (now - job.submitted_at), job.submitted_at
+
+    def _ordered_pending(self, now):
+        return sorted(self._pending, key=lambda job: self._priority(job, now))
+
+    def estimate(self, job_id):
+        """Queue wait so far and estimated seconds until a job starts and completes, or None if unknown
+        
+        Assumes the jobs ahead of it and the running ones share the workers evenly.
+        """
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None or job.state not in ('queued', 'running'):
+                return None
+            now = time.time()
+            own_seconds = self._remaining_seconds(job, now)
+            result = {"estimated_job_seconds": round(job.pages * self.seconds_per_page, 1)}
+            if job.state == 'running':
+                result["queue_wait_seconds"] = round(job.started_at - job.submitted_at, 1)
+                result["estimated_start_seconds"] = 0.0
+                result["estimated_completion_seconds"] = round(own_seconds, 1)
+                return result
+            ahead = sum(self._remaining_seconds(self._jobs[job_id], now) for job_id in self._running
+                        if job_id in self._jobs)
+            for other in self._ordered_pending(now):
+                if other is job:
+                    break
+                ahead += self._remaining_seconds(other, now)
+            start = ahead / self.num_workers
+            result["queue_wait_seconds"] = round(now - job.submitted_at, 1)
+            result["estimated_start_seconds"] = round(start, 1)
+            result["estimated_completion_seconds"] = round(start + own_seconds, 1)
+            return result
+
+    def queued_count(self):
+        with self._cond:
+            return len(self._pending)
+
+    def in_flight(self):
+        with self._cond:
+            return len(self._running)
+
+    def _next_job(self):
+        now = time.time()
+        job = min(self._pending, key=lambda job: self._priority(job, now))
+        self._pending.remove(job)
+        return job
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                job = self._next_job()
+                job.state = 'running'
+                job.started_at = time.time()
+                self._running.add(job.job_id)
+
+            try:
+                job.func(job, *job.args, **job.kwargs)
+                job.state = 'cancelled' if job.cancelled else 'completed'
+            except JobCancelled:
+                job.state = 'cancelled'
+            except Exception as e:
+                job.state = 'error'
+                job.error = str(e)
+                print(f"Job {job.job_id} failed: {e}")
+            finally:
+                job.finished_at = time.time()
+                with self._cond:
+                    self._running.discard(job.job_id)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Page pre-filter
+Cheap checks on rasterized pages before they reach the layout model: blank
+pages (ink coverage from the grey-level histogram) and repeats of an earlier
+page (same pixels; optionally a close difference hash confirmed by a pixel
+comparison). A digest of the same
+downscaled page is the per-page cache key, so a page seen in an earlier
+upload reuses its detections.
+"""
+
+import hashlib
+from collections import namedtuple, OrderedDict
+import numpy as np
+from PIL import Image
+
+# verdict: 'blank', 'duplicate' or None (needs detection); original: page index a duplicate repeats;
+# page_hash: difference hash; digest: exact digest of the downscaled page, the cross-upload cache key
+PageCheck = namedtuple('PageCheck', ['verdict', 'original', 'page_hash', 'digest'])
+
+
+def ink_coverage(gray, margin=0.04):
+    """Fraction of a greyscale page that is ink, ignoring scan borders
+
+    Ink is anything clearly darker than the paper, whose level is taken from
+    the histogram rather than assumed white, so grey or yellowed scans work.
+    """
+    height, width = gray.shape
+    dy, dx = int(height * margin), int(width * margin)
+    gray = gray[dy:height - dy, dx:width - dx]
+    hist = np.bincount(gray.ravel(), minlength=256)
+    cumulative = np.cumsum(hist)
+    # Paper: the grey level below which 60% of the page lies (most of a page is paper)
+    paper = int(np.searchsorted(cumulative, 0.6 * cumulative[-1]))
+    ink_level = max(paper - 80, 0)
+    return float(cumulative[ink_level]) / max(int(cumulative[-1]), 1) if ink_level else 0.0
+
+
+def difference_hash(gray_image, size=16):
+    """size * size bit difference hash of a greyscale PIL image, as bytes"""
+    small = np.asarray(gray_image.resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    return np.packbits(small[:, 1:] > small[:, :-1]).tobytes()
+
+
+class PageFilter:
+    """Blank / duplicate checks for the pages of one book, in page order
+
+    A page is a duplicate when its downscaled pixels equal an earlier page's.
+    With duplicate_bits > 0, pages whose difference hashes are that close
+    are candidates too, but only count once a pixel comparison agrees:
+    sparse pages (chapter openers, part titles) have near-identical hashes
+    whatever their text. Pixels are kept for the max_compared most recently
+    seen or matched pages only, so memory stays flat on long books.
+    """
+
+    def __init__(self, blank_ink=0.0002, duplicate_bits=0, analysis_width=400, max_pixel_diff=0.05,
+                 max_compared=64):
+        self.blank_ink = blank_ink
+        self.duplicate_bits = duplicate_bits
+        self.analysis_width = analysis_width
+        # Most pixels that may differ, as a fraction of the two pages' ink
+        self.max_pixel_diff = max_pixel_diff
+        self.max_compared = max_compared
+        self._digests = {}
+        self._hashes = []
+        self._pages = []
+        # Position in _hashes -> downscaled pixels, least recently used first
+        self._pixels = OrderedDict()
+
+    def _same_pixels(self, first, second):
+        if first.shape != second.shape:
+            return False
+        paper = min(int(np.median(first)), int(np.median(second)))
+        ink = np.count_nonzero(first < paper - 80) + np.count_nonzero(second < paper - 80)
+        differing = np.count_nonzero(np.abs(first.astype(np.int16) - second) > 64)
+        return differing <= self.max_pixel_diff * max(ink / 2, 1)
+
+    def check(self, page_index, image):
+        """PageCheck for the next page of the book"""
+        factor = max(1, image.width // self.analysis_width)
+        gray = image.convert('L')
+        if factor > 1:
+            gray = gray.reduce(factor)
+        pixels = np.asarray(gray, dtype=np.uint8)
+        page_hash = difference_hash(gray)
+        # Duplicates share detections within a book; across uploads the same digest shares cached ones
+        digest = hashlib.sha256(page_hash + pixels.tobytes()).digest()
+        if ink_coverage(pixels) < self.blank_ink:
+            return PageCheck('blank', None, page_hash, digest)
+
+        if digest in self._digests:
+            return PageCheck('duplicate', self._digests[digest], page_hash, digest)
+        self._digests[digest] = page_index
+        if not self.duplicate_bits:
+            return PageCheck(None, None, page_hash, digest)
+
+        if self._hashes:
+            seen = np.frombuffer(b"".join(self._hashes), dtype=np.uint8).reshape(len(self._hashes), -1)
+            current = np.frombuffer(page_hash, dtype=np.uint8)
+            distances = np.unpackbits(seen ^ current, axis=1).sum(axis=1)
+            for candidate in np.argsort(distances, kind='stable').tolist():
+                if distances[candidate] > self.duplicate_bits:
+                    break
+                # A candidate whose pixels were evicted can't be confirmed, so it isn't a match
+                if candidate in self._pixels and self._same_pixels(self._pixels[candidate], pixels):
+                    self._pixels.move_to_end(candidate)
+                    return PageCheck('duplicate', self._pages[candidate], page_hash, digest)
+
+        self._pixels[len(self._hashes)] = pixels
+        if len(self._pixels) > self.max_compared:
+            self._pixels.popitem(last=False)
+        self._hashes.append(page_hash)
+        self._pages.append(page_index)
+        return PageCheck(None, None, page_hash, digest)
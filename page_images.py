@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Page image pyramid
+Viewer images of each page at a few fixed resolutions (thumbnail, screen,
+full), encoded as WebP or progressive JPEG on first request and cached in
+the session folder.
+"""
+
+import os
+import io
+from PIL import Image, features
+
+# Resolution of each size in DPI; None keeps the resolution the page was rendered at.
+# Sizes are DPI rather than pixels so bboxes map onto any of them with one factor.
+PAGE_SIZES = {'thumb': 24, 'screen': 110, 'full': None}
+
+# Pillow builds without libwebp fall back to progressive JPEG
+WEBP_AVAILABLE = features.check('webp')
+
+MIMETYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+
+
+def variant_dpi(size, source_dpi):
+    """Resolution a size is served at; pages are never upscaled"""
+    dpi = PAGE_SIZES[size]
+    return source_dpi if dpi is None else min(dpi, source_dpi)
+
+
+def resize_page(image, source_dpi, dpi):
+    """Downscale a page rendered at source_dpi to dpi"""
+    if dpi >= source_dpi:
+        return image
+    factor = dpi / source_dpi
+    size = (max(1, round(image.width * factor)), max(1, round(image.height * factor)))
+    # reducing_gap shrinks by whole factors first, which is much faster for thumbnails
+    return image.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+
+def encode_page(image, image_format, quality=80):
+    """Encode a page as WebP or progressive JPEG"""
+    output = io.BytesIO()
+    image = image.convert('RGB')
+    if image_format == 'webp':
+        image.save(output, 'WEBP', quality=quality, method=4)
+    else:
+        image.save(output, 'JPEG', quality=quality, progressive=True, optimize=True)
+    return output.getvalue()
+
+
+class PageImageCache:
+    """Encoded page variants of one session, under <session dir>/pages/<size>/"""
+
+    def __init__(self, temp_dir):
+        self.folder = os.path.join(temp_dir, 'pages')
+
+    def path(self, page_index, size, image_format):
+        return os.path.join(self.folder, size, f'image_{page_index}.{image_format}')
+
+    def open(self, page_index, size, image_format):
+        """Readable file object for a cached variant, or None"""
+        try:
+            return open(self.path(page_index, size, image_format), 'rb')
+        except OSError:
+            return None
+
+    def save(self, page_index, size, image_format, data):
+        """Store an encoded variant; written through a temporary name so readers never see half a file"""
+        path = self.path(page_index, size, image_format)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Page sharding
+Splits a book's scanned pages into contiguous slices that worker processes
+rasterize, detect and OCR in parallel; the parent merges the per-page
+results back in page order.
+"""
+
+import os
+import sys
+import time
+import queue
+import threading
+import multiprocessing
+
+# The indexer used by this worker process
+_indexer = None
+
+
+def split_shards(pages, num_shards, min_pages=1):
+    """Split sorted page indexes into at most num_shards contiguous slices of at least min_pages"""
+    pages = sorted(pages)
+    if not pages:
+        return []
+    num_shards = max(1, min(num_shards, len(pages) // max(1, min_pages)))
+    size, extra = divmod(len(pages), num_shards)
+    shards, start = [], 0
+    for i in range(num_shards):
+        end = start + size + (1 if i < extra else 0)
+        shards.append(pages[start:end])
+        start = end
+    return shards
+
+
+def limit_threads(num_threads):
+    """Cap the math libraries' thread pools so N workers don't oversubscribe the cores"""
+    for name in ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS'):
+        os.environ[name] = str(num_threads)
+    if 'torch' in sys.modules:
+        # Already imported (fork / forkserver preload): the env vars came too late
+        sys.modules['torch'].set_num_threads(num_threads)
+
+
+def init_worker(source, num_threads):
+    """Pool initializer: set up this process's indexer
+
+    source is the parent's indexer when the pool forks (its loaded model is
+    then shared copy-on-write), otherwise a settings dict applied to this
+    process's own indexer, which loads its own copy of the model.
+    """
+    global _indexer
+    limit_threads(num_threads)
+
+    if isinstance(source, dict):
+        from book_indexer_web_fixed import book_indexer_web
+        _indexer = book_indexer_web
+        for name, value in source.items():
+            setattr(_indexer, name, value)
+    else:
+        _indexer = source
+        # Locks and thread pools copied by fork may be in a state no thread here can release
+        _indexer._predict_lock = threading.Lock()
+        _indexer._ocr_pool_lock = threading.Lock()
+        _indexer._ocr_pool = None
+        if _indexer.backend != 'ultralytics':
+            # Runtime sessions don't survive a fork; load a fresh one
+            _indexer.model = None
+
+    _indexer.ocr_workers = num_threads
+    _indexer.intra_op_threads = num_threads
+    if _indexer.model is None:
+        try:
+            _indexer.load_model()
+        except Exception as e:
+            # Reported by run_shard; raising here would make the pool respawn workers forever
+            print(f"Shard worker {os.getpid()} could not load the model: {e}")
+
+
+def run_shard(pdf_path, pages, sink_kind=None, temp_dir=None, annotated=False, layout='model'):
+    """Rasterize, detect and OCR one slice of pages in this worker"""
+    from page_sinks import make_page_sink
+    if layout != 'heuristic' and _indexer.model is None and not _indexer.load_model():
+        raise Exception(f"Model not loaded in shard worker {os.getpid()}")
+    start = time.perf_counter()
+    sink = make_page_sink(sink_kind, temp_dir, annotated)
+    results, peak_memory_mb = _indexer.run_vision_pipeline(pdf_path, pages, sink, layout=layout)
+    return {
+        "results": results,
+        "pages": len(pages),
+        "seconds": time.perf_counter() - start,
+        "peak_memory_mb": peak_memory_mb,
+        "pid": os.getpid()
+    }
+
+
+class ShardPool:
+    """Long-lived pool of shard workers, started on first use
+
+    The default start method is forkserver where available: workers are
+    forked from a clean single-threaded server rather than from the
+    multi-threaded web process, and each loads its own model once.
+    """
+
+    def __init__(self, indexer, num_workers, start_method=None):
+        self.indexer = indexer
+        self.num_workers = num_workers
+        methods = multiprocessing.get_all_start_methods()
+        self.start_method = start_method or ('forkserver' if 'forkserver' in methods else 'spawn')
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_pool(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                context = multiprocessing.get_context(self.start_method)
+                if self.start_method == 'forkserver':
+                    # Import the heavy ML stack once in the server; workers inherit it
+                    context.set_forkserver_preload(['book_indexer_web_fixed'])
+                source = self.indexer if self.start_method == 'fork' else self.indexer.shard_config()
+                threads = max(1, (os.cpu_count() or 1) // self.num_workers)
+                self._pool = context.Pool(self.num_workers, initializer=init_worker, initargs=(source, threads))
+                self._pid = os.getpid()
+            return self._pool
+
+    def run(self, pdf_path, shards, sink_kind=None, temp_dir=None, annotated=False, layout='model'):
+        """Yield each shard's output as it finishes, with at most num_workers shards in flight
+
+        Feeding shards gradually means a caller that stops iterating (e.g. a
+        cancelled job) leaves at most one shard per worker running.
+        """
+        pool = self._ensure_pool()
+        finished = queue.Queue()
+        pending = list(shards)
+        in_flight = 0
+
+        while pending or in_flight:
+            while pending and in_flight < self.num_workers:
+                pool.apply_async(run_shard, (pdf_path, pending.pop(0), sink_kind, temp_dir, annotated, layout),
+                                 callback=finished.put, error_callback=finished.put)
+                in_flight += 1
+            output = finished.get()
+            in_flight -= 1
+            if isinstance(output, BaseException):
+                raise Exception(f"Shard worker failed: {output}")
+            yield output
+
+    def close(self):
+        with self._lock:
+            if self._pool is not None and self._pid == os.getpid():
+                self._pool.terminate()
+                self._pool.join()
+            self._pool = None
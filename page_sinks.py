@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Page image sinks
+Optional destinations for rendered and annotated page images. The indexing
+pipeline keeps pages in memory; a sink only persists them when configured.
+Boxes are drawn by the browser viewer, so sinks keep clean pages unless
+annotated copies are asked for.
+"""
+
+import os
+import io
+
+
+class PageSink:
+    """Base sink - keeps nothing, so every page is rendered on demand"""
+
+    name = 'none'
+
+    def __init__(self, annotated=False):
+        # Whether annotated (box-drawn) pages should be produced for this sink
+        self.annotated = annotated
+
+    def save_page(self, page_index, image, annotated=False):
+        """Persist a page image"""
+        pass
+
+    def open_page(self, page_index, annotated=False):
+        """Return a readable binary file object for a page, or None if not stored"""
+        return None
+
+
+class DiskPageSink(PageSink):
+    """Writes pages as JPEGs to converted/ and processed/ under the session directory"""
+
+    name = 'disk'
+
+    def __init__(self, temp_dir, annotated=False, clean=True):
+        super().__init__(annotated)
+        self.temp_dir = temp_dir
+        # Whether clean (unannotated) pages are written too
+        self.clean = clean
+        self.converted_folder = os.path.join(temp_dir, 'converted')
+        self.processed_folder = os.path.join(temp_dir, 'processed')
+
+    def page_path(self, page_index, annotated=False):
+        """Path of a page image inside the sink"""
+        folder = self.processed_folder if annotated else self.converted_folder
+        return os.path.join(folder, f'image_{page_index}.jpg')
+
+    def save_page(self, page_index, image, annotated=False):
+        """Persist a page image"""
+        if not annotated and not self.clean:
+            return
+        path = self.page_path(page_index, annotated)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        image.save(path, 'JPEG')
+
+    def open_page(self, page_index, annotated=False):
+        """Return a readable binary file object for a page, or None if not stored"""
+        try:
+            return open(self.page_path(page_index, annotated), 'rb')
+        except OSError:
+            return None
+
+
+class MemoryPageSink(PageSink):
+    """Keeps encoded JPEG bytes in process memory"""
+
+    name = 'memory'
+
+    def __init__(self, annotated=False, quality=85):
+        super().__init__(annotated)
+        self.quality = quality
+        self.pages = {}
+
+    def save_page(self, page_index, image, annotated=False):
+        """Persist a page image"""
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=self.quality)
+        self.pages[(page_index, annotated)] = buffer.getvalue()
+
+    def open_page(self, page_index, annotated=False):
+        """Return a readable binary file object for a page, or None if not stored"""
+        data = self.pages.get((page_index, annotated))
+        return io.BytesIO(data) if data is not None else None
+
+
+def make_page_sink(kind, temp_dir=None, annotated=False):
+    """Build a sink from a name ('none', 'disk', 'memory'); sink instances pass through"""
+    if isinstance(kind, PageSink):
+        return kind
+    if not kind or kind == 'none':
+        return None
+    if kind == 'disk':
+        if not temp_dir:
+            raise ValueError("Disk page sink requires a session directory")
+        return DiskPageSink(temp_dir, annotated)
+    if kind == 'memory':
+        return MemoryPageSink(annotated)
+    raise ValueError(f"Unknown page sink: {kind}")
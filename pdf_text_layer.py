@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - PDF text layer reader
+Reads the bookmark outline and the embedded text layer of born-digital PDFs
+so section headers can be found without rasterizing or running the model.
+"""
+
+import math
+from collections import Counter
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # Optional: without pypdf every page goes through the vision pipeline
+    PdfReader = None
+
+
+def multiply_matrices(m1, m2):
+    """Compose two PDF affine matrices [a, b, c, d, e, f]"""
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return [
+        a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+        c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+        e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2
+    ]
+
+
+class PdfTextLayer:
+    """Finds section headers from a PDF's outline or from large-font text lines"""
+
+    def __init__(self, dpi=200, header_ratio=1.07, max_header_words=12, min_page_chars=25):
+        # Resolution the page images are rendered at; header bboxes are reported in those pixels
+        self.dpi = dpi
+        # A line is a header candidate when its font is this much larger than body text
+        self.header_ratio = header_ratio
+        self.max_header_words = max_header_words
+        # Pages with fewer extractable characters are treated as scanned
+        self.min_page_chars = min_page_chars
+
+    @property
+    def available(self):
+        return PdfReader is not None
+
+    def config(self):
+        """Settings that affect the headers found"""
+        return {
+            "dpi": self.dpi,
+            "header_ratio": self.header_ratio,
+            "max_header_words": self.max_header_words,
+            "min_page_chars": self.min_page_chars
+        }
+
+    def read_outline(self, reader):
+        """Flatten the bookmark tree into (page_index, title, level) tuples"""
+        entries = []
+
+        def walk(items, level):
+            for item in items:
+                if isinstance(item, list):
+                    walk(item, level + 1)
+                    continue
+                try:
+                    page_index = reader.get_destination_page_number(item)
+                except Exception:
+                    continue
+                title = str(getattr(item, 'title', '') or '').strip()
+                if title and page_index is not None and page_index >= 0:
+                    entries.append((page_index, title, level))
+
+        try:
+            walk(reader.outline, 0)
+        except Exception as e:
+            print(f"Could not read PDF outline: {e}")
+        return entries
+
+    def page_lines(self, page):
+        """Group the text runs of a page into lines with font size and position (PDF units)"""
+        lines = []
+
+        def visitor(text, cm, tm, font_dict, font_size):
+            text = text.strip()
+            if not text:
+                return
+            matrix = multiply_matrices(tm, cm)
+            size = abs(font_size) * math.hypot(matrix[2], matrix[3])
+            if size <= 0:
+                return
+            x, y = matrix[4], matrix[5]
+            font_name = str(font_dict.get('/BaseFont', '')) if font_dict else ''
+            last = lines[-1] if lines else None
+            if last and abs(last["y"] - y) < 0.3 * size and abs(last["size"] - size) < 0.5:
+                last["text"] += " " + text
+                last["x2"] = max(last["x2"], x + 0.5 * size * len(text))
+            else:
+                lines.append({
+                    "text": text,
+                    "size": size,
+                    "x": x,
+                    "x2": x + 0.5 * size * len(text),
+                    "y": y,
+                    "bold": 'bold' in font_name.lower()
+                })
+
+        page.extract_text(visitor_text=visitor)
+        return lines
+
+    def analyze(self, pdf_path):
+        """Read outline and per-page text lines; pages without a text layer are flagged as scanned"""
+        reader = PdfReader(pdf_path)
+        pages = []
+        size_counts = Counter()
+
+        for page in reader.pages:
+            try:
+                lines = self.page_lines(page)
+            except Exception as e:
+                print(f"Could not extract text layer: {e}")
+                lines = []
+            num_chars = sum(len(line["text"].replace(" ", "")) for line in lines)
+            for line in lines:
+                size_counts[round(line["size"] * 2) / 2] += len(line["text"])
+            box = page.mediabox
+            pages.append({
+                "has_text": num_chars >= self.min_page_chars,
+                "lines": lines,
+                "left": float(box.left),
+                "top": float(box.top)
+            })
+
+        return {
+            "num_pages": len(reader.pages),
+            "outline": self.read_outline(reader),
+            "pages": pages,
+            # The most common size by character count is the body text size
+            "body_size": size_counts.most_common(1)[0][0] if size_counts else 0
+        }
+
+    def is_header(self, line, body_size):
+        words = line["text"].split()
+        if not words or len(words) > self.max_header_words:
+            return False
+        if not any(ch.isalpha() for ch in line["text"]):
+            return False
+        # Table-of-contents entries and running footers end in a page number; sentences end in a period
+        if words[-1].isdigit() or line["text"].endswith('.'):
+            return False
+        return line["size"] >= body_size * self.header_ratio
+
+    def header_detections(self, page_info, body_size):
+        """Section-header detections (raw_results schema, bbox in rendered pixels) for one page"""
+        scale = self.dpi / 72.0
+        detections = []
+        previous = None
+
+        for line in page_info["lines"]:
+            if not self.is_header(line, body_size):
+                previous = None
+                continue
+            x1 = (line["x"] - page_info["left"]) * scale
+            x2 = (line["x2"] - page_info["left"]) * scale
+            y1 = (page_info["top"] - line["y"] - line["size"]) * scale
+            y2 = (page_info["top"] - line["y"] + 0.25 * line["size"]) * scale
+            # Wrapped headers: same size, directly below the previous header line
+            if (previous and abs(previous["size"] - line["size"]) < 0.5
+                    and 0 < previous["y"] - line["y"] < 1.6 * line["size"]):
+                last = detections[-1]
+                last["text"] += " " + line["text"]
+                last["bbox"] = [min(last["bbox"][0], int(x1)), last["bbox"][1],
+                                max(last["bbox"][2], int(x2)), int(y2)]
+            else:
+                detections.append({
+                    "label": "Section-header",
+                    "bbox": [int(x1), int(y1), int(x2), int(y2)],
+                    "text": line["text"]
+                })
+            previous = line
+
+        return detections
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Content-addressed result cache
+Stores processed results on disk keyed by the PDF's SHA-256 plus the model
+and pipeline configuration, with an LRU size cap.
+"""
+
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+def hash_config(config):
+    """Stable digest of a JSON-serializable configuration dict"""
+    encoded = json.dumps(config, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(encoded).hexdigest()
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_dir_size(path):
+    """Total size in bytes of the files under a directory"""
+    total = 0
+    for root, _, files in os.walk(path):
+        for filename in files:
+            try:
+                total += os.path.getsize(os.path.join(root, filename))
+            except OSError:
+                pass
+    return total
+
+
+class ResultCache:
+    """On-disk LRU cache of processing results
+
+    Each entry is a directory named by its key holding result.json and, when
+    page images were persisted, a pages/ copy of the session's sink folders.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = None  # key -> size in bytes, least recently used first
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def make_key(self, pdf_hash, config):
+        """Cache key for a PDF digest under a given model/pipeline configuration"""
+        return hashlib.sha256(f"{pdf_hash}:{hash_config(config)}".encode('utf-8')).hexdigest()
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def pages_dir(self, key):
+        """Directory of cached page images for an entry, or None if it has none"""
+        path = os.path.join(self.entry_dir(key), 'pages')
+        return path if os.path.isdir(path) else None
+
+    def _load_entries(self):
+        # Build the LRU index once from disk, oldest access first
+        if self._entries is not None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        found = []
+        for name in os.listdir(self.cache_dir):
+            path = self.entry_dir(name)
+            result_path = os.path.join(path, 'result.json')
+            if os.path.isfile(result_path):
+                found.append((os.path.getmtime(result_path), name, get_dir_size(path)))
+            elif os.path.isdir(path):
+                # Leftover from an interrupted write
+                shutil.rmtree(path, ignore_errors=True)
+        self._entries = OrderedDict((name, size) for _, name, size in sorted(found))
+
+    def get(self, key):
+        """Return the cached result for a key, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            self._load_entries()
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            result_path = os.path.join(self.entry_dir(key), 'result.json')
+            try:
+                with open(result_path, 'r', encoding='utf-8') as f:
+                    result = json.load(f)
+            except (OSError, ValueError):
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            now = time.time()
+            os.utime(result_path, (now, now))
+            self.hits += 1
+            return result
+
+    def put(self, key, result, page_folders=None):
+        """Store a result, plus copies of any page image folders, then evict down to the cap
+
+        The entry is written to a temporary folder without holding the lock,
+        so lookups don't wait on copying page images; only the rename and
+        the LRU update are locked.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            # Index the cache first: a later first scan would delete the half-written folder
+            self._load_entries()
+        tmp_dir = self.entry_dir(f'.tmp-{key}-{os.getpid()}-{threading.get_ident()}')
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        try:
+            for folder in page_folders or []:
+                if os.path.isdir(folder):
+                    shutil.copytree(folder, os.path.join(tmp_dir, 'pages', os.path.basename(folder)))
+            with open(os.path.join(tmp_dir, 'result.json'), 'w', encoding='utf-8') as f:
+                json.dump(result, f)
+            size = get_dir_size(tmp_dir)
+            final_dir = self.entry_dir(key)
+            with self._lock:
+                shutil.rmtree(final_dir, ignore_errors=True)
+                os.replace(tmp_dir, final_dir)
+                self._entries[key] = size
+                self._entries.move_to_end(key)
+                self._evict()
+        except Exception:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+    def _evict(self):
+        total = sum(self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total -= size
+            print(f"Evicted cached result {key[:12]} ({size} bytes)")
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        with self._lock:
+            if self.enabled:
+                self._load_entries()
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries or {}),
+                "size_bytes": sum((self._entries or {}).values()),
+                "max_bytes": self.max_bytes
+            }
+
+
+class PageResultCache:
+    """In-memory LRU of final page detections keyed by page digest and pipeline configuration
+
+    The digest is page_filter's exact SHA-256 of the page's difference hash
+    and downscaled pixels, so only a pixel-identical page in a later upload
+    skips detection and OCR. Detections are copied in and out so callers can edit them.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def make_key(self, page_digest, config_digest):
+        return hashlib.sha256(page_digest + config_digest.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """Copy of the cached detections for a key, or None on a miss"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            detections = self._entries.get(key)
+            if detections is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return [dict(detection) for detection in detections]
+
+    def put(self, key, detections):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = [dict(detection) for detection in detections]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries
+            }
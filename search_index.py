@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Full-text search index
+Persistent inverted index over every processed book: one SQLite row per
+(term, book, page, word box), clustered by term so a lookup is a single
+range scan. Books are identified by the SHA-256 of the PDF.
+"""
+
+import os
+import re
+import time
+import sqlite3
+import threading
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+# Shorter prefixes match too much of the vocabulary to answer quickly
+MIN_PREFIX = 3
+
+
+def tokenize(text):
+    """Lower-cased search terms of a piece of text"""
+    return [token[:64] for token in TOKEN_RE.findall(text.lower())]
+
+
+class SearchIndex:
+    """Inverted index of OCR'd words with their page and bounding box
+
+    Detections that carry "words" ([word, x1, y1, x2, y2] from full-text
+    OCR) are indexed word by word; detections with only "text" (headers,
+    text-layer pages) are indexed with the detection's own bbox.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        conn = self._connect()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS books ("
+            "id INTEGER PRIMARY KEY, book_hash TEXT UNIQUE NOT NULL, filename TEXT, "
+            "num_pages INTEGER, num_postings INTEGER, indexed_at REAL)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS postings ("
+            "term TEXT NOT NULL, book INTEGER NOT NULL, page INTEGER NOT NULL, "
+            "x1 INTEGER, y1 INTEGER, x2 INTEGER, y2 INTEGER, "
+            "PRIMARY KEY (term, book, page, y1, x1)) WITHOUT ROWID")
+        # Lets a book be replaced without scanning every term
+        conn.execute("CREATE INDEX IF NOT EXISTS postings_book ON postings (book)")
+
+    def _connect(self):
+        # One connection per thread (and per process: connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def has_book(self, book_hash):
+        row = self._connect().execute("SELECT 1 FROM books WHERE book_hash = ?", (book_hash,)).fetchone()
+        return row is not None
+
+    def index_book(self, book_hash, filename, raw_results):
+        """Replace a book's postings with the words of its raw_results; returns the number of postings"""
+        rows = []
+        for page_index, image_results in enumerate(raw_results):
+            for detection in image_results["detections"]:
+                if detection.get("words"):
+                    for word, x1, y1, x2, y2 in detection["words"]:
+                        rows.extend((term, page_index + 1, x1, y1, x2, y2) for term in tokenize(word))
+                elif detection.get("text"):
+                    x1, y1, x2, y2 = detection["bbox"]
+                    rows.extend((term, page_index + 1, x1, y1, x2, y2) for term in tokenize(detection["text"]))
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT id FROM books WHERE book_hash = ?", (book_hash,)).fetchone()
+            if row:
+                book = row[0]
+                conn.execute("DELETE FROM postings WHERE book = ?", (book,))
+            else:
+                book = conn.execute("INSERT INTO books (book_hash) VALUES (?)", (book_hash,)).lastrowid
+            conn.executemany(
+                "INSERT OR IGNORE INTO postings (term, book, page, x1, y1, x2, y2) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                ((term, book, page, int(x1), int(y1), int(x2), int(y2)) for term, page, x1, y1, x2, y2 in rows))
+            conn.execute(
+                "UPDATE books SET filename = ?, num_pages = ?, num_postings = ?, indexed_at = ? WHERE id = ?",
+                (filename, len(raw_results), len(rows), time.time(), book))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def _term_postings(self, conn, term, book):
+        # "term*" matches every term with that prefix, still as one range scan
+        if term.endswith('*'):
+            prefix = term[:-1]
+            clause, params = "term >= ? AND term < ?", [prefix, prefix + '\U0010ffff']
+        else:
+            clause, params = "term = ?", [term]
+        if book is not None:
+            clause += " AND book = ?"
+            params.append(book)
+        return conn.execute(f"SELECT book, page, x1, y1, x2, y2 FROM postings WHERE {clause}", params).fetchall()
+
+    def search(self, query, book_hash=None, limit=50):
+        """Pages containing every term of the query, most hits first, with the matching word boxes
+
+        A trailing * makes a term (of at least MIN_PREFIX characters) a prefix
+        match. book_hash limits the search to one book.
+        """
+        terms = [token + '*' if part.endswith('*') and len(token) >= MIN_PREFIX else token
+                 for part in query.split() for token in tokenize(part)]
+        response = {"query": query, "terms": terms, "total": 0, "results": []}
+        if not terms:
+            return response
+
+        conn = self._connect()
+        book = None
+        if book_hash is not None:
+            row = conn.execute("SELECT id FROM books WHERE book_hash = ?", (book_hash,)).fetchone()
+            if row is None:
+                return response
+            book = row[0]
+
+        pages = None
+        boxes = {}
+        # Rarest terms first would prune earlier, but a page set per term keeps this simple and fast enough
+        for term in dict.fromkeys(terms):
+            term_pages = {}
+            for book_id, page, x1, y1, x2, y2 in self._term_postings(conn, term, book):
+                term_pages.setdefault((book_id, page), []).append([x1, y1, x2, y2])
+            pages = set(term_pages) if pages is None else pages & set(term_pages)
+            for key in pages:
+                boxes.setdefault(key, []).extend(term_pages[key])
+            if not pages:
+                break
+
+        ranked = sorted(pages or (), key=lambda key: (-len(boxes[key]), key))
+        response["total"] = len(ranked)
+        books = {}
+        for book_id, page in ranked[:limit]:
+            if book_id not in books:
+                books[book_id] = conn.execute("SELECT book_hash, filename FROM books WHERE id = ?",
+                                              (book_id,)).fetchone()
+            book_hash, filename = books[book_id]
+            response["results"].append({
+                "book": book_hash,
+                "filename": filename,
+                "page": page,
+                "hits": len(boxes[(book_id, page)]),
+                "bboxes": sorted(boxes[(book_id, page)], key=lambda bbox: (bbox[1], bbox[0]))
+            })
+        return response
+
+    def stats(self):
+        conn = self._connect()
+        books, postings = conn.execute("SELECT COUNT(*), COALESCE(SUM(num_postings), 0) FROM books").fetchone()
+        return {"books": books, "postings": postings}
@@ -0,0 +1,349 @@
+# -*- coding: utf-8 -*-
+"""
+BookMap Web - Session store
+Processing status and results per session, with TTL expiry. The in-memory
+store serves a single process; the SQLite store lets several worker
+processes share status and results.
+"""
+
+import os
+import json
+import time
+import heapq
+import sqlite3
+import threading
+from detection_table import DetectionTable
+
+
+class SessionStore:
+    """Interface shared by the session store implementations
+
+    A session has a status dict (always), a result dict and a DetectionTable
+    (once processing finishes), the paths of its uploaded PDF and working directory, and an
+    expiry time that is refreshed whenever the session is written.
+    """
+
+    def __init__(self, ttl_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+
+    def create_session(self, session_id, status, upload_path=None, temp_dir=None):
+        raise NotImplementedError
+
+    def get_status(self, session_id):
+        raise NotImplementedError
+
+    def set_status(self, session_id, status):
+        raise NotImplementedError
+
+    def update_status(self, session_id, **fields):
+        raise NotImplementedError
+
+    def get_result(self, session_id):
+        raise NotImplementedError
+
+    def set_result(self, session_id, result):
+        raise NotImplementedError
+
+    def has_result(self, session_id):
+        return self.get_result(session_id) is not None
+
+    def get_detections(self, session_id):
+        raise NotImplementedError
+
+    def set_detections(self, session_id, table):
+        raise NotImplementedError
+
+    def delete_session(self, session_id):
+        """Remove a session; returns its file info dict or None"""
+        raise NotImplementedError
+
+    def pop_expired(self, now=None, limit=100):
+        """Remove and return up to limit expired sessions as file info dicts"""
+        raise NotImplementedError
+
+    def count_sessions(self):
+        raise NotImplementedError
+
+
+class MemorySessionStore(SessionStore):
+    """Process-local store; expiry is tracked in a min-heap so sweeps are O(k log n)"""
+
+    def __init__(self, ttl_seconds=3600):
+        super().__init__(ttl_seconds)
+        self._sessions = {}
+        self._expiry_heap = []
+        self._lock = threading.Lock()
+
+    def _refresh(self, session_id):
+        # Old heap entries are left behind and skipped when popped
+        expires_at = time.time() + self.ttl_seconds
+        self._sessions[session_id]["expires_at"] = expires_at
+        heapq.heappush(self._expiry_heap, (expires_at, session_id))
+
+    def create_session(self, session_id, status, upload_path=None, temp_dir=None):
+        with self._lock:
+            self._sessions[session_id] = {
+                "status": dict(status),
+                "result": None,
+                "detections": None,
+                "upload_path": upload_path,
+                "temp_dir": temp_dir
+            }
+            self._refresh(session_id)
+
+    def get_status(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return dict(session["status"]) if session else None
+
+    def set_status(self, session_id, status):
+        with self._lock:
+            if session_id not in self._sessions:
+                return
+            self._sessions[session_id]["status"] = dict(status)
+            self._refresh(session_id)
+
+    def update_status(self, session_id, **fields):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id]["status"].update(fields)
+                self._refresh(session_id)
+
+    def get_result(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session["result"] if session else None
+
+    def set_result(self, session_id, result):
+        with self._lock:
+            if session_id not in self._sessions:
+                return
+            self._sessions[session_id]["result"] = result
+            self._refresh(session_id)
+
+    def get_detections(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session["detections"] if session else None
+
+    def set_detections(self, session_id, table):
+        with self._lock:
+            if session_id in self._sessions:
+                self._sessions[session_id]["detections"] = table
+
+    def delete_session(self, session_id):
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return None
+        return {"session_id": session_id, "upload_path": session["upload_path"],
+                "temp_dir": session["temp_dir"]}
+
+    def pop_expired(self, now=None, limit=100):
+        now = now or time.time()
+        expired = []
+        with self._lock:
+            while self._expiry_heap and self._expiry_heap[0][0] <= now and len(expired) < limit:
+                expires_at, session_id = heapq.heappop(self._expiry_heap)
+                session = self._sessions.get(session_id)
+                if session is None or session["expires_at"] != expires_at:
+                    continue  # Deleted or refreshed since this entry was pushed
+                del self._sessions[session_id]
+                expired.append({"session_id": session_id, "upload_path": session["upload_path"],
+                                "temp_dir": session["temp_dir"]})
+        return expired
+
+    def count_sessions(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+class SQLiteSessionStore(SessionStore):
+    """SQLite-backed store shared by every worker process pointing at the same file
+
+    Expiry uses an index on expires_at, so sweeps are a range scan rather than
+    a walk over every session.
+    """
+
+    def __init__(self, db_path, ttl_seconds=3600):
+        super().__init__(ttl_seconds)
+        self.db_path = db_path
+        self._local = threading.local()
+        db_dir = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(db_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS sessions (
+                    session_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    result TEXT,
+                    detections BLOB,
+                    upload_path TEXT,
+                    temp_dir TEXT,
+                    expires_at REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_expires_at ON sessions (expires_at)")
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(sessions)")]
+            if 'detections' not in columns:
+                # Database created before detections were stored separately
+                conn.execute("ALTER TABLE sessions ADD COLUMN detections BLOB")
+
+    def _connect(self):
+        # One connection per thread (and per process: connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def create_session(self, session_id, status, upload_path=None, temp_dir=None):
+        self._connect().execute(
+            "INSERT OR REPLACE INTO sessions (session_id, status, result, detections, upload_path, temp_dir, "
+            "expires_at) VALUES (?, ?, NULL, NULL, ?, ?, ?)",
+            (session_id, json.dumps(status), upload_path, temp_dir, time.time() + self.ttl_seconds)
+        )
+
+    def get_status(self, session_id):
+        row = self._connect().execute(
+            "SELECT status FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_status(self, session_id, status):
+        self._connect().execute(
+            "UPDATE sessions SET status = ?, expires_at = ? WHERE session_id = ?",
+            (json.dumps(status), time.time() + self.ttl_seconds, session_id)
+        )
+
+    def update_status(self, session_id, **fields):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT status FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row:
+                status = json.loads(row[0])
+                status.update(fields)
+                conn.execute("UPDATE sessions SET status = ?, expires_at = ? WHERE session_id = ?",
+                             (json.dumps(status), time.time() + self.ttl_seconds, session_id))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def get_result(self, session_id):
+        row = self._connect().execute(
+            "SELECT result FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row and row[0] is not None else None
+
+    def has_result(self, session_id):
+        row = self._connect().execute(
+            "SELECT result IS NOT NULL FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return bool(row and row[0])
+
+    def set_result(self, session_id, result):
+        self._connect().execute(
+            "UPDATE sessions SET result = ?, expires_at = ? WHERE session_id = ?",
+            (json.dumps(result), time.time() + self.ttl_seconds, session_id)
+        )
+
+    def get_detections(self, session_id):
+        row = self._connect().execute(
+            "SELECT detections FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return DetectionTable.from_bytes(row[0]) if row and row[0] is not None else None
+
+    def set_detections(self, session_id, table):
+        self._connect().execute("UPDATE sessions SET detections = ? WHERE session_id = ?",
+                                (table.to_bytes(), session_id))
+
+    def delete_session(self, session_id):
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT upload_path, temp_dir FROM sessions WHERE session_id = ?",
+                               (session_id,)).fetchone()
+            conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if row is None:
+            return None
+        return {"session_id": session_id, "upload_path": row[0], "temp_dir": row[1]}
+
+    def pop_expired(self, now=None, limit=100):
+        now = now or time.time()
+        conn = self._connect()
+        # IMMEDIATE takes the write lock first, so two sweepers never claim the same rows
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT session_id, upload_path, temp_dir FROM sessions WHERE expires_at <= ? "
+                "ORDER BY expires_at LIMIT ?", (now, limit)).fetchall()
+            conn.executemany("DELETE FROM sessions WHERE session_id = ?", [(row[0],) for row in rows])
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [{"session_id": row[0], "upload_path": row[1], "temp_dir": row[2]} for row in rows]
+
+    def count_sessions(self):
+        return self._connect().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+class SessionSweeper:
+    """Background thread that expires sessions and hands them to a cleanup callback"""
+
+    def __init__(self, store, on_expire, interval=60):
+        self.store = store
+        self.on_expire = on_expire
+        self.interval = interval
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self):
+        """Start the sweeper in this process if it isn't running (cheap to call per request)"""
+        if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='bookmap-session-sweeper', daemon=True)
+            self._thread.start()
+
+    def sweep(self):
+        """Expire everything that is due; returns the number of sessions removed"""
+        removed = 0
+        while True:
+            expired = self.store.pop_expired()
+            for info in expired:
+                try:
+                    self.on_expire(info)
+                except Exception as e:
+                    print(f"Error cleaning up session {info['session_id']}: {e}")
+            removed += len(expired)
+            if len(expired) == 0:
+                return removed
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                removed = self.sweep()
+                if removed:
+                    print(f"Cleaned up {removed} old sessions")
+            except Exception as e:
+                print(f"Error during cleanup: {e}")
+
+
+def make_session_store(url, ttl_seconds=3600):
+    """Build a store from a URL: 'memory' or 'sqlite:///path/to/sessions.db'"""
+    if not url or url == 'memory':
+        return MemorySessionStore(ttl_seconds)
+    if url.startswith('sqlite:///'):
+        return SQLiteSessionStore(url[len('sqlite:///'):], ttl_seconds)
+    raise ValueError(f"Unknown session store: {url}")
@@ -2,7 +2,17 @@
 
 let currentSessionId = null;
 let statusCheckInterval = null;
+let eventSource = null;
+let partialEntries = [];
 let isProcessing = false;
+// Detection classes hidden in the viewer overlay (kept across pages)
+const hiddenClasses = new Set();
+let viewerPage = null;
+// Search hit boxes by page number, highlighted in the viewer
+let searchHighlights = {};
+// Files above this go through the chunked, resumable /uploads API
+const CHUNKED_UPLOAD_THRESHOLD = 8 * 1024 * 1024;
+const MAX_FILE_SIZE = 1024 * 1024 * 1024;
 
 // DOM Elements
 const uploadArea = document.getElementById('uploadArea');
@@ -25,6 +35,12 @@ const successMessage = document.getElementById('successMessage');
 const downloadDropdown = document.getElementById('downloadDropdown');
 const downloadJson = document.getElementById('downloadJson');
 const downloadCsv = document.getElementById('downloadCsv');
+const downloadPdf = document.getElementById('downloadPdf');
+const cancelBtn = document.getElementById('cancelBtn');
+const searchBar = document.getElementById('searchBar');
+const searchForm = document.getElementById('searchForm');
+const searchInput = document.getElementById('searchInput');
+const searchResults = document.getElementById('searchResults');
 
 // Initialize
 document.addEventListener('DOMContentLoaded', function() {
@@ -61,6 +77,11 @@ function initializeEventListeners() {
         processBtn.addEventListener('click', processFile);
     }
     
+    // Cancel button
+    if (cancelBtn) {
+        cancelBtn.addEventListener('click', cancelProcessing);
+    }
+    
     // Download buttons
     if (downloadJson) {
         downloadJson.addEventListener('click', () => downloadIndex('json'));
@@ -68,6 +89,14 @@ function initializeEventListeners() {
     if (downloadCsv) {
         downloadCsv.addEventListener('click', () => downloadIndex('csv'));
     }
+    if (downloadPdf) {
+        downloadPdf.addEventListener('click', () => downloadIndex('pdf'));
+    }
+    
+    // Search
+    if (searchForm) {
+        searchForm.addEventListener('submit', searchBook);
+    }
 }
 
 function handleDragOver(e) {
@@ -104,9 +133,10 @@ function handleFile(file) {
         return;
     }
     
-    // Validate file size (50MB)
-    if (file.size > 50 * 1024 * 1024) {
-        showError('File size must be less than 50MB.');
+    // Validate file size; without Web Crypto (plain HTTP) chunk checksums can't be computed
+    const maxSize = window.crypto && crypto.subtle ? MAX_FILE_SIZE : 50 * 1024 * 1024;
+    if (file.size > maxSize) {
+        showError(`File size must be less than ${formatFileSize(maxSize)}.`);
         return;
     }
     
@@ -147,6 +177,7 @@ async function processFile() {
     }
     
     isProcessing = true;
+    clearSearch();
     
     try {
         // Show progress section
@@ -154,18 +185,23 @@ async function processFile() {
         progressSection.style.display = 'block';
         
         // Upload file
-        const formData = new FormData();
-        formData.append('file', window.selectedFile);
-        
-        const response = await fetch('/upload', {
-            method: 'POST',
-            body: formData
-        });
-        
-        const result = await response.json();
-        
-        if (!response.ok) {
-            throw new Error(result.error || 'Upload failed');
+        let result;
+        if (window.selectedFile.size > CHUNKED_UPLOAD_THRESHOLD && window.crypto && crypto.subtle) {
+            result = await uploadInChunks(window.selectedFile);
+        } else {
+            const formData = new FormData();
+            formData.append('file', window.selectedFile);
+            
+            const response = await fetch('/upload', {
+                method: 'POST',
+                body: formData
+            });
+            
+            result = await response.json();
+            
+            if (!response.ok) {
+                throw new Error(result.error || 'Upload failed');
+            }
         }
         
         currentSessionId = result.session_id;
@@ -178,7 +214,124 @@ async function processFile() {
     }
 }
 
+async function uploadInChunks(file) {
+    // Start the upload, then send chunks at the server's offset; a failed chunk resumes from there
+    let response = await fetch('/uploads', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({filename: file.name, size: file.size})
+    });
+    let state = await response.json();
+    if (!response.ok) {
+        throw new Error(state.error || 'Upload failed');
+    }
+    
+    let failures = 0;
+    while (!state.complete) {
+        const chunk = await file.slice(state.offset, state.offset + state.chunk_size).arrayBuffer();
+        const digest = await crypto.subtle.digest('SHA-256', chunk);
+        const checksum = Array.from(new Uint8Array(digest)).map(b => b.toString(16).padStart(2, '0')).join('');
+        
+        let next = null;
+        try {
+            response = await fetch(`/uploads/${state.upload_id}?offset=${state.offset}`, {
+                method: 'PUT',
+                headers: {'X-Chunk-SHA256': checksum, 'Content-Type': 'application/octet-stream'},
+                body: chunk
+            });
+            next = await response.json();
+        } catch (error) {
+            next = null;
+        }
+        
+        if (next && (response.ok || response.status === 409 || next.complete)) {
+            // Accepted, out of step (409 carries the offset to resume from), or finished
+            // Busy (429/503) keeps the finished upload, so only the start is retried below
+            if (next.complete && !response.ok && response.status !== 429 && response.status !== 503) {
+                throw new Error(next.error || 'Upload failed');
+            }
+            state = next;
+            failures = 0;
+        } else {
+            // Dropped connection, server error or corrupted chunk: ask where to resume, a few times
+            const error = new Error((next && next.error) || 'Upload interrupted');
+            if (++failures > 5) {
+                throw error;
+            }
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const resume = await fetch(`/uploads/${state.upload_id}`).catch(() => null);
+            if (resume && resume.status === 404) {
+                throw error;
+            }
+            if (resume && resume.ok) {
+                state = await resume.json();
+            }
+            continue;
+        }
+        
+        const percent = Math.round(100 * state.offset / state.size);
+        updateProgress({progress: percent, message: `Uploading... ${formatFileSize(state.offset)} of ${formatFileSize(state.size)}`});
+    }
+    
+    // Over the server's page budget: wait as long as it asks, then ask it to start the job again
+    let attempts = 0;
+    while (!state.session_id && (response.status === 429 || response.status === 503) && ++attempts <= 20) {
+        const wait = parseInt(response.headers.get('Retry-After') || '10', 10);
+        updateProgress({progress: 100, message: `Server is busy, starting in about ${wait}s...`});
+        await new Promise(resolve => setTimeout(resolve, 1000 * wait));
+        response = await fetch(`/uploads/${state.upload_id}/complete`, {method: 'POST'});
+        state = await response.json();
+    }
+    
+    if (!state.session_id) {
+        throw new Error(state.error || 'Upload failed');
+    }
+    return state;
+}
+
 function startStatusCheck() {
+    stopStatusUpdates();
+    partialEntries = [];
+    
+    // Prefer server-pushed progress; poll only when EventSource is unavailable or fails
+    if (window.EventSource) {
+        startEventStream();
+    } else {
+        startPolling();
+    }
+}
+
+function startEventStream() {
+    eventSource = new EventSource(`/events/${currentSessionId}`);
+    
+    eventSource.addEventListener('status', (e) => {
+        handleStatus(JSON.parse(e.data));
+    });
+    
+    eventSource.addEventListener('page', (e) => {
+        const page = JSON.parse(e.data);
+        partialEntries.push(...page.entries);
+        if (page.entries.length > 0) {
+            refreshPartialResults();
+        }
+        if (partialEntries.length > 0) {
+            progressMessage.textContent = `Processed ${page.pages_done} pages - ${partialEntries.length} sections found so far...`;
+        }
+    });
+    
+    eventSource.onerror = () => {
+        // Connection dropped or not supported by the server: fall back to polling
+        if (eventSource) {
+            eventSource.close();
+            eventSource = null;
+        }
+        if (isProcessing) {
+            startPolling();
+        }
+    };
+}
+
+function startPolling() {
     if (statusCheckInterval) {
         clearInterval(statusCheckInterval);
     }
@@ -186,6 +339,17 @@ function startStatusCheck() {
     statusCheckInterval = setInterval(checkStatus, 1000);
 }
 
+function stopStatusUpdates() {
+    if (eventSource) {
+        eventSource.close();
+        eventSource = null;
+    }
+    if (statusCheckInterval) {
+        clearInterval(statusCheckInterval);
+        statusCheckInterval = null;
+    }
+}
+
 async function checkStatus() {
     if (!currentSessionId) return;
     
@@ -197,27 +361,51 @@ async function checkStatus() {
             throw new Error(status.error || 'Status check failed');
         }
         
-        updateProgress(status);
-        
-        if (status.status === 'completed') {
-            clearInterval(statusCheckInterval);
-            isProcessing = false;
-            await loadResults();
-        } else if (status.status === 'error') {
-            clearInterval(statusCheckInterval);
-            isProcessing = false;
-            showError(status.message);
-            hideAllSections();
+        await handleStatus(status);
+        if (isProcessing && status.status === 'processing') {
+            refreshPartialResults();
         }
         
     } catch (error) {
-        clearInterval(statusCheckInterval);
+        stopStatusUpdates();
         isProcessing = false;
         showError('Status check failed: ' + error.message);
         hideAllSections();
     }
 }
 
+async function handleStatus(status) {
+    updateProgress(status);
+    
+    if (status.status === 'completed') {
+        stopStatusUpdates();
+        isProcessing = false;
+        await loadResults();
+    } else if (status.status === 'error' || status.status === 'cancelled') {
+        stopStatusUpdates();
+        isProcessing = false;
+        showError(status.message);
+        hideAllSections();
+    }
+}
+
+async function cancelProcessing() {
+    if (!currentSessionId) return;
+    
+    try {
+        const response = await fetch(`/cancel/${currentSessionId}`, { method: 'POST' });
+        const result = await response.json();
+        
+        if (!response.ok) {
+            throw new Error(result.error || 'Cancel failed');
+        }
+        
+        progressMessage.textContent = 'Cancelling...';
+    } catch (error) {
+        showError('Cancel failed: ' + error.message);
+    }
+}
+
 function updateProgress(status) {
     progressBar.style.width = status.progress + '%';
     progressPercent.textContent = status.progress + '%';
@@ -245,7 +433,17 @@ function displayResults(data) {
     hideAllSections();
     resultsSection.style.display = 'block';
     downloadDropdown.style.display = 'block';
-    
+    searchBar.style.display = 'block';
+    renderIndexTable(data);
+}
+
+function displayPartialResults(data) {
+    // Keep the progress bar visible and show what has been found so far
+    resultsSection.style.display = 'block';
+    renderIndexTable(data);
+}
+
+function renderIndexTable(data) {
     // Clear existing table content
     indexTableBody.innerHTML = '';
     
@@ -267,15 +465,36 @@ function displayResults(data) {
     // Add summary
     const summaryRow = document.createElement('tr');
     summaryRow.className = 'table-info';
+    const summary = data.complete === false
+        ? `Found ${data.index.length} sections so far (${data.pages_done} of ${data.num_pages} pages processed)`
+        : `Found ${data.index.length} sections across ${data.num_pages} pages`;
     summaryRow.innerHTML = `
         <td colspan="3" class="text-center fw-bold">
             <i class="fas fa-info-circle me-2"></i>
-            Found ${data.index.length} sections across ${data.num_pages} pages
+            ${summary}
         </td>
     `;
     indexTableBody.appendChild(summaryRow);
 }
 
+async function loadPartialResults() {
+    if (!currentSessionId || !isProcessing) return;
+    
+    try {
+        const response = await fetch(`/index/${currentSessionId}`);
+        if (!response.ok) return;
+        
+        const data = await response.json();
+        if (data.complete === false && isProcessing) {
+            displayPartialResults(data);
+        }
+    } catch (error) {
+        console.error('Error loading partial results:', error);
+    }
+}
+
+const refreshPartialResults = throttle(loadPartialResults, 2000);
+
 function jumpToPage(pageNumber) {
     // Add visual feedback
     const button = event.target.closest('button');
@@ -309,8 +528,12 @@ function showPDFViewer(pageNumber) {
                             <p class="mt-2">Loading page ${pageNumber}...</p>
                         </div>
                         <div id="pdfContent" style="display: none;">
+                            <div id="classToggles" class="class-toggles"></div>
                             <div class="pdf-page-container">
-                                <img id="pdfPageImage" class="img-fluid" alt="PDF Page ${pageNumber}">
+                                <div class="pdf-page-layer">
+                                    <img id="pdfPageImage" class="img-fluid" alt="PDF Page ${pageNumber}">
+                                    <canvas id="pdfOverlay" class="pdf-overlay"></canvas>
+                                </div>
                             </div>
                         </div>
                     </div>
@@ -344,12 +567,17 @@ function showPDFViewer(pageNumber) {
 
 async function loadPageImage(pageNumber) {
     try {
-        // Get the processed image from the server
-        const response = await fetch(`/get-page-image/${currentSessionId}/${pageNumber}`);
+        // Screen-sized clean page from the server; boxes are drawn here from the page's detections
+        const [response, detectionsResponse] = await Promise.all([
+            fetch(`/get-page-image/${currentSessionId}/${pageNumber}?size=screen`),
+            fetch(`/detections/${currentSessionId}?pages=${pageNumber}`)
+        ]);
         
         if (response.ok) {
             const blob = await response.blob();
             const imageUrl = URL.createObjectURL(blob);
+            const scale = parseFloat(response.headers.get('X-Detection-Scale')) || 1;
+            const detections = detectionsResponse.ok ? await detectionsResponse.json() : null;
             
             const pdfImage = document.getElementById('pdfPageImage');
             const pdfContent = document.getElementById('pdfContent');
@@ -359,6 +587,15 @@ async function loadPageImage(pageNumber) {
             pdfImage.onload = () => {
                 loadingDiv.style.display = 'none';
                 pdfContent.style.display = 'block';
+                viewerPage = {
+                    page: pageNumber,
+                    image: pdfImage,
+                    scale: scale,
+                    colors: detections ? detections.class_colors : {},
+                    detections: detections && detections.results.length ? detections.results[0].detections : []
+                };
+                renderClassToggles();
+                drawOverlay();
             };
         } else {
             throw new Error('Failed to load page image');
@@ -375,18 +612,124 @@ async function loadPageImage(pageNumber) {
     }
 }
 
-function downloadPageImage(pageNumber) {
-    const pdfImage = document.getElementById('pdfPageImage');
-    if (pdfImage && pdfImage.src) {
-        const link = document.createElement('a');
-        link.href = pdfImage.src;
-        link.download = `page_${pageNumber}.jpg`;
-        document.body.appendChild(link);
-        link.click();
-        document.body.removeChild(link);
+function classColor(label) {
+    const rgb = (viewerPage && viewerPage.colors[label]) || [255, 0, 0];
+    return `rgb(${rgb[0]}, ${rgb[1]}, ${rgb[2]})`;
+}
+
+function renderClassToggles() {
+    const container = document.getElementById('classToggles');
+    if (!container || !viewerPage) return;
+    
+    // One toggle per class present on this page, with its box count
+    const counts = {};
+    viewerPage.detections.forEach(detection => {
+        counts[detection.label] = (counts[detection.label] || 0) + 1;
+    });
+    container.innerHTML = '';
+    Object.keys(counts).sort().forEach(label => {
+        const toggle = document.createElement('label');
+        toggle.className = 'class-toggle';
+        toggle.innerHTML = `
+            <input type="checkbox" ${hiddenClasses.has(label) ? '' : 'checked'}>
+            <span class="class-swatch" style="background: ${classColor(label)}"></span>
+            ${label} (${counts[label]})
+        `;
+        toggle.querySelector('input').addEventListener('change', (e) => {
+            if (e.target.checked) {
+                hiddenClasses.delete(label);
+            } else {
+                hiddenClasses.add(label);
+            }
+            drawOverlay();
+        });
+        container.appendChild(toggle);
+    });
+}
+
+function drawOverlay() {
+    const canvas = document.getElementById('pdfOverlay');
+    if (!canvas || !viewerPage) return;
+    
+    // The canvas has the image's natural size and is stretched with it by CSS
+    const image = viewerPage.image;
+    canvas.width = image.naturalWidth;
+    canvas.height = image.naturalHeight;
+    const context = canvas.getContext('2d');
+    context.clearRect(0, 0, canvas.width, canvas.height);
+    context.lineWidth = Math.max(2, Math.round(canvas.width / 600));
+    context.font = `${Math.max(12, Math.round(canvas.width / 90))}px sans-serif`;
+    
+    viewerPage.detections.forEach(detection => {
+        if (hiddenClasses.has(detection.label)) return;
+        const [x1, y1, x2, y2] = detection.bbox.map(v => v * viewerPage.scale);
+        const color = classColor(detection.label);
+        context.strokeStyle = color;
+        context.fillStyle = color;
+        context.strokeRect(x1, y1, x2 - x1, y2 - y1);
+        context.fillText(detection.label, x1, Math.max(12, y1 - 4));
+    });
+    
+    // Search hits on this page, in the same pixels as the detections
+    context.fillStyle = 'rgba(255, 214, 0, 0.45)';
+    (searchHighlights[viewerPage.page] || []).forEach(bbox => {
+        const [x1, y1, x2, y2] = bbox.map(v => v * viewerPage.scale);
+        context.fillRect(x1, y1, x2 - x1, y2 - y1);
+    });
+}
+
+async function searchBook(e) {
+    e.preventDefault();
+    const query = searchInput.value.trim();
+    if (!query || !currentSessionId) {
+        clearSearch();
+        return;
+    }
+    
+    try {
+        const response = await fetch(`/search?q=${encodeURIComponent(query)}&session_id=${currentSessionId}`);
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Search failed');
+        }
+        
+        searchHighlights = {};
+        data.results.forEach(hit => {
+            searchHighlights[hit.page] = hit.bboxes;
+        });
+        searchResults.innerHTML = `
+            <small class="text-muted">${data.total} page${data.total === 1 ? '' : 's'} (${data.took_ms} ms)</small>
+        `;
+        data.results.forEach(hit => {
+            const button = document.createElement('button');
+            button.className = 'btn btn-outline-secondary btn-sm';
+            button.textContent = `Page ${hit.page} (${hit.hits})`;
+            button.addEventListener('click', () => showPDFViewer(hit.page));
+            searchResults.appendChild(button);
+        });
+    } catch (error) {
+        console.error('Search error:', error);
+        showError(error.message);
+    }
+}
+
+function clearSearch() {
+    searchHighlights = {};
+    if (searchResults) {
+        searchResults.innerHTML = '';
     }
 }
 
+function downloadPageImage(pageNumber) {
+    // Server-side rendering with the boxes drawn in, cached after the first request
+    const link = document.createElement('a');
+    link.href = `/get-page-image/${currentSessionId}/${pageNumber}?annotated=1`;
+    link.download = `page_${pageNumber}.jpg`;
+    document.body.appendChild(link);
+    link.click();
+    document.body.removeChild(link);
+}
+
 async function downloadIndex(format) {
     if (!currentSessionId) {
         showError('No index available for download.');
@@ -405,7 +748,7 @@ async function downloadIndex(format) {
         const url = window.URL.createObjectURL(blob);
         const a = document.createElement('a');
         a.href = url;
-        a.download = `index_${currentSessionId}.${format}`;
+        a.download = format === 'pdf' ? `annotated_${currentSessionId}.pdf` : `index_${currentSessionId}.${format}`;
         document.body.appendChild(a);
         a.click();
         window.URL.revokeObjectURL(url);
@@ -473,6 +816,24 @@ function debounce(func, wait) {
     };
 }
 
+function throttle(func, wait) {
+    let last = 0;
+    let timeout = null;
+    return function throttledFunction(...args) {
+        const remaining = wait - (Date.now() - last);
+        if (remaining <= 0) {
+            last = Date.now();
+            func(...args);
+        } else if (!timeout) {
+            timeout = setTimeout(() => {
+                timeout = null;
+                last = Date.now();
+                func(...args);
+            }, remaining);
+        }
+    };
+}
+
 // Add smooth scrolling for better UX
 document.querySelectorAll('a[href^="#"]').forEach(anchor => {
     anchor.addEventListener('click', function (e) {
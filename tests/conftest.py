@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def app_module(tmp_path_factory):
+    """The Flask app module; skips where OCR isn't installed"""
+    pytest.importorskip('pytesseract')
+    # The app keeps its uploads, caches and search index relative to the working directory
+    previous = os.getcwd()
+    os.chdir(tmp_path_factory.mktemp('app'))
+    os.environ['BOOKMAP_WARM_ON_IMPORT'] = 'false'
+    try:
+        import app
+        yield app
+    finally:
+        os.chdir(previous)
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+pytest.importorskip('pytesseract')
+import batch_index
+
+
+class FakeIndexer:
+    def process_pdf(self, pdf_path, temp_dir, sink=None):
+        return {"raw_results": [{"image": 'image_0.jpg', "detections": []}], "num_pages": 1,
+                "index": [{"page": 1, "title": "Introduction"}], "engine_summary": {"text": 1}}
+
+
+def test_finds_pdfs_and_names_their_outputs(tmp_path):
+    for name in ('a/book.pdf', 'b/book.PDF', 'b/notes.txt', 'c/other.pdf'):
+        os.makedirs(tmp_path / os.path.dirname(name), exist_ok=True)
+        (tmp_path / name).write_bytes(b'%PDF-1.4')
+    pdf_paths = batch_index.find_pdfs(str(tmp_path))
+    assert [os.path.relpath(path, tmp_path) for path in pdf_paths] == ['a/book.pdf', 'b/book.PDF', 'c/other.pdf']
+
+    dirs = batch_index.output_dirs(pdf_paths, 'Output')
+    assert dirs[pdf_paths[2]] == os.path.join('Output', 'other')
+    # Same name in two folders: each gets its own suffixed output folder
+    assert len({dirs[pdf_paths[0]], dirs[pdf_paths[1]]}) == 2
+    assert os.path.basename(dirs[pdf_paths[0]]).startswith('book-')
+
+
+def test_manifest_paths_are_relative_to_the_manifest(tmp_path):
+    manifest = tmp_path / 'books.txt'
+    manifest.write_text("# shelf one\nbook.pdf\n\n/data/other.pdf\n", encoding='utf-8')
+    assert batch_index.read_manifest(str(manifest)) == [str(tmp_path / 'book.pdf'), '/data/other.pdf']
+
+
+def test_completed_outputs_are_skipped_until_the_pdf_changes(tmp_path):
+    pdf_path = tmp_path / 'book.pdf'
+    pdf_path.write_bytes(b'%PDF-1.4')
+    output_dir = str(tmp_path / 'out')
+    assert not batch_index.is_complete(str(pdf_path), output_dir, annotate=False)
+
+    record = batch_index.index_pdf(FakeIndexer(), str(pdf_path), output_dir)
+    assert record["status"] == 'completed' and record["index_entries"] == 1
+    assert (tmp_path / 'out' / 'index.txt').read_text(encoding='utf-8') == "Page 1: Introduction\n"
+    assert json.loads((tmp_path / 'out' / 'result.json').read_text(encoding='utf-8'))[0]["image"] == 'image_0.jpg'
+    assert not os.path.exists(tmp_path / 'out' / '.work')
+    assert batch_index.is_complete(str(pdf_path), output_dir, annotate=False)
+    # No annotated PDF was written
+    assert not batch_index.is_complete(str(pdf_path), output_dir, annotate=True)
+
+    pdf_path.write_bytes(b'%PDF-1.4 changed')
+    assert not batch_index.is_complete(str(pdf_path), output_dir, annotate=False)
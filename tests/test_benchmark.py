@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+pytest.importorskip('pytesseract')
+import benchmark
+
+
+def run(pdf, **pages_per_sec):
+    return {"pdf": pdf, "stages": {name: {"pages_per_sec": value} for name, value in pages_per_sec.items()}}
+
+
+def test_compare_results_flags_slower_stages():
+    baseline = {"runs": [run('book.pdf', detect=10.0, ocr=20.0, index=None), run('gone.pdf', detect=1.0)]}
+    current = {"runs": [run('book.pdf', detect=8.5, ocr=19.0, index=500.0), run('new.pdf', detect=1.0)]}
+    assert benchmark.compare_results(baseline, current, max_regression=0.10) == [('book.pdf', 'detect')]
+
+
+def test_synthetic_pdf_has_the_requested_pages(tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    pdf_path = benchmark.synthetic_pdf(str(tmp_path), 3)
+    assert len(pypdf.PdfReader(pdf_path).pages) == 3
+    modified = (tmp_path / 'synthetic_3.pdf').stat().st_mtime_ns
+    assert benchmark.synthetic_pdf(str(tmp_path), 3) == pdf_path
+    assert (tmp_path / 'synthetic_3.pdf').stat().st_mtime_ns == modified
+
+
+class ShardedIndexer:
+    """Pages take 40ms divided evenly between the shard workers"""
+
+    page_window = 4
+
+    def get_page_count(self, pdf_path):
+        return 8
+
+    def get_shard_pool(self, num_workers):
+        return self
+
+    def run(self, pdf_path, shards):
+        return []
+
+    def process_pdf(self, pdf_path, temp_dir, num_pages=None, engine=None, shard_workers=None):
+        time.sleep(0.04 / shard_workers)
+        return {}
+
+
+def test_scaling_is_relative_to_one_worker():
+    rows = benchmark.benchmark_scaling(ShardedIndexer(), 'book.pdf', [4, 2])
+    assert [row["workers"] for row in rows] == [1, 4, 2]
+    assert rows[0]["speedup"] == 1.0
+    assert rows[1]["speedup"] == pytest.approx(4, rel=0.3)
+    assert rows[2]["efficiency"] == pytest.approx(1, rel=0.3)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+from PIL import Image
+
+pytest.importorskip('pytesseract')
+import book_indexer_web_fixed
+from book_indexer_web_fixed import BookIndexerWeb, IncrementalIndex
+from page_sinks import DiskPageSink
+
+
+@pytest.fixture
+def indexer():
+    return BookIndexerWeb()
+
+
+@pytest.fixture
+def rasterized(monkeypatch):
+    """(first_page, last_page) of every poppler call; pages are blank images"""
+    calls = []
+
+    def convert_from_path(pdf_path, dpi=200, first_page=1, last_page=1, poppler_path=None):
+        calls.append((first_page, last_page))
+        return [Image.new('RGB', (85, 110), 'white') for _ in range(first_page, last_page + 1)]
+
+    monkeypatch.setattr(book_indexer_web_fixed, 'convert_from_path', convert_from_path)
+    return calls
+
+
+def test_pages_are_rasterized_in_windows(indexer, rasterized):
+    pages = [page_index for page_index, _ in indexer.iter_pdf_pages('book.pdf', window_size=3, num_pages=7)]
+    assert pages == list(range(7))
+    assert rasterized == [(1, 3), (4, 6), (7, 7)]
+
+
+
+class FakeBoxes:
+    def __init__(self, page):
+        # One box per page, wide as the page's red value, so results can be matched to inputs
+        self.xyxy = np.array([[0, 0, int(page[0, 0, 2]), 10]], dtype=np.float32)
+        self.cls = np.array([3.0])
+        self.conf = np.array([0.5])
+
+    def __len__(self):
+        return len(self.xyxy)
+
+
+class FakeModel:
+    def __init__(self):
+        self.batches = []
+
+    def predict(self, batch, verbose=False):
+        self.batches.append(len(batch))
+        return [SimpleNamespace(boxes=FakeBoxes(page)) for page in batch]
+
+
+def test_pages_are_detected_in_batches(indexer):
+    model = FakeModel()
+    pages = [Image.new('RGB', (40, 40), (red, 0, 0)) for red in range(10, 80, 10)]
+    page_boxes = indexer.detect_batch(pages, batch_size=3, model=model)
+    assert model.batches == [3, 3, 1]
+    # Pages reach the model as BGR arrays, in order
+    assert [xyxy[0][2] for xyxy, _, _ in page_boxes] == list(range(10, 80, 10))
+    xyxy, class_ids, confidences = page_boxes[0]
+    assert xyxy.dtype == np.int32 and class_ids.tolist() == [3] and confidences.tolist() == [0.5]
+
+
+def tesseract_words(words):
+    """image_to_data output for (text, left, top, width, height) words, all on separate lines"""
+    return {
+        "text": [text for text, *_ in words],
+        "left": [left for _, left, _, _, _ in words],
+        "top": [top for _, _, top, _, _ in words],
+        "width": [width for *_, width, _ in words],
+        "height": [height for *_, height in words],
+        "block_num": [1] * len(words),
+        "par_num": [1] * len(words),
+        "line_num": list(range(len(words)))
+    }
+
+
+def test_regions_are_read_in_one_tesseract_call(indexer, monkeypatch):
+    canvases = []
+
+    def image_to_data(canvas, output_type=None):
+        canvases.append(canvas.size)
+        # Crops are stacked 24px apart: the first at y=24..44, the second at y=68..98
+        return tesseract_words([('Preface', 30, 26, 50, 14), ('Part', 30, 72, 30, 20), ('One', 64, 72, 30, 20)])
+
+    monkeypatch.setattr(book_indexer_web_fixed.pytesseract, 'image_to_data', image_to_data)
+    page = Image.new('RGB', (300, 300), 'white')
+    texts = indexer.ocr_regions(page, [[10, 10, 110, 30], [10, 100, 160, 130]])
+    assert texts == ["Preface", "Part\nOne"]
+    assert canvases == [(150 + 2 * 24, 20 + 30 + 3 * 24)]
+
+
+def test_ocr_failure_falls_back_per_page(indexer, monkeypatch):
+    def fail(*args, **kwargs):
+        raise RuntimeError("tesseract is not installed")
+
+    monkeypatch.setattr(indexer, 'ocr_page_headers', fail)
+    image_results = {"image": 'image_2.jpg', "detections": [
+        {"label": "Section-header", "bbox": [0, 0, 10, 10], "text": ""},
+        {"label": "Text", "bbox": [0, 20, 10, 30], "text": ""}
+    ]}
+    indexer.ocr_section_headers([(Image.new('RGB', (40, 40), 'white'), image_results)])
+    assert [d["text"] for d in image_results["detections"]] == [indexer.get_fallback_text(2), ""]
+
+
+def test_page_subset_is_rasterized_in_contiguous_runs(indexer, rasterized):
+    pages = [page_index for page_index, _ in indexer.iter_pdf_pages('book.pdf', window_size=4, pages=[5, 0, 1])]
+    assert pages == [0, 1, 5]
+    assert rasterized == [(1, 2), (6, 6)]
+
+
+def test_partial_index_matches_the_final_one_in_any_page_order(indexer):
+    pages = [[(1, "Introduction"), (1, "History")], [(2, "Introduction ")], [(3, "Applications"), (3, "History")]]
+    expected = indexer.build_unique_index([entry for page in pages for entry in page])
+    partial = IncrementalIndex()
+    assert partial.add_page(pages[2])
+    assert partial.to_list() == [{"page": 3, "title": "Applications"}, {"page": 3, "title": "History"}]
+    assert partial.add_page(pages[0])
+    assert not partial.add_page(pages[1])
+    assert partial.to_list() == expected
+    assert partial.pages_done == 3
+    assert [entry["title"] for entry in expected] == ["History", "Introduction", "Applications"]
+
+
+def test_headers_are_read_from_a_high_dpi_render(indexer, monkeypatch):
+    indexer.dpi, indexer.ocr_dpi = 200, 300
+    rendered = []
+
+    def render_region(pdf_path, page_index, bbox, dpi):
+        rendered.append((page_index, bbox, dpi))
+        return Image.new('RGB', (int(bbox[2] - bbox[0]), int(bbox[3] - bbox[1])), 'white')
+
+    def ocr_regions(image, bboxes, word_boxes=False):
+        # Regions arrive in the rendered region's pixels
+        assert bboxes == [[0, 0, 150, 30], [0, 300, 300, 345]]
+        return ["A", "B"], [[["A", 0, 0, 30, 30]], [["B", 0, 300, 60, 345]]]
+
+    monkeypatch.setattr(indexer, 'render_region', render_region)
+    monkeypatch.setattr(indexer, 'ocr_regions', ocr_regions)
+    texts, words = indexer.ocr_pdf_regions('book.pdf', 4, [[100, 100, 200, 120], [100, 300, 300, 330]], True)
+    assert rendered == [(4, [150.0, 150.0, 450.0, 495.0], 300)]
+    assert texts == ["A", "B"]
+    # Word boxes come back in dpi pixels
+    assert words == [[["A", 100, 100, 120, 120]], [["B", 100, 300, 140, 330]]]
+
+
+def test_low_dpi_boxes_are_scaled_to_result_pixels(indexer):
+    boxes = (np.array([[10, 20, 30, 40]], dtype=np.int32), np.array([3]), np.array([0.9], dtype=np.float32))
+    image_results = indexer.build_page_result(Image.new('RGB', (100, 100)), 'image_0.jpg', boxes, scale=2.0)
+    assert image_results["detections"][0]["bbox"] == [20, 40, 60, 80]
+
+
+def test_annotated_pdf_renders_only_missing_pages(indexer, rasterized, tmp_path):
+    pypdf = pytest.importorskip('pypdf')
+    sink = DiskPageSink(str(tmp_path), annotated=True, clean=False)
+    raw_results = [{"image": f'image_{i}.jpg', "detections": [
+        {"label": "Section-header", "bbox": [10, 10, 60, 30], "text": "Intro"}]} for i in range(3)]
+    sink.save_page(1, Image.new('RGB', (85, 110), 'white'), annotated=True)
+
+    output_path = indexer.export_annotated_pdf('book.pdf', raw_results, sink, str(tmp_path / 'annotated.pdf'))
+    assert len(pypdf.PdfReader(output_path).pages) == 3
+    assert rasterized == [(1, 1), (3, 3)]
+    # Rendered pages are kept for the next export
+    indexer.export_annotated_pdf('book.pdf', raw_results, sink, str(tmp_path / 'again.pdf'))
+    assert rasterized == [(1, 1), (3, 3)]
+
+
+def test_boxes_are_drawn_at_the_image_scale(indexer):
+    page = Image.new('RGB', (200, 200), 'white')
+    annotated = indexer.draw_detections(page, [{"label": "Text", "bbox": [10, 10, 50, 50]}], scale=2.0)
+    assert annotated.getpixel((100, 60)) == tuple(indexer.class_colors["Text"])
+    assert page.getpixel((100, 60)) == (255, 255, 255)
+
+
+def test_full_text_reading_order():
+    # Two columns under a full-width title, then a full-width footnote band
+    bboxes = [[520, 300, 950, 400], [50, 300, 480, 400], [50, 50, 950, 120], [50, 900, 950, 950],
+              [50, 450, 480, 550], [520, 980, 950, 990]]
+    assert book_indexer_web_fixed.reading_order(bboxes, 1000) == [2, 1, 4, 0, 3, 5]
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+import io
+import os
+import time
+import hashlib
+
+import pytest
+
+from chunked_uploads import ChunkedUploadStore, UploadNotFound, UploadConflict, ChunkRejected
+
+PDF = b'%PDF-1.4\n' + b''.join(b'%d 0 obj << /Type /Page >> endobj\n' % i + bytes(3000) for i in range(5)) + b'%%EOF\n'
+CHUNK = 4096
+
+
+def sha256(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ChunkedUploadStore(str(tmp_path / 'chunked'), max_bytes=10 * 1024 * 1024, ttl_seconds=60, read_size=1000)
+
+
+def send(store, upload_id, offset, data):
+    return store.write_chunk(upload_id, offset, io.BytesIO(data), sha256(data), CHUNK)
+
+
+def upload_all(store, data=PDF, sha=True):
+    state = store.create('book.pdf', len(data), sha256(data) if sha else None)
+    while state["offset"] < state["size"]:
+        state = send(store, state["upload_id"], state["offset"], data[state["offset"]:state["offset"] + CHUNK])
+    return state
+
+
+def test_upload_resumes_after_a_bad_chunk(store):
+    state = store.create('book.pdf', len(PDF), sha256(PDF))
+    upload_id = state["upload_id"]
+    state = send(store, upload_id, 0, PDF[:CHUNK])
+    assert state["offset"] == CHUNK
+
+    # Corrupted in transit: rejected, and the resume point doesn't move
+    with pytest.raises(ChunkRejected):
+        store.write_chunk(upload_id, CHUNK, io.BytesIO(PDF[CHUNK:2 * CHUNK]), sha256(b'other'), CHUNK)
+    assert store.get_state(upload_id)["offset"] == CHUNK
+    with pytest.raises(UploadConflict):
+        send(store, upload_id, 0, PDF[:CHUNK])
+
+    # Another process takes over: the whole-file hash is rebuilt from disk
+    store = ChunkedUploadStore(store.folder, store.max_bytes, store.ttl_seconds)
+    offset = store.get_state(upload_id)["offset"]
+    while offset < len(PDF):
+        offset = send(store, upload_id, offset, PDF[offset:offset + CHUNK])["offset"]
+    state = store.get_state(upload_id)
+    assert state["sha256_actual"] == sha256(PDF)
+    assert state["pages_seen"] == 5
+    with open(store.verify(upload_id)[1], 'rb') as f:
+        assert f.read() == PDF
+
+
+def test_oversized_chunk_is_rejected(store):
+    state = store.create('book.pdf', len(PDF))
+    data = PDF[:CHUNK + 1]
+    with pytest.raises(ChunkRejected):
+        store.write_chunk(state["upload_id"], 0, io.BytesIO(data), sha256(data), CHUNK)
+    assert store.get_state(state["upload_id"])["offset"] == 0
+
+
+def test_unknown_and_expired_uploads(store):
+    with pytest.raises(UploadNotFound):
+        send(store, '0' * 32, 0, b'data')
+    with pytest.raises(UploadNotFound):
+        send(store, '../escape', 0, b'data')
+    assert store._locks == {}
+
+    state = store.create('book.pdf', len(PDF))
+    store.remove_stale(now=time.time() + 120)
+    with pytest.raises(UploadNotFound):
+        store.get_state(state["upload_id"])
+    with pytest.raises(UploadNotFound):
+        send(store, state["upload_id"], 0, PDF[:CHUNK])
+    assert store._locks == {}
+
+
+def test_export_keeps_the_upload_until_discarded(store, tmp_path):
+    state = upload_all(store)
+    upload_id = state["upload_id"]
+    # A job refused after export: its copy is deleted, the upload can be exported again
+    first = str(tmp_path / 'first.pdf')
+    store.export(upload_id, first)
+    os.remove(first)
+    second = str(tmp_path / 'second.pdf')
+    store.export(upload_id, second)
+    store.discard(upload_id)
+    with open(second, 'rb') as f:
+        assert f.read() == PDF
+    with pytest.raises(UploadNotFound):
+        store.verify(upload_id)
+
+
+def test_incomplete_upload_cannot_be_verified(store):
+    state = store.create('book.pdf', len(PDF))
+    send(store, state["upload_id"], 0, PDF[:CHUNK])
+    with pytest.raises(UploadConflict):
+        store.verify(state["upload_id"])
+
+
+def test_invalid_pdf_is_discarded(store):
+    state = upload_all(store, b'not a pdf' * 100, sha=False)
+    with pytest.raises(ChunkRejected):
+        store.verify(state["upload_id"])
+    with pytest.raises(UploadNotFound):
+        store.get_state(state["upload_id"])
+
+
+def test_checksum_mismatch_is_discarded(store):
+    state = store.create('book.pdf', len(PDF), sha256(b'something else'))
+    offset = 0
+    while offset < len(PDF):
+        offset = send(store, state["upload_id"], offset, PDF[offset:offset + CHUNK])["offset"]
+    with pytest.raises(ChunkRejected):
+        store.verify(state["upload_id"])
@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+from detection_table import DetectionTable
+
+CLASS_NAMES = ["Section-header", "Text"]
+
+RAW_RESULTS = [
+    {"image": "image_0.jpg", "detections": [
+        {"label": "Section-header", "bbox": [10, 10, 200, 40], "text": "Introduction", "confidence": 0.9},
+        {"label": "Text", "bbox": [10, 60, 400, 500], "text": "", "confidence": 0.8}
+    ]},
+    {"image": "image_1.jpg", "detections": [], "skipped": "blank"},
+    {"image": "image_2.jpg", "detections": [
+        {"label": "Section-header", "bbox": [10, 10, 200, 40], "text": "Introduction", "confidence": 0.9},
+        {"label": "Text", "bbox": [10, 60, 400, 500], "text": "", "confidence": 0.8}
+    ], "skipped": "duplicate", "duplicate_of": 1},
+    {"image": "image_3.jpg", "detections": [{"label": "Text", "bbox": [5, 5, 50, 50], "text": "ünïcode"}]},
+    {"image": "image_4.jpg", "detections": [
+        {"label": "Section-header", "bbox": [10, 10, 200, 40], "text": "Café au lait", "confidence": 0.9,
+         "words": [["Café", 12, 12, 60, 38], ["au", 66, 12, 84, 38], ["lait", 90, 12, 130, 38]]},
+        {"label": "Text", "bbox": [10, 60, 400, 500], "text": "", "confidence": 0.8, "words": []}
+    ]}
+]
+
+
+def test_round_trip_through_raw_results():
+    table = DetectionTable.from_raw_results(RAW_RESULTS, CLASS_NAMES)
+    assert table.to_raw_results() == RAW_RESULTS
+
+
+def test_round_trip_through_bytes():
+    table = DetectionTable.from_raw_results(RAW_RESULTS, CLASS_NAMES)
+    restored = DetectionTable.from_bytes(table.to_bytes())
+    assert restored.to_raw_results() == RAW_RESULTS
+    assert restored.etag == table.etag
+
+
+def test_page_range():
+    table = DetectionTable.from_raw_results(RAW_RESULTS, CLASS_NAMES)
+    assert table.page_results(1, 3) == RAW_RESULTS[1:3]
+    assert table.page_results(3, 10) == RAW_RESULTS[3:]
+
+
+def test_words_are_kept_per_detection():
+    table = DetectionTable.from_raw_results(RAW_RESULTS, CLASS_NAMES)
+    assert table.page_detections(4)[0]["words"][0] == ["Café", 12, 12, 60, 38]
+    assert "words" not in table.page_detections(0)[0]
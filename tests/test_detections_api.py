@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pytesseract')
+
+RAW_RESULTS = [
+    {"image": f'image_{i}.jpg', "detections": [
+        {"label": "Section-header", "bbox": [10, 10, 200, 40], "text": f"Part {i + 1}", "confidence": 0.9,
+         "words": [["Part", 12, 12, 60, 38], [str(i + 1), 66, 12, 84, 38]]}
+    ]} for i in range(5)
+]
+
+
+@pytest.fixture
+def session(app_module):
+    app_module.session_store.create_session('paged', {"status": "processing"})
+    app_module.store_result('paged', {"index": [], "raw_results": RAW_RESULTS, "num_pages": 5}, 'book.pdf')
+    return app_module.app.test_client()
+
+
+def test_page_range(session):
+    response = session.get('/detections/paged?pages=2-3')
+    assert response.status_code == 200
+    payload = response.get_json()
+    assert payload["pages"] == {"start": 2, "end": 3}
+    assert payload["next_pages"] == '4-5'
+    assert [entry["page"] for entry in payload["results"]] == [2, 3]
+    assert payload["results"][0]["detections"] == RAW_RESULTS[1]["detections"]
+
+    assert session.get('/detections/paged?pages=9').status_code == 400
+    assert session.get('/detections/unknown').status_code == 404
+
+
+def test_unchanged_range_is_not_sent_again(session):
+    etag = session.get('/detections/paged?pages=1-2').headers['ETag']
+    assert session.get('/detections/paged?pages=1-2', headers={'If-None-Match': etag}).status_code == 304
+    assert session.get('/detections/paged?pages=1-3', headers={'If-None-Match': etag}).status_code == 200
+
+
+def test_raw_results_keep_word_boxes(session):
+    assert session.get('/index/paged?raw_results=1').get_json()["raw_results"] == RAW_RESULTS
@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pytest.importorskip('pytesseract')
+import book_indexer_web_fixed
+
+
+def test_missing_ultralytics_selects_heuristic_engine(monkeypatch, tmp_path):
+    monkeypatch.setattr(book_indexer_web_fixed, 'YOLO', None)
+    monkeypatch.setenv('BOOKMAP_BACKEND', 'ultralytics')
+    monkeypatch.setenv('BOOKMAP_ENGINE', 'vision')
+    indexer = book_indexer_web_fixed.BookIndexerWeb()
+    indexer.model_path = str(tmp_path / 'model.pt')
+    (tmp_path / 'model.pt').write_bytes(b'')
+    assert indexer.engine == 'heuristic'
+    assert not indexer.load_model()
+    assert indexer.can_process()
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from events import EventBroker, format_sse
+
+
+def test_format_sse():
+    assert format_sse('status', {"progress": 40}) == 'event: status\ndata: {"progress": 40}\n\n'
+
+
+def test_events_reach_only_their_session():
+    broker = EventBroker()
+    first, second, other = broker.subscribe('s1'), broker.subscribe('s1'), broker.subscribe('s2')
+    broker.publish('s1', 'page', {"page": 1})
+    assert first.get_nowait() == second.get_nowait() == ('page', {"page": 1})
+    assert other.empty()
+
+    broker.unsubscribe('s1', first)
+    broker.unsubscribe('s1', second)
+    assert not broker.has_subscribers('s1')
+    broker.publish('s1', 'page', {"page": 2})
+    assert first.empty()
+
+
+def test_slow_subscriber_drops_its_oldest_event():
+    broker = EventBroker(max_pending=2)
+    events = broker.subscribe('s1')
+    for page in (1, 2, 3):
+        broker.publish('s1', 'page', {"page": page})
+    assert [events.get_nowait()[1]["page"] for _ in range(2)] == [2, 3]
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import os
+import runpy
+
+import pytest
+
+pytest.importorskip('pytesseract')
+
+
+@pytest.fixture
+def app_client(app_module, monkeypatch):
+    monkeypatch.setattr(app_module, 'worker_state', {"pid": None, "state": "starting", "model_loaded": False,
+                                                     "model_load_seconds": None, "warmup_seconds": None})
+    return app_module, app_module.app.test_client()
+
+
+def test_liveness_does_not_wait_for_the_model(app_client):
+    app, client = app_client
+    assert client.get('/health/live').status_code == 200
+    assert client.get('/health').status_code == 200
+
+
+def test_ready_once_the_model_is_warm(app_client, monkeypatch):
+    app, client = app_client
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.get_json()["state"] == 'starting'
+
+    monkeypatch.setattr(app.book_indexer, 'warm_up', lambda: True)
+    monkeypatch.setattr(app.book_indexer, 'can_process', lambda: True)
+    app.init_worker(block=True)
+    response = client.get('/health/ready')
+    assert response.status_code == 200
+    assert response.get_json()["model_loaded"] is True
+    assert 'bookmap_worker_ready 1' in client.get('/metrics').get_data(as_text=True)
+
+
+def test_not_ready_when_nothing_can_process(app_client, monkeypatch):
+    app, client = app_client
+    monkeypatch.setattr(app.book_indexer, 'warm_up', lambda: False)
+    monkeypatch.setattr(app.book_indexer, 'can_process', lambda: False)
+    app.init_worker(block=True)
+    response = client.get('/health/ready')
+    assert response.status_code == 503
+    assert response.get_json()["state"] == 'unavailable'
+
+
+@pytest.mark.parametrize('store, workers', [('memory', 1), ('sqlite:///sessions.db', 2)])
+def test_gunicorn_workers_follow_the_session_store(store, workers, monkeypatch):
+    monkeypatch.setenv('BOOKMAP_SESSION_STORE', store)
+    monkeypatch.delenv('WEB_CONCURRENCY', raising=False)
+    config = runpy.run_path(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'gunicorn.conf.py'))
+    assert config["workers"] == workers
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from PIL import Image, ImageDraw, ImageFont
+
+from book_indexer_minimal import BookIndexerMinimal, HeuristicLayoutEngine
+
+CLASS_NAMES = BookIndexerMinimal().class_names
+DPI = 200
+
+
+def font(points):
+    return ImageFont.load_default(size=int(points / 72 * DPI))
+
+
+def labels(engine, image):
+    (_, class_ids, _), score = engine.analyze(image, DPI)
+    return [CLASS_NAMES[class_id] for class_id in class_ids], score
+
+
+def test_title_only_page_has_a_header():
+    image = Image.new('RGB', (1700, 2200), 'white')
+    ImageDraw.Draw(image).text((300, 600), 'Chapter 3', fill='black', font=font(24))
+    found, score = labels(HeuristicLayoutEngine(CLASS_NAMES), image)
+    assert found == ['Section-header']
+    assert score >= 0.45
+
+
+def test_body_size_line_alone_is_text():
+    image = Image.new('RGB', (1700, 2200), 'white')
+    ImageDraw.Draw(image).text((300, 600), 'the end of the previous chapter', fill='black', font=font(11))
+    found, _ = labels(HeuristicLayoutEngine(CLASS_NAMES), image)
+    assert found == ['Text']
+
+
+def test_header_above_body_text():
+    image = Image.new('RGB', (1700, 2200), 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((200, 400), 'Methods', fill='black', font=font(20))
+    for line in range(12):
+        draw.text((200, 600 + line * 45), 'body text of the section goes on for a while here', fill='black',
+                  font=font(11))
+    found, _ = labels(HeuristicLayoutEngine(CLASS_NAMES), image)
+    assert found == ['Section-header', 'Text']
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import numpy as np
+import pytest
+
+from inference_backends import ExportedYoloBackend, letterbox, make_backend, nms
+
+
+def test_letterbox_keeps_the_aspect_ratio():
+    page = np.zeros((200, 100, 3), dtype=np.uint8)
+    padded, ratio, (left, top) = letterbox(page, size=64)
+    assert padded.shape == (64, 64, 3)
+    assert ratio == 64 / 200 and (left, top) == (16, 0)
+    assert padded[0, 0, 0] == 114 and padded[32, 32, 0] == 0
+
+
+def test_nms_drops_overlapping_boxes():
+    boxes = np.array([[0, 0, 10, 10], [1, 1, 11, 11], [20, 20, 30, 30]], dtype=np.float32)
+    scores = np.array([0.8, 0.9, 0.7], dtype=np.float32)
+    assert nms(boxes, scores, 0.5).tolist() == [1, 2]
+
+
+class FixedOutputBackend(ExportedYoloBackend):
+    """Every page gets the same raw prediction, in letterboxed (imgsz x imgsz) pixels"""
+
+    def __init__(self, prediction, fixed_batch=None):
+        super().__init__('graph.onnx', imgsz=64)
+        self.prediction = prediction
+        self.fixed_batch = fixed_batch
+        self.batches = []
+
+    def run(self, tensor):
+        self.batches.append(tensor.shape)
+        return np.stack([self.prediction] * len(tensor))
+
+
+# (4 + num_classes, anchors): xywh, then one score per class
+PREDICTION = np.array([
+    [32.0, 32.5, 40.0],   # x center
+    [16.0, 16.5, 40.0],   # y center
+    [16.0, 16.0, 8.0],    # width
+    [8.0, 8.0, 8.0],      # height
+    [0.9, 0.1, 0.1],      # class 0
+    [0.1, 0.8, 0.1],      # class 1
+], dtype=np.float32)
+
+
+def test_boxes_are_mapped_back_to_the_page():
+    backend = FixedOutputBackend(PREDICTION)
+    (result,) = backend.predict([np.zeros((128, 64, 3), dtype=np.uint8)])
+    # Anchor 2 is under the confidence threshold; anchors 0 and 1 overlap but are different classes
+    assert sorted(result.boxes.cls.tolist()) == [0.0, 1.0]
+    # Letterboxed at half size with 16px of padding on the left
+    first = result.boxes.xyxy[result.boxes.cls.tolist().index(0.0)]
+    assert first.tolist() == [16.0, 24.0, 48.0, 40.0]
+
+
+def test_fixed_batch_graph_gets_padded_chunks():
+    backend = FixedOutputBackend(PREDICTION, fixed_batch=2)
+    results = backend.predict([np.zeros((64, 64, 3), dtype=np.uint8)] * 3)
+    assert len(results) == 3
+    assert [shape[0] for shape in backend.batches] == [2, 2]
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError):
+        make_backend('tensorrt', 'graph.onnx')
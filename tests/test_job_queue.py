@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+import time
+import threading
+
+import pytest
+
+from job_queue import JobScheduler, JobCancelled, QueueFull, BacklogFull
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def no_workers(monkeypatch):
+    """Jobs stay queued: the scheduler starts no worker threads"""
+    monkeypatch.setattr(JobScheduler, '_ensure_workers', lambda self: None)
+
+
+def test_job_runs_with_its_arguments():
+    scheduler = JobScheduler(num_workers=1)
+    calls = []
+    job = scheduler.submit('a', lambda job, *args, **kwargs: calls.append((job.job_id, args, kwargs)),
+                           'book.pdf', session_id='a')
+    wait_for(lambda: job.state == 'completed')
+    assert calls == [('a', ('book.pdf',), {'session_id': 'a'})]
+
+
+def test_failed_job_keeps_its_error():
+    scheduler = JobScheduler(num_workers=1)
+
+    def fail(job):
+        raise ValueError("bad page")
+
+    job = scheduler.submit('a', fail)
+    wait_for(lambda: job.state == 'error')
+    assert job.error == "bad page"
+
+
+def test_queue_full(no_workers):
+    scheduler = JobScheduler(num_workers=1, max_queue=2)
+    scheduler.submit('a', None)
+    scheduler.submit('b', None)
+    with pytest.raises(QueueFull):
+        scheduler.submit('c', None)
+    assert scheduler.get_job('c') is None
+
+
+def test_cancel_queued_job(no_workers):
+    scheduler = JobScheduler(num_workers=1)
+    scheduler.submit('a', None)
+    scheduler.submit('b', None)
+    assert scheduler.cancel('a')
+    assert scheduler.get_job('a').state == 'cancelled'
+    assert scheduler.queue_position('a') is None
+    assert scheduler.queue_position('b') == 1
+    assert not scheduler.cancel('a')
+    assert not scheduler.cancel('unknown')
+
+
+def test_cancel_running_job():
+    scheduler = JobScheduler(num_workers=1)
+    started = threading.Event()
+
+    def run(job):
+        started.set()
+        while True:
+            job.check_cancelled()
+            time.sleep(0.01)
+
+    job = scheduler.submit('a', run)
+    assert started.wait(5)
+    assert scheduler.cancel('a')
+    wait_for(lambda: job.state == 'cancelled')
+    with pytest.raises(JobCancelled):
+        job.check_cancelled()
+
+
+def run_order(scheduler):
+    order = []
+    while scheduler.queued_count():
+        order.append(scheduler._next_job().job_id)
+    return order
+
+
+def test_shortest_job_runs_first(no_workers):
+    scheduler = JobScheduler(num_workers=1, aging=0.0)
+    for name, pages in [('long', 100), ('short', 5), ('medium', 50)]:
+        scheduler.submit(name, None, pages=pages)
+    assert [scheduler.queue_position(name) for name in ('long', 'short', 'medium')] == [3, 1, 2]
+    assert run_order(scheduler) == ['short', 'medium', 'long']
+
+
+def test_jobs_without_pages_keep_fifo_order(no_workers):
+    scheduler = JobScheduler(num_workers=1)
+    for name in ('a', 'b', 'c'):
+        scheduler.submit(name, None)
+    assert run_order(scheduler) == ['a', 'b', 'c']
+
+
+def test_aging_lets_a_long_job_through(no_workers):
+    scheduler = JobScheduler(num_workers=1, aging=1.0)
+    scheduler.submit('long', None, pages=100)
+    scheduler.submit('short', None, pages=5)
+    assert scheduler.queue_position('long') == 2
+    # The long job has waited longer than the 95 seconds it costs over the short one
+    scheduler.get_job('long').submitted_at -= 200
+    assert scheduler.queue_position('long') == 1
+
+
+def test_backlog_budget(no_workers):
+    scheduler = JobScheduler(num_workers=1, max_backlog_pages=100, seconds_per_page=2.0)
+    scheduler.submit('fits', None, pages=80)
+    with pytest.raises(BacklogFull) as refused:
+        scheduler.submit('too much', None, pages=30)
+    # 10 pages over budget at 2 seconds a page
+    assert refused.value.retry_after == 20
+    assert scheduler.get_job('too much') is None
+    scheduler.submit('small', None, pages=20)
+
+
+def test_idle_server_accepts_any_job(no_workers):
+    scheduler = JobScheduler(num_workers=1, max_backlog_pages=100)
+    scheduler.submit('huge', None, pages=1000)
+    assert scheduler.queued_count() == 1
+
+
+def test_estimates(no_workers):
+    scheduler = JobScheduler(num_workers=2, aging=0.0, seconds_per_page=1.0)
+    scheduler.submit('first', None, pages=20)
+    scheduler.submit('second', None, pages=30)
+    first, second = scheduler.estimate('first'), scheduler.estimate('second')
+    assert first["estimated_start_seconds"] == 0.0
+    assert first["estimated_completion_seconds"] == 20.0
+    # 20 seconds of work ahead, shared by two workers
+    assert second["estimated_start_seconds"] == 10.0
+    assert second["estimated_completion_seconds"] == 40.0
+    assert scheduler.estimate('unknown') is None
+
+
+def test_record_run_updates_seconds_per_page():
+    scheduler = JobScheduler(num_workers=1, seconds_per_page=1.0, smoothing=0.5)
+    scheduler.record_run(10, 30.0)
+    assert scheduler.seconds_per_page == pytest.approx(2.0)
+    scheduler.record_run(0, 5.0)
+    assert scheduler.seconds_per_page == pytest.approx(2.0)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+from job_queue import Job
+
+
+def test_cancel_flag_from_another_worker(app_module, monkeypatch):
+    app = app_module
+    session_id = 'cancelled-elsewhere'
+    app.session_store.create_session(session_id, {"status": "queued", "stage": "queued", "progress": 0,
+                                                  "message": "Waiting for a worker..."})
+
+    def process_pdf(pdf_path, temp_dir, progress_callback=None, **kwargs):
+        # Like BookIndexerWeb.process_pdf, which re-raises everything as a plain Exception
+        try:
+            # /cancel answered by another worker process only sets the session's flag
+            app.session_store.update_status(session_id, cancel_requested=True)
+            progress_callback(10, "Processing page 1")
+        except Exception as e:
+            raise Exception(f"Error processing PDF: {e}")
+
+    monkeypatch.setattr(app.book_indexer, 'process_pdf', process_pdf)
+    cancelled = app.JOBS_TOTAL._values.get(('cancelled',), 0)
+    app.process_pdf_async(Job(session_id, None, (), {}), 'book.pdf', session_id, num_pages=1)
+
+    assert app.session_store.get_status(session_id)["status"] == 'cancelled'
+    assert app.JOBS_TOTAL._values.get(('cancelled',), 0) == cancelled + 1
+
+
+def run_job(app, monkeypatch, session_id, page_engines):
+    """Run process_pdf_async over a stand-in indexer result with the given per-page engines"""
+    app.session_store.create_session(session_id, {"status": "queued"})
+    result = {"index": [], "raw_results": [{"image": f'image_{i}.jpg', "detections": []}
+                                           for i in range(len(page_engines))],
+              "num_pages": len(page_engines), "page_engines": page_engines}
+    monkeypatch.setattr(app.book_indexer, 'process_pdf', lambda *args, **kwargs: result)
+    app.process_pdf_async(Job(session_id, None, (), {}), 'book.pdf', session_id, num_pages=len(page_engines))
+    assert app.session_store.get_status(session_id)["status"] == 'completed'
+
+
+def test_only_model_pages_feed_the_cost_estimate(app_module, monkeypatch):
+    app = app_module
+    monkeypatch.setattr(app.job_scheduler, 'seconds_per_page', 5.0)
+    run_job(app, monkeypatch, 'text-layer-book', ['text'] * 50)
+    assert app.job_scheduler.seconds_per_page == 5.0
+
+    run_job(app, monkeypatch, 'scanned-book', ['text'] * 50 + ['vision'] * 2)
+    assert app.job_scheduler.seconds_per_page < 5.0
+
+
+def test_partial_result_has_the_viewer_fields(app_module, monkeypatch):
+    app = app_module
+    session_id = 'half-done'
+    app.session_store.create_session(session_id, {"status": "queued"})
+    partial = {}
+
+    def process_pdf(pdf_path, temp_dir, progress_callback=None, page_callback=None, **kwargs):
+        page_callback({"image": 'image_0.jpg', "detections": []})
+        partial.update(app.session_store.get_result(session_id))
+        raise Exception("Error processing PDF: stopped after one page")
+
+    monkeypatch.setattr(app.book_indexer, 'process_pdf', process_pdf)
+    app.process_pdf_async(Job(session_id, None, (), {}), 'book.pdf', session_id, pdf_hash='abc', num_pages=2)
+
+    assert partial["complete"] is False and partial["pages_done"] == 1
+    assert partial["page_manifest"]["in_sink"] == '00'
+    assert partial["created_at"] and partial["book"] == 'abc'
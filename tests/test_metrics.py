@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from metrics import MetricsRegistry
+
+
+def test_counter_exposition():
+    registry = MetricsRegistry()
+    pages = registry.counter('pages_total', 'Pages processed', ['engine'])
+    pages.inc(engine='vision')
+    pages.inc(3, engine='text')
+    assert registry.render() == ('# HELP pages_total Pages processed\n'
+                                 '# TYPE pages_total counter\n'
+                                 'pages_total{engine="text"} 3\n'
+                                 'pages_total{engine="vision"} 1\n')
+    with pytest.raises(ValueError):
+        pages.inc(stage='ocr')
+
+
+def test_histogram_buckets_are_cumulative():
+    registry = MetricsRegistry()
+    seconds = registry.histogram('stage_seconds', 'Per-page stage time', ['stage'], buckets=(0.1, 1.0))
+    seconds.observe(0.05, stage='ocr')
+    seconds.observe(0.5, count=2, stage='ocr')
+    seconds.observe(5.0, stage='ocr')
+    lines = registry.render().splitlines()[2:]
+    assert lines == ['stage_seconds_bucket{stage="ocr",le="0.1"} 1',
+                     'stage_seconds_bucket{stage="ocr",le="1"} 3',
+                     'stage_seconds_bucket{stage="ocr",le="+Inf"} 4',
+                     'stage_seconds_sum{stage="ocr"} 6.05',
+                     'stage_seconds_count{stage="ocr"} 4']
+
+
+def test_gauge_function_and_registration():
+    registry = MetricsRegistry()
+    queued = registry.gauge('queue_depth', 'Jobs waiting')
+    queued.set_function(lambda: 7)
+    assert registry.render().splitlines()[-1] == 'queue_depth 7'
+    assert registry.gauge('queue_depth', 'Jobs waiting') is queued
+    with pytest.raises(ValueError):
+        registry.counter('queue_depth', 'Jobs waiting')
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from PIL import Image, ImageDraw, ImageFont
+
+from page_filter import PageFilter
+
+
+def title_page(text, size=(1700, 2200)):
+    """A chapter opener: one large line of text on an otherwise empty page"""
+    image = Image.new('RGB', size, 'white')
+    draw = ImageDraw.Draw(image)
+    draw.text((300, 500), text, fill='black', font=ImageFont.load_default(size=90))
+    return image
+
+
+def test_distinct_title_pages_are_not_duplicates():
+    page_filter = PageFilter()
+    checks = [page_filter.check(i, title_page(f'Chapter {i + 1}')) for i in range(20)]
+    assert [check.verdict for check in checks] == [None] * 20
+
+
+def test_close_hashes_need_matching_pixels():
+    page_filter = PageFilter(duplicate_bits=8)
+    first = page_filter.check(0, title_page('Chapter 3'))
+    second = page_filter.check(1, title_page('Chapter 4'))
+    assert second.verdict is None
+    # The hashes of two sparse pages are close: only the pixel comparison keeps them apart
+    distance = sum(bin(a ^ b).count('1') for a, b in zip(first.page_hash, second.page_hash))
+    assert distance <= 8
+
+
+def test_repeated_page_is_duplicate():
+    page_filter = PageFilter()
+    page_filter.check(0, title_page('Part One'))
+    page_filter.check(1, title_page('Chapter 1'))
+    check = page_filter.check(2, title_page('Part One'))
+    assert (check.verdict, check.original) == ('duplicate', 0)
+
+
+def test_blank_page():
+    assert PageFilter().check(0, Image.new('RGB', (1700, 2200), 'white')).verdict == 'blank'
+
+
+def test_kept_pixels_are_bounded():
+    page_filter = PageFilter(duplicate_bits=256, max_compared=4)
+    for i in range(10):
+        page_filter.check(i, title_page(f'Chapter {i + 1}'))
+    assert len(page_filter._pixels) == 4
+    # A recent page is still found through the pixel comparison
+    speck = title_page('Chapter 10')
+    ImageDraw.Draw(speck).rectangle([1500, 1900, 1507, 1907], fill='black')
+    assert page_filter.check(10, speck).original == 9
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import io
+
+import pytest
+from PIL import Image
+
+from page_images import WEBP_AVAILABLE, PageImageCache, encode_page, resize_page, variant_dpi
+
+
+def test_sizes_never_upscale():
+    assert variant_dpi('thumb', 200) == 24
+    assert variant_dpi('screen', 100) == 100
+    assert variant_dpi('full', 150) == 150
+
+
+def test_resize_to_a_lower_dpi():
+    page = Image.new('RGB', (1700, 2200), 'white')
+    assert resize_page(page, 200, 24).size == (204, 264)
+    assert resize_page(page, 200, 200) is page
+
+
+@pytest.mark.parametrize('image_format', ['jpeg', pytest.param('webp', marks=pytest.mark.skipif(
+    not WEBP_AVAILABLE, reason="Pillow built without WebP"))])
+def test_cached_variant_reads_back(image_format, tmp_path):
+    cache = PageImageCache(str(tmp_path))
+    assert cache.open(0, 'thumb', image_format) is None
+    cache.save(0, 'thumb', image_format, encode_page(Image.new('L', (20, 30), 128), image_format))
+    with cache.open(0, 'thumb', image_format) as f, Image.open(io.BytesIO(f.read())) as image:
+        assert image.format == image_format.upper() and image.size == (20, 30)
+    assert cache.open(0, 'screen', image_format) is None
+
+
+def test_page_endpoint_caches_variants(app_module, monkeypatch):
+    app = app_module
+    rendered = []
+
+    def render_page(pdf_path, page_number, detections=None, dpi=None):
+        rendered.append((page_number, dpi))
+        return Image.new('RGB', (int(8.5 * dpi), int(11 * dpi)), 'white')
+
+    monkeypatch.setattr(app.book_indexer, 'render_page', render_page)
+    app.session_store.create_session('viewer', {"status": "processing"})
+    app.store_result('viewer', {"index": [], "raw_results": [{"image": 'image_0.jpg', "detections": []}],
+                                "num_pages": 1}, 'book.pdf')
+    client = app.app.test_client()
+
+    response = client.get('/get-page-image/viewer/1?size=thumb', headers={'Accept': 'image/jpeg'})
+    assert response.status_code == 200 and response.mimetype == 'image/jpeg'
+    assert float(response.headers['X-Detection-Scale']) == 24 / app.book_indexer.dpi
+    assert rendered == [(1, 24)]
+    etag = response.headers['ETag']
+    assert client.get('/get-page-image/viewer/1?size=thumb', headers={
+        'Accept': 'image/jpeg', 'If-None-Match': etag}).status_code == 304
+    # Served from the session's variant cache, not rendered again
+    assert client.get('/get-page-image/viewer/1?size=thumb', headers={'Accept': 'image/jpeg'}).status_code == 200
+    assert rendered == [(1, 24)]
+    assert client.get('/get-page-image/viewer/2').status_code == 404
+    assert client.get('/get-page-image/viewer/1?size=huge').status_code == 400
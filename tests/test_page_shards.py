@@ -0,0 +1,17 @@
+# -*- coding: utf-8 -*-
+from page_shards import split_shards
+
+
+def test_shards_are_contiguous_and_balanced():
+    shards = split_shards(range(10), 3)
+    assert shards == [[0, 1, 2, 3], [4, 5, 6], [7, 8, 9]]
+
+
+def test_unsorted_pages_come_back_in_order():
+    assert split_shards([9, 2, 5, 1], 2) == [[1, 2], [5, 9]]
+
+
+def test_minimum_shard_size_limits_the_shard_count():
+    assert split_shards(range(10), 8, min_pages=4) == [[0, 1, 2, 3, 4], [5, 6, 7, 8, 9]]
+    assert split_shards(range(3), 8, min_pages=4) == [[0, 1, 2]]
+    assert split_shards([], 4) == []
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+import pytest
+from PIL import Image
+
+from page_sinks import DiskPageSink, MemoryPageSink, make_page_sink
+
+
+def test_make_page_sink(tmp_path):
+    assert make_page_sink('none') is None
+    assert make_page_sink(None) is None
+    assert isinstance(make_page_sink('disk', str(tmp_path)), DiskPageSink)
+    assert isinstance(make_page_sink('memory'), MemoryPageSink)
+    sink = MemoryPageSink()
+    assert make_page_sink(sink) is sink
+    with pytest.raises(ValueError):
+        make_page_sink('disk')
+    with pytest.raises(ValueError):
+        make_page_sink('s3')
+
+
+@pytest.mark.parametrize('kind', ['disk', 'memory'])
+def test_saved_page_reads_back(kind, tmp_path):
+    sink = make_page_sink(kind, str(tmp_path))
+    assert sink.open_page(0) is None
+    sink.save_page(0, Image.new('RGB', (30, 40), 'white'))
+    with Image.open(sink.open_page(0)) as image:
+        assert image.size == (30, 40)
+    assert sink.open_page(1) is None
+
+
+def test_export_sink_keeps_only_annotated_pages(tmp_path):
+    sink = DiskPageSink(str(tmp_path), annotated=True, clean=False)
+    sink.save_page(0, Image.new('RGB', (30, 40), 'white'))
+    sink.save_page(0, Image.new('RGB', (30, 40), 'red'), annotated=True)
+    assert sink.open_page(0) is None
+    assert sink.open_page(0, annotated=True) is not None
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+pypdf = pytest.importorskip('pypdf')
+from pdf_text_layer import PdfTextLayer
+
+BODY = "the quick brown fox jumps over the lazy dog again"
+
+
+def write_pdf(path, pages):
+    """Minimal Letter-size PDF; each page is a list of (font size, x, y, text) runs in Helvetica"""
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None,
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for runs in pages:
+        stream = "".join(f"BT /F1 {size} Tf {x} {y} Td ({text}) Tj ET\n" for size, x, y, text in runs)
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}endstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        kids.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+    data = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(data))
+        data += f"{number} 0 obj\n{body}\nendobj\n".encode('latin-1')
+    xref = len(data)
+    data += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode('latin-1')
+    data += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode('latin-1')
+    data += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode('latin-1')
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_large_lines_are_headers(tmp_path):
+    pdf_path = write_pdf(tmp_path / 'book.pdf', [
+        [(20, 72, 700, "Getting Started")] + [(11, 72, 660 - 14 * n, BODY) for n in range(5)],
+        []
+    ])
+    layer = PdfTextLayer(dpi=144)
+    info = layer.analyze(pdf_path)
+    assert info["body_size"] == 11
+    assert [page["has_text"] for page in info["pages"]] == [True, False]
+    (header,) = layer.header_detections(info["pages"][0], info["body_size"])
+    assert header["label"] == "Section-header" and header["text"] == "Getting Started"
+    # PDF points at 72 dpi -> pixels at 144 dpi, measured from the top of the page
+    assert header["bbox"][0] == 144 and header["bbox"][1] == (792 - 700 - 20) * 2
+
+
+def test_contents_entries_and_sentences_are_not_headers():
+    layer = PdfTextLayer()
+    line = {"size": 16}
+    assert layer.is_header(dict(line, text="Getting Started"), 11)
+    assert not layer.is_header(dict(line, text="Getting Started 5"), 11)
+    assert not layer.is_header(dict(line, text="This one is a sentence."), 11)
+    assert not layer.is_header(dict(line, text="12"), 11)
+    assert not layer.is_header({"size": 11, "text": "Getting Started"}, 11)
+
+
+def test_outline(tmp_path):
+    writer = pypdf.PdfWriter(clone_from=write_pdf(tmp_path / 'plain.pdf', [[], [], []]))
+    part = writer.add_outline_item("Part One", 0)
+    writer.add_outline_item("Chapter 2", 2, parent=part)
+    writer.write(tmp_path / 'outlined.pdf')
+    info = PdfTextLayer().analyze(str(tmp_path / 'outlined.pdf'))
+    assert info["outline"] == [(0, "Part One", 0), (2, "Chapter 2", 1)]
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+
+from result_cache import ResultCache
+
+
+def test_put_and_get(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10 * 1024 * 1024)
+    key = cache.make_key('pdf-hash', {"model": "a"})
+    assert key != cache.make_key('pdf-hash', {"model": "b"})
+    assert cache.get(key) is None
+
+    pages = tmp_path / 'converted'
+    pages.mkdir()
+    (pages / 'page_0.jpg').write_bytes(b'jpeg')
+    cache.put(key, {"index": [["Intro", 1]]}, [str(pages)])
+    assert cache.get(key) == {"index": [["Intro", 1]]}
+    assert os.path.isfile(os.path.join(cache.pages_dir(key), 'converted', 'page_0.jpg'))
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+    # A fresh instance finds the entry on disk
+    assert ResultCache(cache.cache_dir, cache.max_bytes).get(key) == {"index": [["Intro", 1]]}
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=2500)
+    for name in ('a', 'b'):
+        cache.put(name, {"data": name * 1000})
+    cache.get('a')
+    cache.put('c', {"data": 'c' * 1000})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+
+def test_lookups_do_not_wait_for_page_copies(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=10 * 1024 * 1024)
+    cache.put('ready', {"index": []})
+    copying = threading.Event()
+    release = threading.Event()
+
+    def slow_copytree(source, destination):
+        copying.set()
+        release.wait(5)
+        os.makedirs(destination)
+
+    monkeypatch.setattr('result_cache.shutil.copytree', slow_copytree)
+    (tmp_path / 'converted').mkdir()
+    writer = threading.Thread(target=cache.put, args=('new', {"index": []}, [str(tmp_path / 'converted')]))
+    writer.start()
+    assert copying.wait(5)
+    try:
+        assert cache.get('ready') == {"index": []}
+        assert cache.get('new') is None
+    finally:
+        release.set()
+        writer.join()
+    assert cache.get('new') == {"index": []}
+
+
+def test_disabled_cache(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache'), max_bytes=0)
+    cache.put('key', {"index": []})
+    assert cache.get('key') is None
+
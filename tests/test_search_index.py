@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from search_index import SearchIndex, tokenize
+
+
+def page(*detections):
+    return {"image": 'image.jpg', "detections": list(detections)}
+
+
+BOOK = [
+    page({"label": "Section-header", "bbox": [10, 10, 200, 40], "text": "Neural Networks"}),
+    page({"label": "Text", "bbox": [10, 60, 400, 200], "text": "Networks learn. Networks generalize.",
+          "words": [["Networks", 10, 60, 80, 75], ["learn.", 85, 60, 130, 75],
+                    ["Networks", 10, 80, 80, 95], ["generalize.", 85, 80, 170, 95]]}),
+    page()
+]
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = SearchIndex(str(tmp_path / 'search.db'))
+    index.index_book('book-a', 'a.pdf', BOOK)
+    index.index_book('book-b', 'b.pdf', [page({"label": "Title", "bbox": [0, 0, 9, 9], "text": "Networking"})])
+    return index
+
+
+def test_tokenize():
+    assert tokenize("Deep-Learning, (2nd) édition") == ['deep', 'learning', '2nd', 'édition']
+
+
+def test_pages_with_every_term_most_hits_first(index):
+    response = index.search('networks')
+    assert [(r["book"], r["page"], r["hits"]) for r in response["results"]] == [('book-a', 2, 2), ('book-a', 1, 1)]
+    # Word boxes for full-text pages, the detection's box for the others
+    assert response["results"][0]["bboxes"] == [[10, 60, 80, 75], [10, 80, 80, 95]]
+    assert response["results"][1]["bboxes"] == [[10, 10, 200, 40]]
+    assert [r["page"] for r in index.search('networks learn')["results"]] == [2]
+    assert index.search('networks unknown')["total"] == 0
+
+
+def test_prefix_and_book_filter(index):
+    assert {r["book"] for r in index.search('network*')["results"]} == {'book-a', 'book-b'}
+    assert [r["book"] for r in index.search('network*', book_hash='book-b')["results"]] == ['book-b']
+    assert index.search('network*', book_hash='missing')["total"] == 0
+    # Too short to be a prefix: an exact match on "ne"
+    assert index.search('ne*')["total"] == 0
+
+
+def test_reindexing_replaces_a_book(index):
+    index.index_book('book-a', 'a.pdf', [page({"label": "Title", "bbox": [0, 0, 9, 9], "text": "Graphs"})])
+    assert index.search('neural')["total"] == 0
+    assert index.search('graphs')["results"][0]["filename"] == 'a.pdf'
+    assert index.stats() == {"books": 2, "postings": 2}
+    assert index.has_book('book-a') and not index.has_book('book-c')
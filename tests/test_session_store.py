@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import time
+
+import pytest
+
+from detection_table import DetectionTable
+from session_store import make_session_store, SessionSweeper
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    url = 'memory' if request.param == 'memory' else f'sqlite:///{tmp_path / "sessions.db"}'
+    return make_session_store(url, ttl_seconds=60)
+
+
+def test_session_lifecycle(store):
+    store.create_session('s1', {"status": "queued", "progress": 0}, upload_path='/tmp/s1.pdf', temp_dir='/tmp/s1')
+    store.update_status('s1', status='processing', progress=40)
+    assert store.get_status('s1') == {"status": "processing", "progress": 40}
+    assert not store.has_result('s1')
+
+    store.set_result('s1', {"index": [["Intro", 1]]})
+    assert store.get_result('s1') == {"index": [["Intro", 1]]}
+    table = DetectionTable.from_raw_results([{"image": "image_0.jpg", "detections": [], "skipped": "blank"}],
+                                            ["Text"])
+    store.set_detections('s1', table)
+    assert store.get_detections('s1').to_raw_results() == table.to_raw_results()
+    assert store.count_sessions() == 1
+
+    info = store.delete_session('s1')
+    assert (info["upload_path"], info["temp_dir"]) == ('/tmp/s1.pdf', '/tmp/s1')
+    assert store.get_status('s1') is None
+    assert store.delete_session('s1') is None
+
+
+def test_expiry(store):
+    store.create_session('old', {"status": "completed"})
+    store.create_session('new', {"status": "queued"})
+    assert store.pop_expired(now=time.time() + 30) == []
+    expired = store.pop_expired(now=time.time() + 120)
+    assert sorted(info["session_id"] for info in expired) == ['new', 'old']
+    assert store.count_sessions() == 0
+
+
+def test_sweeper_hands_expired_sessions_to_cleanup(store):
+    store.ttl_seconds = 0
+    store.create_session('s1', {"status": "completed"}, upload_path='/tmp/s1.pdf')
+    cleaned = []
+    time.sleep(0.01)
+    assert SessionSweeper(store, lambda info: cleaned.append(info["session_id"])).sweep() == 1
+    assert cleaned == ['s1']
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import hashlib
+
+import pytest
+
+# The app imports the indexer, which needs Tesseract's bindings
+pytest.importorskip('pytesseract')
+
+from job_queue import BacklogFull, QueueFull
+
+
+@pytest.fixture
+def app_module_ready(app_module, monkeypatch):
+    """The app with a ready model and a scheduler whose submit() is scripted by the test"""
+    monkeypatch.setitem(app_module.worker_state, 'state', 'ready')
+    monkeypatch.setattr(app_module.book_indexer, 'can_process', lambda: True)
+    monkeypatch.setattr(app_module.book_indexer, 'get_page_count', lambda pdf_path: 3)
+    submitted = []
+    refusals = []
+
+    def submit(job_id, func, *args, pages=0, **kwargs):
+        if refusals:
+            raise refusals.pop(0)
+        with open(args[0], 'rb') as f:
+            submitted.append((job_id, pages, f.read()))
+
+    monkeypatch.setattr(app_module.job_scheduler, 'submit', submit)
+    return app_module, submitted, refusals
+
+
+def pdf_bytes(tag):
+    return b'%PDF-1.4\n' + tag.encode() * 1000 + b'\n%%EOF\n'
+
+
+def start_upload(client, data):
+    response = client.post('/uploads', json={'filename': 'book.pdf', 'size': len(data)})
+    assert response.status_code == 201
+    return response.get_json()["upload_id"]
+
+
+def put(client, upload_id, offset, data):
+    return client.put(f'/uploads/{upload_id}?offset={offset}', data=data,
+                      headers={'X-Chunk-SHA256': hashlib.sha256(data).hexdigest()})
+
+
+def test_complete_refused_then_retried(app_module_ready):
+    app, submitted, refusals = app_module_ready
+    client = app.app.test_client()
+    data = pdf_bytes('backlog')
+    upload_id = start_upload(client, data)
+
+    refusals.append(BacklogFull('busy', 7))
+    response = put(client, upload_id, 0, data)
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '7'
+    assert client.get(f'/uploads/{upload_id}').get_json()["complete"]
+
+    refusals.append(QueueFull('full'))
+    assert client.post(f'/uploads/{upload_id}/complete').status_code == 503
+
+    response = client.post(f'/uploads/{upload_id}/complete')
+    assert response.status_code == 200
+    assert response.get_json()["session_id"] == submitted[0][0]
+    assert submitted[0][1:] == (3, data)
+    assert client.get(f'/uploads/{upload_id}').status_code == 404
+
+
+def test_complete_while_model_loads(app_module_ready, monkeypatch):
+    app, submitted, refusals = app_module_ready
+    client = app.app.test_client()
+    data = pdf_bytes('loading')
+    upload_id = start_upload(client, data)
+
+    monkeypatch.setitem(app.worker_state, 'state', 'loading')
+    assert put(client, upload_id, 0, data).status_code == 503
+    monkeypatch.setitem(app.worker_state, 'state', 'ready')
+    assert client.post(f'/uploads/{upload_id}/complete').status_code == 200
+    assert len(submitted) == 1
+
+
+def test_resume_offset(app_module_ready):
+    app, submitted, refusals = app_module_ready
+    client = app.app.test_client()
+    data = pdf_bytes('resume')
+    upload_id = start_upload(client, data)
+
+    assert put(client, upload_id, 0, data[:100]).get_json()["offset"] == 100
+    response = put(client, upload_id, 0, data[:100])
+    assert response.status_code == 409
+    assert response.get_json()["offset"] == 100
+    response = client.put(f'/uploads/{upload_id}?offset=100', data=data[100:], headers={'X-Chunk-SHA256': '00'})
+    assert response.status_code == 400
+    assert response.get_json()["offset"] == 100
+    assert put(client, upload_id, 100, data[100:]).status_code == 200
+    assert len(submitted) == 1
+
+
+def test_unknown_upload(app_module_ready):
+    app, submitted, refusals = app_module_ready
+    client = app.app.test_client()
+    assert put(client, '0' * 32, 0, b'data').status_code == 404
+    assert client.post(f'/uploads/{"0" * 32}/complete').status_code == 404
+    assert client.get(f'/uploads/{"0" * 32}').status_code == 404
+
+
+def test_oversized_request_points_at_chunked_uploads(app_module):
+    client = app_module.app.test_client()
+    response = client.post('/upload', data=b'x' * (app_module.app.config['MAX_CONTENT_LENGTH'] + 1),
+                           content_type='application/pdf')
+    assert response.status_code == 413
+    assert '/uploads' in response.get_json()['error']
+    assert response.get_json()['max_upload_bytes'] == app_module.app.config['MAX_UPLOAD_BYTES']